@@ -0,0 +1,10 @@
+"""Benchmarks for the CM&A Quiz Generator
+
+    synthDatabase -- synthetic question databases, 1k to 1M rows
+    run           -- per-phase timings and peak memory at each scale,
+                     compared against baseline.json
+    importTime    -- import-time budget of the modules
+
+Run them from the repository root, e.g.:
+    python -m benchmarks.run --compare benchmarks/baseline.json
+"""
@@ -0,0 +1,93 @@
+"""Import-time budget of the quiz generator modules
+
+Each module is imported in a fresh interpreter (so nothing is cached in
+sys.modules), several times, and the median is compared to its budget.
+The budgets include pandas and numpy, which the generator needs; the
+optional dependencies (python-docx, IPython, ...) must not be imported.
+
+Usage:
+    python -m benchmarks.importTime [--repeat N] [--detail]
+
+Exits with status 1 if a module is over its budget or imports one of the
+optional dependencies.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+# median import time budget of each module (seconds)
+BUDGETS={'quizGenerator':0.6,
+         'quizWriter':0.05,
+         'packetSolver':0.6,
+         'quizBatch':0.6,
+         'quizServer':0.6}
+
+# modules that must only be imported when the feature using them is
+FORBIDDEN=('docx','IPython','xlrd','lxml','openpyxl','scipy')
+
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE='''
+import sys,time,json
+t=time.perf_counter()
+import %s
+dt=time.perf_counter()-t
+print(json.dumps({'time':dt,'modules':sorted(set(m.split('.')[0] for m in sys.modules))}))
+'''
+
+def importTime(module,repeat=5):
+    """time the import of a module in fresh interpreters
+
+    Returns:
+        times (list): import times (seconds)
+        modules (list): top-level modules loaded by the import
+    """
+    env=dict(os.environ)
+    env['PYTHONPATH']=ROOT+os.pathsep+env.get('PYTHONPATH','')
+    times=[];modules=[]
+    for r in range(repeat):
+        out=subprocess.run([sys.executable,'-c',_PROBE%module],env=env,cwd=ROOT,
+                           capture_output=True,text=True,check=True)
+        res=json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(res['time'])
+        modules=res['modules']
+    return times,modules
+
+def importDetail(module,top=15):
+    """the slowest imports (cumulative) under python -X importtime"""
+    env=dict(os.environ)
+    env['PYTHONPATH']=ROOT+os.pathsep+env.get('PYTHONPATH','')
+    out=subprocess.run([sys.executable,'-X','importtime','-c','import %s'%module],env=env,cwd=ROOT,
+                       capture_output=True,text=True,check=True)
+    rows=[]
+    for line in out.stderr.splitlines():
+        if(not line.startswith('import time:') or 'cumulative' in line):
+            continue
+        self_us,cum_us,name=[x.strip() for x in line[len('import time:'):].split('|')]
+        rows.append((int(cum_us),name))
+    return sorted(rows,reverse=True)[:top]
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Check the import time of the generator modules.')
+    parser.add_argument('--repeat',type=int,default=5,help='imports per module (default: 5)')
+    parser.add_argument('--detail',action='store_true',help='show the slowest imports of each module')
+    args=parser.parse_args(argv)
+    status=0
+    for module,budget in BUDGETS.items():
+        times,modules=importTime(module,repeat=args.repeat)
+        med=statistics.median(times)
+        bad=[m for m in FORBIDDEN if m in modules]
+        ok=(med<=budget and not bad)
+        status=status or (0 if ok else 1)
+        print('%-14s %7.3fs (budget %.3fs) %s%s'%(module,med,budget,'ok' if ok else 'OVER',
+                                                 ('  imports: %s'%', '.join(bad)) if bad else ''))
+        if(args.detail):
+            for cum,name in importDetail(module):
+                print('    %8.3fs  %s'%(cum/1e6,name))
+    return status
+
+if(__name__=='__main__'):
+    sys.exit(main())
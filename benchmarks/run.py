@@ -0,0 +1,242 @@
+"""End-to-end benchmarks of the CM&A Quiz Generator
+
+Times each phase of a packet at each database scale, with the peak
+memory allocated during the phase (tracemalloc):
+
+    loadDatabase cold   -- Excel parse and preparation (small scales)
+    loadDatabase warm   -- from the prepared-database cache
+    setDatabase         -- preparation of an in-memory database
+    _getContent         -- content pools of the quiz makeup
+    generateQuizTables  -- the quizzes and extras
+    QuizWriter.save     -- the Word document
+    QuizWriter.saveStream -- the packet again, each quiz written as it
+                           is generated (generation and writing)
+
+The databases are synthetic (see synthDatabase), so the results can be
+compared between machines and commits.  Excel files are only written up
+to --excel-max-rows rows (writing them takes far longer than anything
+measured); larger scales skip the loadDatabase phases.
+
+Usage:
+    python -m benchmarks.run                          # all scales
+    python -m benchmarks.run --scales 1000 10000 --compare benchmarks/baseline.json
+    python -m benchmarks.run --save benchmarks/baseline.json
+
+The phases are timed without memory tracing, then run again under
+tracemalloc for the peaks; --no-memory skips the second run.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import quizGenerator
+import quizWriter
+from benchmarks.synthDatabase import makeDatabase, contentRange
+
+SCALES=(1000,10000,100000,1000000)
+EXCEL_MAX_ROWS=20000
+
+PHASES=('loadDatabase cold','loadDatabase warm','setDatabase','_getContent',
+        'generateQuizTables','QuizWriter.save','QuizWriter.saveStream')
+
+# a phase slower than this times its baseline is a regression (unless
+# it is within MIN_DIFF seconds of the baseline: timer noise)
+TOLERANCE=1.5
+MIN_DIFF=0.05
+
+def _phase(results,name,fn,memory=True):
+    """run one phase, recording its time (seconds) and peak memory (bytes)"""
+    gc.collect()
+    if(memory):
+        tracemalloc.reset_peak()
+        base=tracemalloc.get_traced_memory()[0]
+    t=time.perf_counter()
+    out=fn()
+    dt=time.perf_counter()-t
+    results[name]={'time':dt}
+    if(memory):
+        results[name]['peak']=tracemalloc.get_traced_memory()[1]-base
+    return out
+
+def _generator(df):
+    """a generator set up for a packet over a synthetic database: the
+    first book is the current period, the whole database the past"""
+    QG=quizGenerator.QuizGenerator(quizType='epistle')
+    QG.quizMakeup={'current':{'frac':0.5,'content':['B1 1-B1 %d'%df.loc[df['BOOK']=='B1','CHAPTER'].max()]},
+                   'past':{'frac':0.5,'content':[contentRange(df)]}}
+    QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+    return QG
+
+def _runPhases(df,nquiz,xtra,engine,seed,memory,excelMaxRows,workdir):
+    """run the phases of a packet over a database (see runScale)"""
+    nrows=len(df)
+    results={}
+    if(memory):
+        tracemalloc.start()
+    try:
+        if(nrows<=excelMaxRows):
+            fn=os.path.join(workdir,'synth_%d.xlsx'%nrows)
+            if(not os.path.exists(fn)):
+                df.to_excel(fn,index=False)
+            cachedir=os.path.join(workdir,'cache')
+            shutil.rmtree(cachedir,ignore_errors=True)
+            QG=_generator(df)
+            _phase(results,'loadDatabase cold',lambda: QG.loadDatabase(fn,cachedir=cachedir),memory)
+            QG=_generator(df)
+            _phase(results,'loadDatabase warm',lambda: QG.loadDatabase(fn,cachedir=cachedir),memory)
+        QG=_generator(df)
+        _phase(results,'setDatabase',lambda: QG.setDatabase(quizGenerator._prepareDatabase(df.copy())),memory)
+        QG.engine=engine
+        quizGenerator.clearContentCache()
+        _phase(results,'_getContent',QG._getContent,memory)
+        qdat=_phase(results,'generateQuizTables',
+                    lambda: QG.generateQuizTables(nquiz=nquiz,xtra=xtra,seed=seed),memory)
+        fnout=os.path.join(workdir,'synth_%d.docx'%nrows)
+        _phase(results,'QuizWriter.save',
+               lambda: quizWriter.QuizWriter().save(fnout,qdat,title='Benchmark %d'%nrows),memory)
+        _phase(results,'QuizWriter.saveStream',
+               lambda: quizWriter.QuizWriter().saveStream(fnout,QG,nquiz=nquiz,xtra=xtra,seed=seed,
+                                                          title='Benchmark %d'%nrows),memory)
+    finally:
+        if(memory):
+            tracemalloc.stop()
+    return results
+
+def runScale(nrows,nquiz=10,xtra=10,engine='array',seed=1,memory=True,
+             excelMaxRows=EXCEL_MAX_ROWS,workdir=None):
+    """Benchmark every phase at one database size.
+
+    The phases are timed untraced; with memory, they are run a second 
+    time under tracemalloc for the peaks.
+
+    Args:
+        nrows (int): questions in the database
+        nquiz (int): quizzes in the packet
+        xtra (int): extra questions per type
+        engine (string): generator engine
+        seed (int): database and packet seed
+        memory (bool): record the peak memory of each phase
+        excelMaxRows (int): largest database written to Excel (and
+            timed through loadDatabase)
+        workdir (string): directory for the database and packet
+    Returns:
+        dict: phase -> {'time': seconds, 'peak': bytes}
+    """
+    df=makeDatabase(nrows,seed=seed)
+    args=(df,nquiz,xtra,engine,seed)
+    results=_runPhases(*args,memory=False,excelMaxRows=excelMaxRows,workdir=workdir)
+    if(memory):
+        peaks=_runPhases(*args,memory=True,excelMaxRows=excelMaxRows,workdir=workdir)
+        for phase,r in results.items():
+            r['peak']=peaks[phase]['peak']
+    return results
+
+def runBenchmarks(scales=SCALES,**kwargs):
+    """Benchmark every scale (see runScale for the options).
+
+    Returns:
+        dict: the environment, settings and results by scale
+    """
+    workdir=kwargs.pop('workdir',None)
+    tmp=None
+    if(workdir is None):
+        workdir=tmp=tempfile.mkdtemp(prefix='quizgen_bench_')
+    try:
+        results={}
+        for n in scales:
+            t=time.perf_counter()
+            results[str(n)]=runScale(n,workdir=workdir,**kwargs)
+            print('benchmark: %d rows in %.1fs'%(n,time.perf_counter()-t),file=sys.stderr)
+    finally:
+        if(tmp):
+            shutil.rmtree(tmp,ignore_errors=True)
+    return {'date':time.strftime('%Y-%m-%d'),
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'numpy':np.__version__,
+            'pandas':pd.__version__,
+            'settings':dict(kwargs),
+            'results':results}
+
+def compare(report,baseline,tolerance=TOLERANCE):
+    """Compare a report with a baseline report.
+
+    Returns:
+        rows (list): (scale, phase, time, baseline time, ratio, peak,
+            baseline peak) of the phases in both
+        regressions (list): the rows slower than tolerance x baseline
+    """
+    rows=[];regressions=[]
+    for scale,phases in report['results'].items():
+        base=baseline['results'].get(scale,{})
+        for phase in PHASES:
+            if(phase not in phases or phase not in base):
+                continue
+            r=phases[phase];b=base[phase]
+            ratio=r['time']/max(b['time'],1e-9)
+            row=(scale,phase,r['time'],b['time'],ratio,r.get('peak'),b.get('peak'))
+            rows.append(row)
+            if(ratio>tolerance and r['time']-b['time']>MIN_DIFF):
+                regressions.append(row)
+    return rows,regressions
+
+def _mb(x):
+    return '' if x is None else '%.1fMB'%(x/2**20)
+
+def printReport(report,baseline=None,tolerance=TOLERANCE):
+    if(baseline is None):
+        for scale,phases in report['results'].items():
+            for phase in PHASES:
+                if(phase in phases):
+                    r=phases[phase]
+                    print('%8s  %-21s %9.3fs %10s'%(scale,phase,r['time'],_mb(r.get('peak'))))
+        return []
+    rows,regressions=compare(report,baseline,tolerance)
+    print('%8s  %-21s %10s %10s %6s %10s %10s'%('rows','phase','time','baseline','ratio','peak','baseline'))
+    for row in rows:
+        scale,phase,t,bt,ratio,pk,bpk=row
+        print('%8s  %-21s %9.3fs %9.3fs %5.2fx %10s %10s%s'%(scale,phase,t,bt,ratio,_mb(pk),_mb(bpk),
+                                                           '  SLOWER' if row in regressions else ''))
+    return regressions
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                   description='Benchmark the quiz generator phases on synthetic databases.')
+    parser.add_argument('--scales',type=int,nargs='+',default=list(SCALES),help='database sizes (rows)')
+    parser.add_argument('--nquiz',type=int,default=10)
+    parser.add_argument('--xtra',type=int,default=10)
+    parser.add_argument('--engine',choices=('pandas','array'),default='array')
+    parser.add_argument('--seed',type=int,default=1)
+    parser.add_argument('--no-memory',action='store_true',help="don't trace memory")
+    parser.add_argument('--excel-max-rows',type=int,default=EXCEL_MAX_ROWS)
+    parser.add_argument('--save',help='write the results (JSON) here, e.g. a new baseline')
+    parser.add_argument('--compare',help='baseline results (JSON) to compare with')
+    parser.add_argument('--tolerance',type=float,default=TOLERANCE,
+                        help='slowdown vs the baseline counted as a regression (default: %.1f)'%TOLERANCE)
+    args=parser.parse_args(argv)
+    quizGenerator.configureLogging(level=quizGenerator.logging.ERROR)
+
+    report=runBenchmarks(args.scales,nquiz=args.nquiz,xtra=args.xtra,engine=args.engine,
+                         seed=args.seed,memory=not args.no_memory,excelMaxRows=args.excel_max_rows)
+    if(args.save):
+        with open(args.save,'w') as f:
+            json.dump(report,f,indent=1)
+    baseline=None
+    if(args.compare):
+        with open(args.compare) as f:
+            baseline=json.load(f)
+    regressions=printReport(report,baseline,args.tolerance)
+    return 1 if regressions else 0
+
+if(__name__=='__main__'):
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Synthetic question databases
+
+Builds databases in the shape of the CQLT spreadsheets (BOOK, CHAPTER,
+VERSE, TYPE, QUESTION, ANSWER, QKEYWORDS, AKEYWORDS, CLUB, SET), so the
+generator can be benchmarked at any size without the real databases:
+
+    df=makeDatabase(100000,questionsPerVerse=3,seed=1)
+    QG.setDatabase(quizGenerator._prepareDatabase(df))
+
+or written to Excel for loadDatabase:
+    python -m benchmarks.synthDatabase synth_10k.xlsx --rows 10000
+
+Books are named B1, B2, ..., so content can be given as reference
+strings (e.g. 'B1 1-B3 20').
+"""
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# question types and their share of the questions (roughly the mix of
+# the CQLT databases)
+TYPE_MIX={'INT':0.42,
+          'CR':0.05,'CVR':0.05,'CVRMA':0.02,'CRMA':0.02,
+          'FT':0.06,'F2V':0.04,'FTV':0.03,'FTN':0.02,
+          'MA':0.11,
+          'Q':0.06,'Q2':0.03,
+          'SIT':0.09}
+# share of the verses that are key verses of each club (the rest have
+# no club)
+CLUBS={150:0.08,300:0.08}
+# share of the questions in each set
+SETS={'Local':0.5,'District':0.3,'Nationals':0.2}
+
+# words the questions and answers are made of
+VOCABULARY=2000
+
+def _weights(mix):
+    keys=list(mix.keys())
+    p=np.array([mix[k] for k in keys],dtype=float)
+    return keys,p/p.sum()
+
+def _text(words,lengths,sep=' '):
+    """one string per row from runs of vocabulary words"""
+    vocab=['w%04d'%i for i in range(VOCABULARY)]
+    words=[vocab[w] for w in words.tolist()]
+    ends=np.cumsum(lengths).tolist()
+    starts=[0]+ends[:-1]
+    return [sep.join(words[s:e]) for s,e in zip(starts,ends)]
+
+def _keywords(words,lengths,density,rng):
+    """comma-separated keywords of each row: about density of its words
+    (at least one, the first word if none was drawn)"""
+    keep=rng.random(len(words))<density
+    starts=np.cumsum(lengths)-lengths
+    none=np.add.reduceat(keep,starts)==0
+    keep[starts[none]]=True
+    return _text(words[keep],np.add.reduceat(keep,starts),sep=',')
+
+def makeDatabase(nrows=1000,books=None,chapters=20,verses=(15,40),questionsPerVerse=3.,
+                 typeMix=None,clubs=None,sets=None,keywordDensity=0.25,
+                 questionWords=(6,16),answerWords=(1,8),seed=0):
+    """A synthetic question database.
+
+    Args:
+        nrows (int): number of questions
+        books (int): number of books (default: as many as needed with
+            the given chapters per book)
+        chapters (int): chapters per book (ignored if books is given)
+        verses (tuple): min/max verses per chapter
+        questionsPerVerse (float): mean questions per verse (at least 1)
+        typeMix (dict): TYPE -> share of the questions (default: TYPE_MIX)
+        clubs (dict): CLUB -> share of the verses (default: CLUBS)
+        sets (dict): SET -> share of the questions (default: SETS)
+        keywordDensity (float): share of the question/answer words that
+            are keywords
+        questionWords (tuple): min/max words per question
+        answerWords (tuple): min/max words per answer
+        seed (int): random seed
+    Returns:
+        DataFrame: the database, as read from the spreadsheet
+    """
+    rng=np.random.default_rng(seed)
+    typeMix=TYPE_MIX if typeMix is None else typeMix
+    clubs=CLUBS if clubs is None else clubs
+    sets=SETS if sets is None else sets
+
+    # verses: chapters of random length until there are enough
+    nverse=int(min(nrows,max(1,round(nrows/max(questionsPerVerse,1.)))))
+    vpc=rng.integers(verses[0],verses[1]+1,size=nverse//verses[0]+1)
+    nchap=int(np.searchsorted(np.cumsum(vpc),nverse)+1)
+    vpc=vpc[:nchap]
+    vpc[-1]-=int(vpc.sum()-nverse)
+    if(books is None):
+        books=-(-nchap//chapters)
+    else:
+        chapters=-(-nchap//books)
+    chap=np.arange(nchap)
+    vbook=np.repeat(chap//chapters,vpc)+1
+    vchap=np.repeat(chap%chapters,vpc)+1
+    vverse=np.arange(nverse)-np.repeat(np.cumsum(vpc)-vpc,vpc)+1
+
+    # key verses
+    mix=dict(clubs)
+    mix[None]=max(0.,1.-sum(clubs.values()))
+    ckeys,cp=_weights(mix)
+    vclub=np.array([np.nan if c is None else float(c) for c in ckeys])[rng.choice(len(ckeys),size=nverse,p=cp)]
+
+    # questions: at least one per verse, the rest spread at random
+    counts=1+rng.multinomial(nrows-nverse,np.full(nverse,1./nverse))
+    vrow=np.repeat(np.arange(nverse),counts)
+    tkeys,tp=_weights(typeMix)
+    skeys,sp=_weights(sets)
+
+    qlen=rng.integers(questionWords[0],questionWords[1]+1,size=nrows)
+    alen=rng.integers(answerWords[0],answerWords[1]+1,size=nrows)
+    qwords=rng.integers(0,VOCABULARY,size=int(qlen.sum()))
+    awords=rng.integers(0,VOCABULARY,size=int(alen.sum()))
+
+    return pd.DataFrame({'BOOK':np.char.add('B',vbook[vrow].astype(str)).astype(object),
+                         'CHAPTER':vchap[vrow],
+                         'VERSE':vverse[vrow],
+                         'TYPE':np.array(tkeys,dtype=object)[rng.choice(len(tkeys),size=nrows,p=tp)],
+                         'QUESTION':_text(qwords,qlen),
+                         'ANSWER':_text(awords,alen),
+                         'QKEYWORDS':_keywords(qwords,qlen,keywordDensity,rng),
+                         'AKEYWORDS':_keywords(awords,alen,keywordDensity,rng),
+                         'CLUB':vclub[vrow],
+                         'SET':np.array(skeys,dtype=object)[rng.choice(len(skeys),size=nrows,p=sp)]})
+
+def contentRange(df):
+    """reference string covering a whole synthetic database"""
+    last=df.iloc[-1]
+    return 'B1 1-%s %d'%(last['BOOK'],last['CHAPTER'])
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(prog='python -m benchmarks.synthDatabase',
+                                   description='Write a synthetic question database (Excel).')
+    parser.add_argument('out',help='output .xlsx')
+    parser.add_argument('--rows',type=int,default=1000)
+    parser.add_argument('--books',type=int,default=None)
+    parser.add_argument('--chapters',type=int,default=20,help='chapters per book')
+    parser.add_argument('--questions-per-verse',type=float,default=3.)
+    parser.add_argument('--keyword-density',type=float,default=0.25)
+    parser.add_argument('--seed',type=int,default=0)
+    args=parser.parse_args(argv)
+    if(args.rows>1048575):
+        raise SystemExit('Excel sheets hold at most 1048575 rows')
+    df=makeDatabase(args.rows,books=args.books,chapters=args.chapters,
+                    questionsPerVerse=args.questions_per_verse,
+                    keywordDensity=args.keyword_density,seed=args.seed)
+    df.to_excel(args.out,index=False)
+    print('%s: %d questions, %d books'%(args.out,len(df),df['BOOK'].nunique()))
+    return 0
+
+if(__name__=='__main__'):
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Packet solver for the CM&A Quiz Generator
+
+The default generator fills quizzes one after another, so the early
+quizzes take the best questions and the later quizzes soak up the
+repeats.  The packet solver treats the whole packet as one assignment
+problem over the per-type content pools:
+
+    1. composition -- for every quiz, decide how many questions of each
+       type come from each period, respecting the min/max ranges and the
+       period fractions.  Each question goes to the period/type pool with
+       the lowest pressure (demand so far / pool size), so demand is
+       spread in proportion to what each pool can supply.
+    2. assignment -- fill the quiz slots round-robin across the quizzes
+       (all 1-20 slots first, then 16AB-20AB, then overtime), each slot
+       taking the least-used question of its pool among those that don't
+       share a verse with the quiz (so are not in it either).  If none is
+       left, the slot takes another type of the same period, within the
+       distribution.  Unavoidable repeats are spread evenly over the
+       quizzes and pushed toward the alternate questions.
+
+The solver also reports a lower bound on the repeats of any packet with
+the same number of questions from each period (see lowerBound); the
+packet is reported optimal only if it meets the bound.
+
+Typical usage:
+    QG.solver='packet'
+    QG.generateQuizTables(nquiz=50,xtra=10)
+    QG.solverReport
+"""
+import numpy as np
+import logging
+
+from quizGenerator import QuizArrays, QuizGenerationError
+
+logger = logging.getLogger('quiz_generator')
+
+def _pressure(load,cap):
+    """demand per question of each pool if one more question is drawn"""
+    with np.errstate(divide='ignore'):
+        return np.where(cap>0,(load+1)/np.maximum(cap,1),np.inf)
+
+def _composeQuiz(QG,sizes,cap,load,mins,maxs,overtime,rng):
+    """decide the (block, period, type) of each question of one quiz
+
+    Returns:
+        units (list): (block, period index, category code), grouped by
+            block (0: 1-20, 1: 16AB-20AB, 2: overtime)
+    """
+    keys=list(QG.quizDistribution.keys())
+    ncat=len(mins)
+    counts=np.zeros(ncat,dtype=np.int64)
+    noise=lambda shape: 1+0.25*rng.random(shape)
+    free=np.array([[sz[block] for sz in sizes] for block in (0,1)],dtype=np.int64)
+    # the minimums are met in questions 1-20, or over the whole quiz for 
+    # custom quizzes
+    minBlocks=[0,1] if QG.quizType=='custom' else [0]
+    units=[]
+    # (one of each type at a time, so if the minimums don't fit in the 
+    # quiz, they are cut evenly)
+    for m in range(int(mins.max(initial=0))):
+        for k in rng.permutation(ncat):
+            room=free[minBlocks].sum(axis=0)
+            if(m>=mins[k] or room.sum()==0):
+                continue
+            pr=np.where(room>0,_pressure(load[:,k],cap[:,k]),np.inf)*noise(len(room))
+            ip=int(np.argmin(pr))
+            if(not np.isfinite(pr[ip])):
+                raise QuizGenerationError('cannot place the %s minimum: no %s questions in the '
+                                          'periods with room left'%(keys[k],keys[k]))
+            block=minBlocks[int(np.argmax(free[minBlocks,ip]>0))]
+            free[block,ip]-=1;load[ip,k]+=1;counts[k]+=1
+            units.append((block,ip,k))
+    if(np.any(counts<mins)):
+        logger.warning('the distribution minimums (%d questions) do not fit in the quiz',int(mins.sum()))
+    # fill the rest of each block
+    for block in (0,1):
+        while(free[block].sum()>0):
+            pr=_pressure(load,cap)*noise(load.shape)
+            pr[free[block]<=0,:]=np.inf
+            pr[:,counts>=maxs]=np.inf
+            ip,k=np.unravel_index(np.argmin(pr),pr.shape)
+            if(not np.isfinite(pr[ip,k])):
+                raise QuizGenerationError('cannot fill the quiz: no question type with room left in '
+                                          'the distribution has questions in the periods with room left')
+            free[block,ip]-=1;load[ip,k]+=1;counts[k]+=1
+            units.append((block,ip,k))
+    units.sort(key=lambda u: u[0])
+
+    # overtime: 3 different types, periods drawn by fraction
+    if(overtime):
+        frac=np.array([v['frac'] for v in QG.quizMakeup.values()])
+        taken=np.zeros(ncat,dtype=bool)
+        for ip in rng.choice(len(frac),size=3,p=frac/frac.sum()):
+            pr=_pressure(load[ip],cap[ip])*noise(ncat)
+            pr[taken]=np.inf
+            k=int(np.argmin(pr))
+            if(not np.isfinite(pr[k])):
+                continue
+            taken[k]=True;load[ip,k]+=1
+            units.append((2,ip,k))
+    return units
+
+def _otherType(QG,quiz,cp,block,k,comp,overtimeTypes,mins,maxs,rng):
+    """a type to use instead of k for a slot of the quiz when every k 
+    question of the period shares a verse with the quiz: one with such a 
+    question, room before its maximum, and without breaking k's minimum 
+    (or, in overtime, not already in the quiz's overtime)
+
+    Returns:
+        k2 (int), candidates (array): positions in the period's pool
+    """
+    keys=list(QG.quizDistribution.keys())
+    minBlocks=[0,1] if QG.quizType=='custom' else [0]
+    if(block<2 and block in minBlocks and comp[minBlocks,k].sum()<=mins[k]):
+        return None,None
+    for k2 in rng.permutation(len(keys)):
+        if(k2==k): continue
+        if(block<2 and comp[:,k2].sum()>=maxs[k2]): continue
+        if(block==2 and k2 in overtimeTypes): continue
+        pool=cp['pools'][keys[k2]]
+        cand=pool[~quiz.verseUsed[cp['vid'][pool]]]
+        if(len(cand)):
+            return k2,cand
+    return None,None
+
+def lowerBound(QG,nquiz,units,nquestion=30):
+    """lower bound on the repeats of any packet of nquiz quizzes with the 
+    same 1-20 and 16AB-20AB questions from each period (these are fixed 
+    by the period fractions) and the same number of overtime questions, 
+    from any period
+
+    Within a period, the 1-20 and 16AB-20AB picks beyond the period's 
+    distinct questions must be repeats, and so must the overtime picks 
+    beyond the questions the periods have left; likewise, when the 
+    minimums fit in the quiz, for the minimum of each type over all 
+    periods.
+    """
+    periods=list(QG.quizMakeup.keys())
+    keys=list(QG.quizDistribution.keys())
+    mins,maxs=QG._compileDistribution()
+    demand=np.zeros(len(periods),dtype=np.int64)
+    overtime=0
+    for uu in units:
+        for block,ip,k in uu:
+            if(block<2):
+                demand[ip]+=1
+            else:
+                overtime+=1
+    lbp=0;slack=0
+    for ip,period in enumerate(periods):
+        cp=QG.contentPools[period]
+        supply=len(np.unique(cp['rows']))
+        lbp+=max(0,int(demand[ip])-supply)
+        slack+=max(0,supply-int(demand[ip]))
+    lbp+=max(0,overtime-slack)
+    lbk=0
+    sizes=QG._blockSizes(nquestion).values()
+    room=sum(sz[0]+(sz[1] if QG.quizType=='custom' else 0) for sz in sizes)
+    if(mins.sum()<=room):
+        for ik,k in enumerate(keys):
+            rows=np.concatenate([QG.contentPools[p]['rows'][QG.contentPools[p]['pools'][k]] for p in periods])
+            lbk+=max(0,nquiz*int(mins[ik])-len(np.unique(rows)))
+    return max(lbp,lbk)
+
+def solvePacket(QG,nquiz,nquestion=30,rng=None):
+    """Solve a packet of quizzes as a whole (see the module docstring).
+
+    Args:
+        QG (QuizGenerator): generator, with its content pools built
+        nquiz (int): number of quizzes
+        nquestion (int): number of questions per quiz (custom quizzes)
+        rng (Generator): numpy random generator for the tie-breaking 
+            noise and the shuffles (default: a freshly seeded one)
+    Returns:
+        quizzes (list): quiz dataframes
+        stats (list): quiz stats
+        report (dict): repeats, lower bound, whether the packet meets it
+            (optimal), type swaps and per-quiz repeats
+    """
+    if(rng is None):
+        rng=np.random.default_rng()
+    keys=list(QG.quizDistribution.keys())
+    periods=list(QG.quizMakeup.keys())
+    mins,maxs=QG._compileDistribution()
+    pools=QG.contentPools
+    sizes=[sz for sz in QG._blockSizes(nquestion).values()]
+    overtime=(QG.quizType!='custom')
+    cap=np.array([[len(pools[p]['pools'][k]) for k in keys] for p in periods],dtype=np.int64)
+
+    #
+    # 1. composition
+    #
+    load=np.zeros(cap.shape,dtype=np.int64)
+    units=[_composeQuiz(QG,sizes,cap,load,mins,maxs,overtime,rng) for qi in range(nquiz)]
+    compositionBound=int(np.maximum(0,load-cap).sum())
+
+    #
+    # 2. assignment, round-robin over the quizzes, block by block
+    #
+    usage=np.zeros(len(QG.database),dtype=np.int32)
+    size=max(len(u) for u in units) if nquiz else 0
+    quizzes=[QuizArrays(size,len(keys),QG._nverse) for qi in range(nquiz)]
+    # type counts of each quiz's 1-20 and 16AB-20AB blocks, and its 
+    # overtime types (for the type swaps of _otherType)
+    comp=[np.zeros((2,len(keys)),dtype=np.int64) for qi in range(nquiz)]
+    overtimeTypes=[set() for qi in range(nquiz)]
+    for qi,uu in enumerate(units):
+        for block,ip,k in uu:
+            if(block<2):
+                comp[qi][block,k]+=1
+            else:
+                overtimeTypes[qi].add(k)
+    swaps=0
+    for block in (0,1,2):
+        slots=[]
+        for qi,uu in enumerate(units):
+            ub=[u for u in uu if u[0]==block]
+            # the slots of the smallest pools first, while the quiz has 
+            # the most verses free (ties in random order)
+            ub=[ub[j] for j in rng.permutation(len(ub))]
+            slots.append(sorted(ub,key=lambda u: cap[u[1],u[2]]))
+        for r in range(max([len(sl) for sl in slots]+[0])):
+            for qi in range(nquiz):
+                if(r>=len(slots[qi])): continue
+                block,ip,k=slots[qi][r]
+                quiz=quizzes[qi]
+                cp=pools[periods[ip]]
+                pool=cp['pools'][keys[k]]
+                # never a question sharing a verse with the quiz (so never 
+                # one already in it)
+                cand=pool[~quiz.verseUsed[cp['vid'][pool]]]
+                if(len(cand)==0):
+                    k2,cand=_otherType(QG,quiz,cp,block,k,comp[qi],overtimeTypes[qi],mins,maxs,rng)
+                    if(k2 is None):
+                        raise QuizGenerationError('quiz %d: every %s question left in "%s" shares a verse '
+                                                  'with the quiz, and no other type can take its place '
+                                                  '(the sequential solver allows this as a last resort)'
+                                                  %(qi+1,keys[k],periods[ip]))
+                    logger.info('quiz %d: %s question from "%s" instead of %s (verses)',qi+1,keys[k2],periods[ip],keys[k])
+                    if(block<2):
+                        comp[qi][block,k]-=1;comp[qi][block,k2]+=1
+                    else:
+                        overtimeTypes[qi].discard(k);overtimeTypes[qi].add(k2)
+                    units[qi][units[qi].index((block,ip,k))]=(block,ip,k2)
+                    k=k2;swaps+=1
+                cost=usage[cp['rows'][cand]]
+                j=int(np.argmin(cost+0.5*rng.random(len(cost))))
+                pos=cand[j];row=cp['rows'][pos]
+                quiz.add(ip,pos,row,cp['vid'][pos],k,usage[row]>0)
+                usage[row]+=1
+
+    # used state of the packet
+    QG._used[:]=usage>0
+    QG._repeat[:]=usage>1
+
+    #
+    # quiz frames and stats
+    #
+    QQ=[];QQstats=[]
+    for qi,quiz in enumerate(quizzes):
+        blocks=np.array([u[0] for u in units[qi]])
+        iperiods=np.array([u[1] for u in units[qi]])
+        nq1,nq2,nq3=[int((blocks==b).sum()) for b in (0,1,2)]
+        order,labels=QG._orderQuiz(nq1,nq2,nq3,rng)
+        QQ.append(QG._quizFrame(quiz,order,labels))
+        q1=np.bincount(quiz.qcat[:nq1],minlength=len(keys))
+        q12=np.bincount(quiz.qcat[:nq1+nq2],minlength=len(keys))
+        QQstats.append({'min':dict(zip(keys,q1.tolist())),
+                        'max':dict(zip(keys,q12.tolist())),
+                        'period':{p:[int(((blocks==0)&(iperiods==ip)).sum()),
+                                     int(((blocks==1)&(iperiods==ip)).sum())]
+                                  for ip,p in enumerate(periods)},
+                        'loose':False,
+                        'backtracks':0,
+                        'restarts':0})
+
+    perQuiz=[int(q.repeat[:q.n].sum()) for q in quizzes]
+    repeats=int(sum(perQuiz))
+    lb=lowerBound(QG,nquiz,units,nquestion=nquestion)
+    report={'repeats':repeats,
+            'lowerBound':lb,
+            'compositionBound':compositionBound,
+            'optimal':repeats<=lb,
+            'typeSwaps':swaps,
+            'perQuiz':perQuiz}
+    logger.info('packet solver: %d repeats (lower bound %d); per quiz: %s',repeats,lb,perQuiz)
+    return QQ,QQstats,report
@@ -0,0 +1,227 @@
+"""Batch runner for the CM&A Quiz Generator
+
+Builds every quiz packet of a season from one config file, instead of a
+script cell per packet.  The database is loaded once, and the packets
+are generated and written in parallel, one process per core.
+
+Usage:
+    python quizBatch.py season.json [--processes N] [--dry-run]
+
+The config is JSON, in the shape of the QDAT dicts of the scripts:
+    {"database": "2022_Acts/acts_db.xlsx",
+     "quizType": "gospel",
+     "seed": 2132021,
+     "msg": [{"type": "p", "text": "..."}],
+     "defaults": {"nquiz": 4, "xtra": 10,
+                  "limits": {"q": ["150", "300"], "ft": ["150", "300"]},
+                  "sets": {"*": ["Local"]}},
+     "tournaments": {
+        "AAC": {"date": "20220115", "datestr": "1/15/2022",
+                "prefix": "quizzes/2022/AAC/AAC",
+                "A": {"past": ["Acts 1:1-1:19"], "current": ["Acts 1:1-1:19"]},
+                "B": {"current": ["Acts 1:1-1:19"]},
+                "packets": [
+                    {"name": "A_practice", "division": "A",
+                     "title": "{tournament} A Practice Quizzes - {datestr}"},
+                    {"name": "B_practice", "division": "B",
+                     "limits": {"q": ["150"], "ft": ["150"]}}]}}}
+
+Division periods are content lists (intervals or reference strings,
+split evenly between the periods) or {"frac": ..., "content": ...}
+dicts.  Packet settings (nquiz, xtra, limits, sets, engine, solver,
+autoRecover, quizType, seed) override the tournament's, which override
+the defaults; limits/sets map question types ("*" for all) to the
+allowed CLUB/SET values, with null to remove one.  Each packet is
+written to "<prefix>_<name>_<date>.docx".
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import quizGenerator
+import quizWriter
+
+logger=quizGenerator.logger
+
+# packet settings that can be given in the defaults, a tournament or a
+# packet
+PACKET_SETTINGS=('nquiz','xtra','limits','sets','engine','solver','autoRecover','quizType','seed')
+
+def loadConfig(fn):
+    """read a batch config (JSON)"""
+    with open(fn) as f:
+        return json.load(f)
+
+def _merge(*levels):
+    """merge packet settings, later levels overriding earlier ones
+    (limits/sets are merged by question type)"""
+    out={'nquiz':1,'xtra':5,'limits':{},'sets':{}}
+    for lvl in levels:
+        for k in PACKET_SETTINGS:
+            if(k not in lvl):
+                continue
+            if(k in ('limits','sets')):
+                out[k]=dict(out[k])
+                out[k].update(lvl[k])
+            else:
+                out[k]=lvl[k]
+    return out
+
+def _quizMakeup(division):
+    """quizMakeup of a division's periods"""
+    makeup={}
+    for period,v in division.items():
+        if(isinstance(v,dict)):
+            makeup[period]={'frac':v['frac'],'content':v['content']}
+        else:
+            makeup[period]={'frac':1./len(division),'content':v}
+    return makeup
+
+def packetJobs(config):
+    """the packets described by a config, in order, each as a dict of
+    everything a worker needs to build it"""
+    jobs=[]
+    defaults=config.get('defaults',{})
+    root=np.random.SeedSequence(config.get('seed'))
+    for tname,t in config['tournaments'].items():
+        for p in t.get('packets',[]):
+            opts=_merge(defaults,t,p)
+            fmt={'tournament':tname,'division':p['division'],'name':p['name'],
+                 'date':t.get('date',''),'datestr':t.get('datestr','')}
+            title=p.get('title','{tournament} {name} - {datestr}').format(**fmt)
+            prefix=t.get('prefix',tname)
+            fn=p.get('fn','%s_%s_%s.docx'%(prefix,p['name'],t.get('date','')))
+            jobs.append({'tournament':tname,
+                         'packet':p['name'],
+                         'fn':fn,
+                         'title':title,
+                         'quizMakeup':_quizMakeup(t[p['division']]),
+                         'quizType':opts.get('quizType',config.get('quizType','epistle')),
+                         'options':opts})
+    # a seed per packet (unless given), so each packet is reproducible
+    for job,ss in zip(jobs,root.spawn(len(jobs))):
+        if(job['options'].get('seed') is None):
+            job['options']['seed']=int(ss.generate_state(1)[0])
+    return jobs
+
+# database shared with the worker processes (set once per worker)
+_shared={}
+
+def _initWorker(database,fingerprint,msg):
+    _shared['database']=database
+    _shared['fingerprint']=fingerprint
+    _shared['msg']=msg
+    _shared['verseIndex']=quizGenerator.VerseIndex(database)
+
+def setupGenerator(job,database,fingerprint=None,verseIndex=None):
+    """a generator for a packet job (see packetJobs), on a prepared 
+    database shared with other jobs"""
+    opts=job['options']
+    QG=quizGenerator.QuizGenerator(quizType=job['quizType'])
+    QG.setDatabase(database,fingerprint=fingerprint,verseIndex=verseIndex)
+    QG.quizMakeup=job['quizMakeup']
+    for attr in ('engine','solver','autoRecover'):
+        if(attr in opts):
+            setattr(QG,attr,opts[attr])
+    for key,field in (('limits','limit'),('sets','set')):
+        for qt,values in opts[key].items():
+            QG.quizDistribution=QG.quizDistribution.override(qt,**{field:values})
+    return QG
+
+def buildPacket(job):
+    """generate and write one packet
+
+    Returns:
+        dict: the packet, its file, seed, repeats and timings (seconds)
+    """
+    t0=time.time()
+    opts=job['options']
+    QG=setupGenerator(job,_shared['database'],_shared['fingerprint'],_shared['verseIndex'])
+    t1=time.time()
+    qdat=QG.generateQuizTables(nquiz=opts['nquiz'],xtra=opts['xtra'],seed=opts['seed'])
+    t2=time.time()
+    d=os.path.dirname(job['fn'])
+    if(d):
+        os.makedirs(d,exist_ok=True)
+    quizWriter.QuizWriter().save(job['fn'],qdat,title=job['title'],msg=_shared['msg'])
+    t3=time.time()
+    repeats=sum(int(q['FLAGS'].str.contains('R').sum()) for q in qdat['quizzes'])
+    return {'tournament':job['tournament'],
+            'packet':job['packet'],
+            'fn':job['fn'],
+            'nquiz':opts['nquiz'],
+            'seed':opts['seed'],
+            'repeats':repeats,
+            'setup':t1-t0,
+            'generate':t2-t1,
+            'write':t3-t2,
+            'total':t3-t0,
+            'pid':os.getpid()}
+
+def runBatch(config,processes=None):
+    """Build every packet of a config.
+
+    Args:
+        config (dict or string): config, or its filename
+        processes (int): worker processes (default: one per core, up to
+            the number of packets); 1 builds the packets in this process
+    Returns:
+        DataFrame: one row per packet, with its file, seed, repeats and
+            timings (seconds)
+    """
+    if(isinstance(config,str)):
+        config=loadConfig(config)
+    t0=time.time()
+    QG=quizGenerator.QuizGenerator(quizType=config.get('quizType','epistle'))
+    QG.loadDatabase(config['database'])
+    tload=time.time()-t0
+    logger.info('batch: database loaded in %.2fs',tload)
+
+    jobs=packetJobs(config)
+    if(processes is None):
+        processes=min(len(jobs),os.cpu_count() or 1)
+    initargs=(QG.database,QG.databaseFingerprint,config.get('msg'))
+    results=[]
+    if(processes<=1):
+        _initWorker(*initargs)
+        for job in jobs:
+            results.append(buildPacket(job))
+            logger.info('batch: %s %s (%.2fs)',job['tournament'],job['packet'],results[-1]['total'])
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                    initializer=_initWorker,
+                                                    initargs=initargs) as pool:
+            futures=[pool.submit(buildPacket,job) for job in jobs]
+            for job,f in zip(jobs,futures):
+                results.append(f.result())
+                logger.info('batch: %s %s (%.2fs)',job['tournament'],job['packet'],results[-1]['total'])
+    report=pd.DataFrame(results)
+    logger.info('batch: %d packets in %.2fs (database load %.2fs)',len(jobs),time.time()-t0,tload)
+    return report
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Build the quiz packets of a batch config.')
+    parser.add_argument('config',help='batch config (JSON)')
+    parser.add_argument('--processes',type=int,default=None,help='worker processes (default: one per core)')
+    parser.add_argument('--dry-run',action='store_true',help='list the packets without building them')
+    args=parser.parse_args(argv)
+    quizGenerator.configureLogging()
+    config=loadConfig(args.config)
+    if(args.dry_run):
+        for job in packetJobs(config):
+            print('%s: %s -> %s (%d quizzes, seed %d)'%(job['tournament'],job['packet'],job['fn'],
+                                                       job['options']['nquiz'],job['options']['seed']))
+        return 0
+    report=runBatch(config,processes=args.processes)
+    with pd.option_context('display.width',200):
+        print(report[['tournament','packet','fn','repeats','setup','generate','write','total']].to_string(index=False))
+    return 0
+
+if(__name__=='__main__'):
+    sys.exit(main())
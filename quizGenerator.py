@@ -5,9 +5,7 @@ questions (i.e. "the question database"), such as those from
 the Central Quizzing Leadership Team.
 
 Typical usage:
-    import numpy as np
     import quizgen
-    np.random.seed(202002081)
 
     #
     # specify the quizMakeup, i.e. how much from from which books, 
@@ -18,6 +16,8 @@ Typical usage:
                 'past':{'frac':0.5,
                         'content':[('HEB',[1,2,3,4,5,6,7,8,9,10,11])]}
                 }
+    # (content may also be given as reference strings, which can 
+    # span books, e.g. 'content':['HEB 12:1-1P 1:25'])
     nquiz=6
 
     # 
@@ -26,9 +26,9 @@ Typical usage:
     fnxls='HEB1P2P_CMA_marked.xls'
     QG=quizgen.QuizGenerator(fndatabase=fnxls)
 
-    # add custom limits for certain question types
-    QG.quizDistribution['q']['limit']=(150,300)
-    QG.quizDistribution['ft']['limit']=(150,300)
+    # add custom limits for certain question types (distributions are 
+    # immutable, and shared; override makes a new one)
+    QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
     #QG.verbose=True
 
     # set the quiz makeup and number of quizzes
@@ -37,13 +37,57 @@ Typical usage:
     # of quizzes
     QG.getContent()
     # generate the tabulated questions, and some extras of each 
-    # question type
-    QG.generateQuizTables(xtra=10)
+    # question type (the seed makes the packet reproducible)
+    QG.generateQuizTables(xtra=10,seed=202002081)
+
+Logging is not set up on import; to see the generator's progress:
+    quizgen.configureLogging()                      # console
+    quizgen.configureLogging(logfile='quiz_generator.log')  # and a file
 
 Additional options:
     QG.verbose = True           # more descriptive logging
     QG.scramblePeriod = False   # keep period blocks in order
     QG.quizType='custom'        # disables distributions
+    QG.engine='array'           # faster array-backed quiz assembly
+    QG.autoRecover=True         # backtrack/restart a quiz instead of failing
+    QG.solver='packet'          # solve the whole packet, minimizing repeats
+    QG.instrument=True          # phase timings and pick counters, per quiz
+                                # (getQuizData()['instrumentation'], or
+                                #  QG.instrumentation.toJSON(fn))
+
+Writing each quiz while the next ones are generated (only a few 
+quizzes in memory at once; see QuizWriter.saveStream):
+    quizWriter.QuizWriter().saveStream('A.docx',QG,nquiz=48,xtra=10)
+    for qi,dfq,stats in QG.iterQuizTables(nquiz=48,keep=False): ...
+
+Reproducing or patching a packet:
+    QG.generateQuizTables(xtra=10,seed=1234)  # same seed, same packet
+    QG.regenerateQuiz(2)                      # redo quiz 3 only
+    QG.regenerateQuiz(2,following=True)       # redo quiz 3 and later
+
+Extra questions are drawn lazily, as they are used:
+    next(QG.extraQuestions['int'])  # one more 'int' extra
+    QG.extraQuestions['q'].frame(20) # the first 20 'q' extras
+
+Quiz-day replacements:
+    QG.replace(2,'7')           # new question 7 for quiz 3, same type
+    QG.applyReplacements()      # put the replacements in the quiz tables
+
+Best of several candidate packets (generated in parallel):
+    best=QG.generateBestOf(k=8,nquiz=nquiz,xtra=10)
+    best['seed'], best['candidates']   # generateQuizTables(seed=best['seed']) reproduces it
+
+Checking the content before generating:
+    report=QG.analyzeFeasibility(nquiz=nquiz)
+    report['problems']              # combinations that can't be satisfied
+    quizgen.feasibilityTable(report)  # quizzes per period/type w/o repeats
+
+Command line (see python -m quizGenerator generate --help):
+    python -m quizGenerator generate --database HEB1P2P_CMA_marked.xls \
+        --content "current=HEB 12-13,1P 1" --content "past=HEB 1-11" \
+        --limit q=150,300 --nquiz 6 --save-snapshot heb.snap --out A.docx
+    # later runs start from the prepared generator
+    python -m quizGenerator generate --snapshot heb.snap --nquiz 6 --out B.docx --profile
 
 Custom Quizzes
     Custom quizzes can be created by modifying the QG.quizDistribution 
@@ -57,52 +101,223 @@ Custom Quizzes
         #    of the total number of questions.
         # -- to be more representative of the question distributions 
         #    provided by CQLT, make the mins/maxes much higher
-        qdist=QG.quizDistribution
-        qdist['int']['range']=(10,50)
-        qdist['cr']['range']=(10,50)
-        qdist['ft']['range']=(10,50)
-        qdist['ma']['range']=(10,50)
-        qdist['q']['range']=(10,50)
+        QG.quizDistribution=quizgen.DIST_EPISTLE.override(
+            ['int','cr','ft','ma','q'],range=(10,50))
 
 
 Ted Tower, 2/2020
 """
+import time
+_importStart=time.perf_counter()
 import os
+import sys
+import copy
+import pickle
+import concurrent.futures
+import threading
+import contextlib
+from collections import OrderedDict
+from collections.abc import Mapping
+import functools
+import glob
+import hashlib
 import pandas as pd
 import numpy as np
-from IPython.display import display
-import xlrd
-import re
-import pprint
-
-# imports from python-docx to create the Word document
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
-from docx.enum.text import WD_LINE_SPACING
+# (pprint, json, argparse and python-docx are imported where they are 
+#  used, so that importing the generator stays fast)
 
 import logging
-#logging.basicConfig(filename='quiz_generator.log',level=logging.DEBUG)
-# create logger
+# create logger (handlers are set up by configureLogging)
 logger = logging.getLogger('quiz_generator')
 logger.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s|%(name)s|%(levelname)s|%(funcName)s|%(message)s')
-logger.handlers=[]
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-ch.setFormatter(formatter)
-logger.addHandler(ch)
-# file handler
-fh = logging.FileHandler('quiz_generator.log')
-fh.setFormatter(formatter)
-logger.addHandler(fh)
 
+LOG_FORMAT='%(asctime)s|%(name)s|%(levelname)s|%(funcName)s|%(message)s'
+
+# background writer of the log records (see configureLogging)
+_logListener=None
+_logConfig=None
+
+def configureLogging(level=logging.INFO,logfile=None,console=True,
+                     names=('quiz_generator','quiz_writer')):
+    """Set up the log handlers of the generator and writer loggers.
+
+    Nothing is set up on import; call this once from a script, notebook 
+    or entry point (repeated calls replace the handlers).  The loggers 
+    only put records on a queue, and a background thread writes them to 
+    the console and log file, so logging does no I/O in the pick loops.  
+    Log calls take lazy arguments (logger.info('%d picks',n)), which are 
+    only formatted for records at or above level.
+
+    Args:
+        level (int): logging level
+        logfile (string): also log to this file (e.g. 'quiz_generator.log')
+        console (bool): log to stderr
+        names (tuple): loggers to configure
+    """
+    global _logListener,_logConfig
+    import queue
+    import atexit
+    import logging.handlers
+    stopLogging()
+    formatter=logging.Formatter(LOG_FORMAT)
+    handlers=[]
+    if(console):
+        handlers.append(logging.StreamHandler())
+    if(logfile):
+        handlers.append(logging.FileHandler(logfile))
+    for h in handlers:
+        h.setLevel(level)
+        h.setFormatter(formatter)
+    q=queue.SimpleQueue()
+    qh=logging.handlers.QueueHandler(q)
+    for name in names:
+        lg=logging.getLogger(name)
+        lg.handlers=[qh]
+        lg.setLevel(level)
+    _logListener=logging.handlers.QueueListener(q,*handlers,respect_handler_level=True)
+    _logListener.start()
+    if(_logConfig is None):
+        atexit.register(stopLogging)
+    _logConfig={'level':level,'logfile':logfile,'console':console,'names':names}
+
+def stopLogging():
+    """write out the queued log records and close the handlers (until 
+    the next configureLogging)"""
+    global _logListener
+    if(_logListener is None):
+        return
+    for name in _logConfig['names']:
+        logging.getLogger(name).handlers=[]
+    _logListener.stop()
+    for h in _logListener.handlers:
+        h.close()
+    _logListener=None
+
+def _restartLogging():
+    """the log writer thread isn't copied into a forked process (e.g. 
+    a worker of generateBestOf or the batch runner); start its own"""
+    global _logListener
+    if(_logListener is not None):
+        _logListener=None
+        configureLogging(**_logConfig)
+
+if(hasattr(os,'register_at_fork')):
+    os.register_at_fork(after_in_child=_restartLogging)
+
+
+# version of the prepared database produced by loadDatabase.  Bump this 
+# whenever _prepareDatabase changes, so that stale caches are rebuilt.
+LOADER_VERSION=2
+# default cache directory (created next to the database file)
+CACHE_DIR='.quizgen_cache'
+
+def _fileDigest(fn,blocksize=1<<20):
+    """sha1 hex digest of a file's contents"""
+    h=hashlib.sha1()
+    with open(fn,'rb') as f:
+        for blk in iter(lambda: f.read(blocksize),b''):
+            h.update(blk)
+    return h.hexdigest()
+
+def _prepareDatabase(df):
+    """derived-column work done on a freshly-read question database"""
+    # fix dataframe
+    def convert_to_str(value):
+        if pd.isna(value) or value == '':
+            return ''
+        else:
+            return str(int(value))
+        
+    if('FLAGS' not in df):
+        df['FLAGS']=''
+    df['FLAGS']=df['FLAGS'].fillna('')
+    df['CLUB'] = df['CLUB'].apply(convert_to_str)
+    df['INDEX']=range(1, len(df) + 1)
+    
+    df=df.rename(columns={'BOOK':'BK',
+                          'CHAPTER':'CH',
+                          'VERSE':'VS'})
+    #df[np.isnan(df['CLUB'])==False]['CLUB'].astype(int)
+    #df['FLAGS']=''
+    #df.fillna('', inplace=True)
+    df['BCV']=df['BK']+'_'+df['CH'].astype(str)+'_'+df['VS'].astype(str)
+    # dense integer verse id (one per distinct book-chapter-verse)
+    df['VID']=pd.factorize(df['BCV'])[0].astype(np.int32)
+    return df
+
+def _cacheFilename(fndatabase,digest,cachedir=None):
+    """cache filename (without extension) for a database and its digest"""
+    if(cachedir is None):
+        cachedir=os.path.join(os.path.dirname(os.path.abspath(fndatabase)),CACHE_DIR)
+    base=os.path.basename(fndatabase)
+    return os.path.join(cachedir,'%s.%s.v%d'%(base,digest[:16],LOADER_VERSION))
+
+def _readCache(fncache):
+    """read a prepared database from the cache, or None if not cached"""
+    if(os.path.exists(fncache+'.parquet')):
+        return pd.read_parquet(fncache+'.parquet')
+    if(os.path.exists(fncache+'.pkl')):
+        return pd.read_pickle(fncache+'.pkl')
+    return None
+
+def _writeCache(df,fncache):
+    """write a prepared database to the cache.  Parquet is used when a 
+    parquet engine (pyarrow/fastparquet) is installed and the columns 
+    convert cleanly; otherwise pandas' pickle format is used.  Older 
+    cache files for the same database are removed.
+    """
+    os.makedirs(os.path.dirname(fncache),exist_ok=True)
+    # <cachedir>/<database filename>.<digest>.v<version> -> strip digest/version
+    prefix=fncache.rsplit('.',2)[0]
+    for fn in glob.glob(glob.escape(prefix)+'.*'):
+        try:
+            os.remove(fn)
+        except OSError:
+            logger.warning('could not remove stale cache file: %s',fn)
+    try:
+        df.to_parquet(fncache+'.parquet')
+        return fncache+'.parquet'
+    except Exception as e:
+        # no parquet engine, or mixed-type columns it won't convert
+        logger.debug('parquet cache unavailable (%s); using pickle',e)
+        if(os.path.exists(fncache+'.parquet')):
+            os.remove(fncache+'.parquet')
+    df.to_pickle(fncache+'.pkl')
+    return fncache+'.pkl'
+
+def categorizeTypes(types,quizDistribution):
+    """map question TYPEs to integer category codes
+
+    The code is the position of the category in quizDistribution 
+    (e.g. 0 for 'int' in DIST_EPISTLE); -1 means the type belongs to 
+    no category.  String work is only done once per distinct TYPE.
+
+    Args:
+        types (Series): the TYPE column of the database
+        quizDistribution (dict): the quiz distribution
+    Returns:
+        codes (int8 array)
+    """
+    inv,utypes=pd.factorize(pd.Series(types).astype(str).str.lower())
+    ucodes=np.full(len(utypes),-1,dtype=np.int8)
+    for ii,(qt,qdata) in enumerate(quizDistribution.items()):
+        for jj,t in enumerate(utypes):
+            if(ucodes[jj]>=0): continue
+            if((qt=='sit' and t.startswith(qt)) or (t in qdata['types'])):
+                ucodes[jj]=ii
+    return ucodes[inv]
 
 def countTypes(df,quizDistribution):
     """get counts of different question types
+
+    If the dataframe has a QCAT column (category codes from 
+    categorizeTypes, coded against this quizDistribution), the counts 
+    are a single bincount.
     """
+    if('QCAT' in df):
+        codes=df['QCAT'].values
+        n=np.bincount(codes[codes>=0],minlength=len(quizDistribution))
+        return dict(zip(quizDistribution.keys(),n.tolist()))
     tcount={}
     for qt,qdata in quizDistribution.items():
         # dataframe of this type of question
@@ -117,17 +332,236 @@ def countTypes(df,quizDistribution):
         tcount[qt]=nrow
     return tcount
 
+# bits of the chapter and verse fields of a verse key (see VerseIndex)
+KEY_BITS=10
+# verse number standing for "to the end of the chapter"
+LAST_VERSE=(1<<KEY_BITS)-1
+
+def parseReference(ref,book=None):
+    """Compile a reference string into content intervals.
+
+    Intervals are separated by commas; each is "c:v-c:v", "c:v-v", 
+    "c:v", "c" (a chapter) or "c-c" (chapters), and either end may be 
+    prefixed with a book, which carries over to the following intervals:
+        parseReference('1:1-3:15,4:6-10:10',book='Acts')
+        parseReference('1P 5:1-2P 1:10')
+
+    Returns:
+        list: [((book,ch,vs),(book,ch,vs)),...], as used in quizMakeup
+    """
+    def point(txt,book,ch=None):
+        txt=txt.strip()
+        if(' ' in txt):
+            book,txt=txt.rsplit(' ',1)
+            book=book.strip()
+            ch=None
+        if(':' in txt):
+            c,v=txt.split(':')
+            return book,int(c),int(v)
+        if(ch is None):
+            return book,int(txt),None
+        return book,ch,int(txt)
+
+    intervals=[]
+    for iv in ref.split(','):
+        if(not iv.strip()):
+            continue
+        ends=iv.split('-')
+        if(len(ends)>2):
+            raise ValueError('bad reference interval: "%s"'%iv)
+        book,c1,v1=point(ends[0],book)
+        if(book is None):
+            raise ValueError('no book given for "%s"'%iv)
+        if(len(ends)==1):
+            b2,c2,v2=book,c1,v1
+        else:
+            b2,c2,v2=point(ends[1],book,ch=c1 if v1 is not None else None)
+        intervals.append(((book,c1,1 if v1 is None else v1),
+                          (b2,c2,LAST_VERSE if v2 is None else v2)))
+        book=b2
+    return intervals
+
+class VerseIndex():
+    """Sorted integer (book, chapter, verse) keys of the database, for 
+    selecting content intervals by binary search.  Books are ordered as 
+    they first appear in the database, so ranges may span books.
+    """
+    def __init__(self,df):
+        bkid,books=pd.factorize(df['BK'])
+        self.books={bk:ii for ii,bk in enumerate(books)}
+        key=(bkid.astype(np.int64)<<(2*KEY_BITS))|(df['CH'].values.astype(np.int64)<<KEY_BITS)| \
+            df['VS'].values.astype(np.int64)
+        self.order=np.argsort(key,kind='stable')
+        self.keys=key[self.order]
+
+    def key(self,bk,ch,vs):
+        return (self.books[bk]<<(2*KEY_BITS))|(int(ch)<<KEY_BITS)|int(vs)
+
+    def select(self,start,end):
+        """database row positions (in database order) of the verses 
+        from start to end, each a (book, chapter, verse) tuple"""
+        for bk in (start[0],end[0]):
+            if(bk not in self.books):
+                logger.warning('book "%s" is not in the database',bk)
+                return np.zeros(0,dtype=np.int64)
+        lo=np.searchsorted(self.keys,self.key(*start),side='left')
+        hi=np.searchsorted(self.keys,self.key(*end),side='right')
+        return np.sort(self.order[lo:hi])
+
+IMMUTABLE_MSG='quiz distributions are immutable (and may be shared by other ' \
+    'generators); make a new one, e.g. QG.quizDistribution=QG.quizDistribution.override(\'q\',limit=(150,300))'
+
+class Rule(Mapping):
+    """Immutable rules of one question category: 'range' (min,max), 
+    'types' (TYPE values, lower case), 'label', and optionally 'limit' 
+    (CLUB values) and 'set' (SET values).  Limits and sets are kept as 
+    strings, as they are in the prepared database.
+    """
+    def __init__(self,fields):
+        f=dict(fields)
+        if('range' in f):
+            f['range']=tuple(int(x) for x in f['range'])
+        if('types' in f):
+            f['types']=tuple(str(t).lower() for t in f['types'])
+        for k in ('limit','set'):
+            if(k in f):
+                f[k]=tuple(str(x) for x in f[k])
+        self._fields=f
+        self._hash=hash(tuple(sorted(f.items())))
+
+    def __getitem__(self,k):
+        return self._fields[k]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __hash__(self):
+        return self._hash
+
+    def __setitem__(self,k,v):
+        raise TypeError(IMMUTABLE_MSG)
+
+    def __delitem__(self,k):
+        raise TypeError(IMMUTABLE_MSG)
+
+    def __repr__(self):
+        return repr(self._fields)
+
+class Distribution(Mapping):
+    """Immutable, hashable quiz distribution: question category -> Rule.
+
+    Distributions compare and hash by value, so generators can share 
+    them (and their compiled arrays, see compiled) freely.  Changes make 
+    new distributions:
+        dist=DIST_EPISTLE.override(['q','ft'],limit=(150,300))
+        dist=dist.override('*',set=('Local',))   # all categories
+        dist=dist.override('q',limit=None)       # remove the q limit
+    """
+    def __init__(self,rules):
+        self._rules={k:(v if isinstance(v,Rule) else Rule(v)) for k,v in rules.items()}
+        self._hash=hash(tuple(self._rules.items()))
+
+    def __getitem__(self,k):
+        return self._rules[k]
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self,other):
+        if(isinstance(other,Distribution)):
+            return self._hash==other._hash and list(self._rules.items())==list(other._rules.items())
+        return Mapping.__eq__(self,other)
+
+    def __setitem__(self,k,v):
+        raise TypeError(IMMUTABLE_MSG)
+
+    def __delitem__(self,k):
+        raise TypeError(IMMUTABLE_MSG)
+
+    def __repr__(self):
+        return 'Distribution(%r)'%self._rules
+
+    def asDict(self):
+        """the distribution as plain nested dicts"""
+        return {k:dict(v) for k,v in self._rules.items()}
+
+    def override(self,categories,**fields):
+        """A new distribution with fields of some categories replaced 
+        (a field given as None is removed).
+
+        Args:
+            categories (string or list): category, list of categories, 
+                or '*' for all of them
+            fields: rule fields, e.g. range=(3,5) or limit=(150,)
+        """
+        if(categories=='*'):
+            categories=list(self._rules.keys())
+        elif(isinstance(categories,str)):
+            categories=[categories]
+        rules=self.asDict()
+        for k in categories:
+            if(k not in rules):
+                raise KeyError('no "%s" category in the distribution (%s)'%(k,', '.join(rules)))
+            for field,v in fields.items():
+                if(v is None):
+                    rules[k].pop(field,None)
+                else:
+                    rules[k][field]=v
+        return Distribution(rules)
+
+    def compiled(self):
+        """the distribution compiled to arrays (see CompiledDistribution), 
+        shared by all equal distributions"""
+        return _compileRules(self)
+
+class CompiledDistribution():
+    """Arrays of a Distribution, indexed by category code (the position 
+    of the category in the distribution).  The arrays are read-only, as 
+    they are shared.
+
+    Attributes:
+        keys (tuple): the categories, in code order
+        code (dict): category -> code
+        mins, maxs (int64 arrays): range of each category
+        categories (tuple): (category, types) of each category, which 
+            determines the database's QCAT codes
+        filters (tuple): (category, limit, set) of each category, which 
+            determines the content selection
+    """
+    def __init__(self,dist):
+        self.keys=tuple(dist.keys())
+        self.code={k:ii for ii,k in enumerate(self.keys)}
+        self.mins=np.array([v['range'][0] for v in dist.values()],dtype=np.int64)
+        self.maxs=np.array([v['range'][1] for v in dist.values()],dtype=np.int64)
+        self.mins.setflags(write=False)
+        self.maxs.setflags(write=False)
+        self.categories=tuple((k,v['types']) for k,v in dist.items())
+        self.filters=tuple((k,v.get('limit',()),v.get('set',())) for k,v in dist.items())
+
+@functools.lru_cache(maxsize=64)
+def _compileRules(dist):
+    return CompiledDistribution(dist)
+
 # DIST_EPISTLE={'int':{'range':(9,16),'types':('int',),'label':'Interrogative'},
 #     'cr':{'range':(3,7),'types':('cr','cvr','cvrma','crma'),'label':'Chapter Reference'},
 #     'ft':{'range':(3,4),'types':('ft','f2v','ftv','ftn'),'label':'Finish-The-Verse'},
 #     'ma':{'range':(1,2),'types':('ma',),'label':'Multiple Answer'},
 #     'q':{'range':(3,4),'types':('q','q2'),'label':'Quote'}}
 # 2023+
-DIST_EPISTLE={'int':{'range':(7,14),'types':('int',),'label':'Interrogative'},
+DIST_EPISTLE=Distribution({'int':{'range':(7,14),'types':('int',),'label':'Interrogative'},
     'cr':{'range':(3,5),'types':('cr','cvr','cvrma','crma'),'label':'Chapter Reference'},
     'ft':{'range':(3,5),'types':('ft','f2v','ftv','ftn'),'label':'Finish-The-Verse'},
     'ma':{'range':(2,4),'types':('ma',),'label':'Multiple Answer'},
-    'q':{'range':(2,3),'types':('q','q2'),'label':'Quote'}}
+    'q':{'range':(2,3),'types':('q','q2'),'label':'Quote'}})
 
 # DIST_GOSPEL={'int':{'range':(8,14),'types':('int',),'label':'Interrogative'},
 #     'cr':{'range':(3,6),'types':('cr','cvr','cvrma','crma'),'label':'Chapter Reference'},
@@ -135,12 +569,513 @@ DIST_EPISTLE={'int':{'range':(7,14),'types':('int',),'label':'Interrogative'},
 #     'ma':{'range':(1,2),'types':('ma',),'label':'Multiple Answer'},
 #     'q':{'range':(2,3),'types':('q','q2'),'label':'Quote'},
 #     'sit':{'range':(2,4),'types':('sit',),'label':'Situational'},}
-DIST_GOSPEL={'int':{'range':(7,14),'types':('int',),'label':'Interrogative'},
+DIST_GOSPEL=Distribution({'int':{'range':(7,14),'types':('int',),'label':'Interrogative'},
     'cr':{'range':(3,5),'types':('cr','cvr','cvrma','crma'),'label':'Chapter Reference'},
     'ft':{'range':(3,5),'types':('ft','f2v','ftv','ftn'),'label':'Finish-The-Verse'},
     'ma':{'range':(2,4),'types':('ma',),'label':'Multiple Answer'},
     'q':{'range':(2,3),'types':('q','q2'),'label':'Quote'},
-    'sit':{'range':(2,4),'types':('sit',),'label':'Situational'},}
+    'sit':{'range':(2,4),'types':('sit',),'label':'Situational'},})
+
+BLOCK_FAIL_MSG='Cannot seem to generate enough 1-20 questions to meet distribution.  ' \
+    'This may be because too few chapters in one of the periods.  Consider ' \
+    'rerunning to get a different set, changing chapter ranges, or setting ' \
+    'autoRecover.'
+
+# limits of the content-selection cache shared by all generators (see 
+# _getContent); the least recently used selections are evicted first
+CONTENT_CACHE_MAX_ENTRIES=32
+CONTENT_CACHE_MAX_BYTES=256*2**20
+
+_contentCache=OrderedDict()     # key -> (selection, nbytes)
+_contentCacheLock=threading.Lock()
+_contentCacheStats={'hits':0,'misses':0,'evictions':0}
+
+def _contentCacheGet(key):
+    with _contentCacheLock:
+        hit=_contentCache.get(key)
+        if(hit is None):
+            _contentCacheStats['misses']+=1
+            return None
+        _contentCache.move_to_end(key)
+        _contentCacheStats['hits']+=1
+        return hit[0]
+
+def _contentCachePut(key,sel):
+    rows,pools,vid=sel
+    nbytes=rows.nbytes+vid.nbytes+sum(p.nbytes for p in pools.values())
+    if(nbytes>CONTENT_CACHE_MAX_BYTES):
+        return
+    with _contentCacheLock:
+        _contentCache[key]=(sel,nbytes)
+        _contentCache.move_to_end(key)
+        total=sum(v[1] for v in _contentCache.values())
+        while(len(_contentCache)>CONTENT_CACHE_MAX_ENTRIES or total>CONTENT_CACHE_MAX_BYTES):
+            k,(v,nb)=_contentCache.popitem(last=False)
+            total-=nb
+            _contentCacheStats['evictions']+=1
+
+def clearContentCache():
+    """empty the content-selection cache"""
+    with _contentCacheLock:
+        _contentCache.clear()
+        for k in _contentCacheStats:
+            _contentCacheStats[k]=0
+
+def contentCacheInfo():
+    """entries, bytes, hits, misses and evictions of the 
+    content-selection cache"""
+    with _contentCacheLock:
+        info=dict(_contentCacheStats)
+        info['entries']=len(_contentCache)
+        info['bytes']=sum(v[1] for v in _contentCache.values())
+    return info
+
+def _freeze(x):
+    """hashable copy of nested lists/tuples/dicts"""
+    if(isinstance(x,dict)):
+        return tuple((k,_freeze(v)) for k,v in x.items())
+    if(isinstance(x,(list,tuple))):
+        return tuple(_freeze(y) for y in x)
+    return x
+
+# version of the generator snapshots (see saveSnapshot)
+SNAPSHOT_VERSION=2
+# generator state kept in a snapshot: the prepared database, its 
+# category codes and verse index, and the content pools
+SNAPSHOT_ATTRS=('quizType','quizDistribution','quizMakeup','nquiz',
+                'database','databaseFingerprint','_verseIndex','_qcatSignature',
+                'contentPools','_contentSig','_used','_repeat','_nverse')
+
+class QuizGenerationError(Exception):
+    """a quiz could not be generated from the content (e.g. too few 
+    questions of a type to meet the distribution)"""
+    pass
+
+class Instrumentation():
+    """Per-phase wall time (seconds) and counters of a packet, overall 
+    and per quiz (see QuizGenerator.instrument).
+
+    Counters:
+        pickAttempts   picks tried
+        picks          picks that added a question
+        noRoom         picks with no question type left in the distribution
+        tierRepeat     picks that fell back to repeats (other verses)
+        tierVerse      picks that fell back to repeats in the quiz's verses
+        excluded       picks with no question left after the exclusions
+        loosened       blocks whose distribution minimums were loosened
+        loosePicks     picks with loosened minimums
+        backtracks, restarts
+        repeats        repeat questions in the finished quizzes
+        extras         extra questions drawn (repeats: extraRepeats)
+    """
+    def __init__(self):
+        self.packet={'phases':{},'counters':{}}
+        self.quizzes=[]
+        self._quiz=None
+
+    def startQuiz(self,qi):
+        """count the following phases and events to quiz qi (from scratch)"""
+        while(len(self.quizzes)<=qi):
+            self.quizzes.append(None)
+        self.quizzes[qi]=self._quiz={'phases':{},'counters':{}}
+
+    def endQuiz(self):
+        self._quiz=None
+
+    def count(self,key,n=1):
+        c=self.packet['counters']
+        c[key]=c.get(key,0)+n
+        if(self._quiz is not None):
+            c=self._quiz['counters']
+            c[key]=c.get(key,0)+n
+
+    @contextlib.contextmanager
+    def phase(self,name):
+        """time a phase (nested phases are timed on their own as well)"""
+        quiz=self._quiz
+        t=time.perf_counter()
+        try:
+            yield
+        finally:
+            dt=time.perf_counter()-t
+            ph=self.packet['phases']
+            ph[name]=ph.get(name,0.)+dt
+            if(quiz is not None):
+                quiz['phases'][name]=quiz['phases'].get(name,0.)+dt
+
+    def asDict(self):
+        return {'packet':self.packet,
+                'quizzes':[q if q is not None else {'phases':{},'counters':{}} for q in self.quizzes]}
+
+    def toJSON(self,fn=None):
+        """the instrumentation as JSON (also written to fn, if given)"""
+        import json
+        txt=json.dumps(self.asDict(),indent=1)
+        if(fn is not None):
+            with open(fn,'w') as f:
+                f.write(txt)
+        return txt
+
+class _NoInstrumentation():
+    """stand-in for Instrumentation when it is turned off: every call 
+    is a no-op"""
+    _null=contextlib.nullcontext()
+    def startQuiz(self,qi):
+        pass
+    def endQuiz(self):
+        pass
+    def count(self,key,n=1):
+        pass
+    def phase(self,name):
+        return self._null
+
+NO_INSTRUMENTATION=_NoInstrumentation()
+
+# order of the questions in a normal (non-custom) quiz
+QUESTION_ORDER=['1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16',
+                '16A','16B','17','17A','17B','18','18A','18B','19','19A','19B','20','20A','20B',
+                '21','22','23']
+AB_LABELS=['16A','16B','17A','17B','18A','18B','19A','19B','20A','20B']
+OVERTIME_LABELS=['21','22','23']
+
+class QuizArrays():
+    """A quiz (or table of extra questions) under construction by the 
+    array engine.  Picks are kept in preallocated arrays, along with a 
+    running count of each question type.
+    """
+    def __init__(self,size,ncat,nverse):
+        self.period=np.zeros(size,dtype=np.int8)  # index of the period
+        self.pos=np.zeros(size,dtype=np.int64)    # position in the period's content
+        self.row=np.zeros(size,dtype=np.int64)    # database row
+        self.vid=np.zeros(size,dtype=np.int32)    # verse id
+        self.qcat=np.zeros(size,dtype=np.int8)    # category code
+        self.repeat=np.zeros(size,dtype=bool)     # repeat flag
+        self.counts=np.zeros(ncat,dtype=np.int64) # picks of each category
+        self.verseUsed=np.zeros(nverse,dtype=bool) # verses in the quiz
+        self.n=0
+
+    def add(self,iperiod,pos,row,vid,qcat,repeat):
+        n=self.n
+        if(n==len(self.row)):
+            # grow (only for unusually large custom quizzes)
+            for k in ('period','pos','row','vid','qcat','repeat'):
+                a=getattr(self,k)
+                setattr(self,k,np.concatenate([a,np.zeros_like(a)]))
+        self.period[n]=iperiod
+        self.pos[n]=pos
+        self.row[n]=row
+        self.vid[n]=vid
+        self.qcat[n]=qcat
+        self.repeat[n]=repeat
+        self.counts[qcat]+=1
+        self.verseUsed[vid]=True
+        self.n=n+1
+
+    def truncate(self,n):
+        """drop picks beyond the first n"""
+        if(n>=self.n):
+            return
+        for ii in range(n,self.n):
+            self.counts[self.qcat[ii]]-=1
+        self.n=n
+        self.verseUsed[:]=False
+        self.verseUsed[self.vid[:n]]=True
+
+class MaskView():
+    """A period's view of a bitmask over the database rows: element i 
+    is the mask of the period's i-th question (database row rows[i]).  
+    All periods share the one mask, so a question in overlapping periods 
+    has a single flag.
+    """
+    def __init__(self,mask,rows):
+        self.mask=mask
+        self.rows=rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self,i):
+        return self.mask[self.rows[i]]
+
+    def __setitem__(self,i,value):
+        self.mask[self.rows[i]]=value
+
+    def __array__(self,dtype=None,copy=None):
+        a=self.mask[self.rows]
+        return a if dtype is None else a.astype(dtype)
+
+class QuestionSwapper():
+    """Quiz-day replacements for a generated packet.
+
+    Each period/type pool is shuffled once; a replacement walks its pool 
+    from a cursor (past the questions already used) to the first question 
+    that is unused and doesn't share a verse with the quiz, so each 
+    replacement is a few array lookups.  If the pools run dry, a used 
+    question is taken and flagged as a repeat.  The packet's used state 
+    (contentPools) is shared, so replacements don't collide with the 
+    quizzes or the extra questions.
+    """
+    def __init__(self,QG):
+        self.QG=QG
+        db=QG.database
+        self.periods=list(QG.contentPools.keys())
+        self.pools=[QG.contentPools[p] for p in self.periods]
+        self.qcat=db['QCAT'].values
+        self.vidOf=db['VID'].values
+        self.columns={c:db[c].values for c in db.columns}
+        # position of each database row in each period (-1 if absent)
+        self.posOf=[]
+        for cp in self.pools:
+            pos=np.full(len(db),-1,dtype=np.int64)
+            pos[cp['rows']]=np.arange(len(cp['rows']))
+            self.posOf.append(pos)
+        # shuffled pools and their cursors (from the packet's swap stream)
+        self.rng=np.random.default_rng(np.random.SeedSequence([QG.packetSeed,SWAP_STREAM]))
+        keys=list(QG.quizDistribution.keys())
+        self.order=[[self.rng.permutation(cp['pools'][k]) for k in keys] for cp in self.pools]
+        self.cursor=[[0]*len(keys) for cp in self.pools]
+        # quizzes: database rows, question numbers and verses
+        self.rows=[];self.labels=[];self.verses=[]
+        for dfq in QG.quizzes:
+            rows=db.index.get_indexer(dfq.index)
+            mask=np.zeros(QG._nverse,dtype=bool)
+            mask[self.vidOf[rows]]=True
+            self.rows.append(rows)
+            self.labels.append({qn:i for i,qn in enumerate(dfq['qn'].values)})
+            self.verses.append(mask)
+        self.swaps=[]
+
+    def _find(self,ip,k,verses):
+        """position of an unused question of type k in period ip not 
+        sharing a verse with the quiz (or None)"""
+        cp=self.pools[ip];used=cp['used'];vid=cp['vid']
+        order=self.order[ip][k]
+        c=self.cursor[ip][k]
+        while(c<len(order) and used[order[c]]):
+            c+=1
+        self.cursor[ip][k]=c
+        for pos in order[c:]:
+            if(not used[pos] and not verses[vid[pos]]):
+                return pos
+        return None
+
+    def replace(self,qi,qn):
+        """replacement for question qn (e.g. '7' or '16A') of quiz qi 
+        (0-based); returns the new question as a dict of database columns, 
+        plus 'qn' and 'repeat'"""
+        i=self.labels[qi][str(qn)]
+        rows=self.rows[qi];verses=self.verses[qi]
+        old=rows[i]
+        k=self.qcat[old]
+        verses[self.vidOf[old]]=False
+        # try the question's own period first
+        home=[ip for ip in range(len(self.pools)) if self.posOf[ip][old]>=0]
+        tryPeriods=home+[ip for ip in range(len(self.pools)) if ip not in home]
+        repeat=False
+        for ip in tryPeriods:
+            pos=self._find(ip,k,verses)
+            if(pos is not None): break
+        else:
+            # out of fresh questions: reuse one, outside the quiz
+            ip=home[0]
+            cp=self.pools[ip];pool=self.order[ip][k]
+            ok=pool[~verses[cp['vid'][pool]] & ~np.isin(cp['rows'][pool],rows)]
+            if(len(ok)==0):
+                verses[self.vidOf[old]]=True
+                raise QuizGenerationError('no %s question can replace quiz %d, question %s'
+                                          %(list(self.QG.quizDistribution.keys())[k],qi+1,qn))
+            pos=ok[self.rng.integers(len(ok))]
+            repeat=True
+        row=self.pools[ip]['rows'][pos]
+        self.QG._used[row]=True
+        if(repeat):
+            self.QG._repeat[row]=True
+        rows[i]=row
+        verses[self.vidOf[row]]=True
+        self.swaps.append((qi,str(qn),old,row,repeat))
+        q={c:v[row] for c,v in self.columns.items()}
+        q['qn']=str(qn)
+        q['repeat']=repeat
+        if(repeat):
+            q['FLAGS']=q['FLAGS']+'R'
+        return q
+
+    def apply(self):
+        """write the replacements made so far into the quiz frames"""
+        for qi,qn,old,row,repeat in self.swaps:
+            dfq=self.QG.quizzes[qi]
+            i=int(np.where(dfq['qn'].values==qn)[0][0])
+            new=self.QG.database.iloc[[row]].copy()
+            new['used']=1
+            new['qn']=qn
+            if(repeat):
+                new['FLAGS']=new['FLAGS']+'R'
+            self.QG.quizzes[qi]=pd.concat([dfq.iloc[:i],new.reindex(columns=dfq.columns),dfq.iloc[i+1:]])
+        self.swaps=[]
+
+class ExtraPool():
+    """Lazy pool of extra questions of one type.  Questions are drawn 
+    on demand (next(pool) or pool.frame(n)) from the packet's content 
+    pools, so they never collide with questions already used in the 
+    packet; once the content is exhausted, used questions are drawn and 
+    flagged as repeats.  Periods are drawn in proportion to their 
+    fractions, and extras of a type don't share verses (while possible).
+    """
+    def __init__(self,QG,qt,seed):
+        self.QG=QG
+        self.qt=qt
+        self.k=QG._qcode(qt)
+        self.periods=list(QG.contentPools.keys())
+        self.frac=np.array([QG.quizMakeup[p]['frac'] for p in self.periods],dtype=float)
+        self.rng=np.random.Generator(np.random.MT19937(np.random.SeedSequence(seed)))
+        self.verseUsed=np.zeros(QG._nverse,dtype=bool)
+        self.drawn=np.zeros(len(self.periods),dtype=np.int64)
+        self.rows=[]
+        self.repeat=[]
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        """extras drawn so far"""
+        return len(self.rows)
+
+    def _draw(self):
+        """draw one question; returns its database row and repeat flag"""
+        # least-drawn period relative to its fraction first
+        order=np.argsort(self.drawn/np.maximum(self.frac,1e-9),kind='stable')
+        for fresh,verses in ((True,True),(True,False),(False,True),(False,False)):
+            for ip in order:
+                cp=self.QG.contentPools[self.periods[ip]]
+                pool=cp['pools'][self.qt]
+                ok=np.ones(len(pool),dtype=bool)
+                if(fresh):
+                    ok&=~cp['used'][pool]
+                if(verses):
+                    ok&=~self.verseUsed[cp['vid'][pool]]
+                cand=pool[ok]
+                if(len(cand)):
+                    pos=cand[self.rng.integers(len(cand))]
+                    self.drawn[ip]+=1
+                    self.QG._used[cp['rows'][pos]]=True
+                    if(not fresh):
+                        self.QG._repeat[cp['rows'][pos]]=True
+                    self.verseUsed[cp['vid'][pos]]=True
+                    self.QG._metrics.count('extras')
+                    if(not fresh):
+                        self.QG._metrics.count('extraRepeats')
+                    return cp['rows'][pos],not fresh
+        raise StopIteration
+
+    def __next__(self):
+        with self.QG._metrics.phase('extras'):
+            row,repeat=self._draw()
+        self.rows.append(row)
+        self.repeat.append(repeat)
+        q=self.QG.database.iloc[row].copy()
+        q['qn']=str(len(self.rows))
+        if(repeat):
+            q['FLAGS']=q['FLAGS']+'R'
+        return q
+
+    def frame(self,n=None):
+        """the first n extras (default: all drawn so far) as a 
+        dataframe, drawing more as needed"""
+        n=len(self.rows) if n is None else n
+        with self.QG._metrics.phase('extras'):
+            while(len(self.rows)<n):
+                try:
+                    row,repeat=self._draw()
+                except StopIteration:
+                    break
+                self.rows.append(row)
+                self.repeat.append(repeat)
+        rows=self.rows[:n]
+        df=self.QG.database.iloc[rows].copy()
+        df['used']=1
+        rep=np.array(self.repeat[:n],dtype=bool)
+        if(rep.any()):
+            flags=df['FLAGS'].values.copy()
+            flags[rep]=flags[rep]+'R'
+            df['FLAGS']=flags
+        df['qn']=[str(x+1) for x in range(len(rows))]
+        return df
+
+class ExtraQuestions():
+    """Extra questions of each type of a packet: pools['int'] is the 
+    lazy ExtraPool of 'int' extras, and items() gives each type's first 
+    'size' extras as a dataframe (drawing them on first access).
+    """
+    def __init__(self,QG,size):
+        self.size=size
+        self.pools={qt:ExtraPool(QG,qt,[QG.packetSeed,EXTRA_STREAM,ik])
+                    for ik,qt in enumerate(QG.quizDistribution.keys())}
+
+    def __getitem__(self,qt):
+        return self.pools[qt]
+
+    def __iter__(self):
+        return iter(self.pools)
+
+    def __len__(self):
+        return len(self.pools)
+
+    def keys(self):
+        return self.pools.keys()
+
+    def items(self):
+        for qt,pool in self.pools.items():
+            yield qt,pool.frame(max(self.size,len(pool)))
+
+def feasibilityTable(report):
+    """tabulate an analyzeFeasibility report: one row per period and 
+    question type"""
+    rows=[]
+    for period,v in report['periods'].items():
+        for qt,t in v['types'].items():
+            rows.append({'period':period,'type':qt,
+                         'available':t['available'],
+                         'perQuiz':t['perQuiz'],
+                         'quizzes':t['quizzes'],
+                         'enough':(t['quizzes'] is None or t['quizzes']>=report['nquiz'])})
+    return pd.DataFrame(rows)
+
+# stream ids (in place of the quiz number) of the extra questions' and 
+# the quiz-day replacements' seeds
+EXTRA_STREAM=2**32-1
+SWAP_STREAM=2**32-2
+
+# weights of the packet metrics when scoring candidate packets (lower 
+# scores are better)
+SCORE_WEIGHTS={'repeats':10.,       # repeated questions in the quizzes
+               'loose':5.,          # quizzes with a loosened distribution
+               'chapterSpread':1.,  # unevenness of chapter usage
+               'distribution':1.}   # distance from the expected type counts
+
+# generator shipped once to each candidate-packet worker process
+_workerQG=None
+
+def _initCandidateWorker(QG):
+    global _workerQG
+    _workerQG=QG
+
+def _candidateWorker(seed,nquiz,xtra,nquestion):
+    """generate one candidate packet in a worker process
+
+    Returns:
+        seed, metrics, error, packet (the quizzes, stats, solver report 
+            and instrumentation, for QuizGenerator._adoptPacket)
+    """
+    QG=_workerQG
+    try:
+        qd=QG.generateQuizTables(nquiz=nquiz,xtra=xtra,nquestion=nquestion,seed=seed)
+    except QuizGenerationError as e:
+        return seed,None,str(e),None
+    packet={'quizzes':qd['quizzes'],
+            'stats':qd['stats'],
+            'solver':qd['solver'],
+            'instrumentation':QG.instrumentation}
+    return seed,QG.packetMetrics(qd['quizzes'],qd['stats']),None,packet
 
 class QuizGenerator():
     def __init__(self,
@@ -165,6 +1100,8 @@ class QuizGenerator():
             qdist=None
         else:
             raise Exception('quizType is epistle/gospel/custom, not "%s"'%quizType)
+        if(quizDistribution is not None):
+            qdist=quizDistribution
 
         self.quizType=quizType.lower()
         self.quizDistribution=qdist
@@ -179,12 +1116,41 @@ class QuizGenerator():
         self.rules2013=False
         self.loose=False
         #self.allowLoose=False
+        # quiz assembly engine: 'pandas' (dataframe per pick) or 
+        # 'array' (row-index arrays, one dataframe per quiz)
+        self.engine='pandas'
+        # how the packet is solved: 'sequential' (quiz by quiz) or 
+        # 'packet' (all quizzes at once, minimizing repeats; see 
+        # packetSolver)
+        self.solver='sequential'
+        # automatic recovery when a block of questions can't be filled:
+        # first undo the last few picks of the block, then restart the 
+        # quiz with a derived seed, within the budget below
+        self.autoRecover=False
+        self.maxBacktrack=3         # picks undone per backtrack
+        self.backtrackAttempts=2    # backtracks per block
+        self.maxRestarts=5          # restarts per quiz
+        self.restartTimeout=None    # seconds per quiz (None for no limit)
+        # collect per-phase timings and pick counters of each packet 
+        # (see Instrumentation; returned by getQuizData)
+        self.instrument=False
 
         # inits
         self.quizzes=None
         self.quizStats=None
         self.extraQuestions=None
-        self.quizContent=None
+        self.contentPools=None
+        self.database=None
+        self.databaseFingerprint=None
+        self._qcatSignature=None
+        self._verseIndex=None
+        self._contentSig=None
+        self.solverReport=None
+        self.packetSeed=None
+        self._checkpoints=None
+        self._swapper=None
+        self.instrumentation=None
+        self._metrics=NO_INSTRUMENTATION
         
         # data
         # this is a dict containing the entire quiz packet data
@@ -212,34 +1178,130 @@ class QuizGenerator():
         #print(self.quizMakeup)
 
         
+    @property
+    def quizDistribution(self):
+        """the quiz distribution (an immutable Distribution; assigning a 
+        dict converts it)"""
+        return self._quizDistribution
+
+    @quizDistribution.setter
+    def quizDistribution(self,dist):
+        if(dist is not None and not isinstance(dist,Distribution)):
+            dist=Distribution(dist)
+        self._quizDistribution=dist
+
     #def setQuizType(self,quizType):
     #    self.quizType=quizType
     #    self.data['type']=quizType
     
-    def loadDatabase(self,fndatabase):
+    def loadDatabase(self,fndatabase,cache=True,cachedir=None):
+        """Load the question database.
+
+        The prepared database (after the CLUB, rename and BCV work) is 
+        cached on disk, keyed by the content hash of the spreadsheet and 
+        LOADER_VERSION, so warm loads skip the Excel parsing entirely.  
+        The cache is rebuilt whenever the spreadsheet changes.
+
+        Args:
+            fndatabase (string): filename of the Excel database
+            cache (bool): whether to use the prepared-database cache
+                (default: True)
+            cachedir (string): cache directory (default: a '.quizgen_cache' 
+                directory next to the database)
+        """
         assert os.path.exists(fndatabase),"can't find database: %s"%fndatabase
-        # fix dataframe
-        def convert_to_str(value):
-            if pd.isna(value) or value == '':
-                return ''
-            else:
-                return str(int(value))
-            
-        df=pd.read_excel(fndatabase);
-        if('FLAGS' not in df):
-            df['FLAGS']=''
-        df['FLAGS'].fillna('',inplace=True)
-        df['CLUB'] = df['CLUB'].apply(convert_to_str)
-        df['INDEX']=range(1, len(df) + 1)
-        
-        df=df.rename(columns={'BOOK':'BK',
-                              'CHAPTER':'CH',
-                              'VERSE':'VS'})
-        #df[np.isnan(df['CLUB'])==False]['CLUB'].astype(int)
-        #df['FLAGS']=''
-        #df.fillna('', inplace=True)
-        df['BCV']=df['BK']+'_'+df['CH'].astype(str)+'_'+df['VS'].astype(str)
+        digest=_fileDigest(fndatabase)
+        self.databaseFingerprint='%s-v%d'%(digest,LOADER_VERSION)
+
+        df=None
+        if(cache):
+            fncache=_cacheFilename(fndatabase,digest,cachedir)
+            try:
+                df=_readCache(fncache)
+            except Exception as e:
+                logger.warning('could not read database cache (%s); rebuilding',e)
+                df=None
+            if(df is not None):
+                logger.info('database loaded from cache: %s',fncache)
+        if(df is None):
+            df=pd.read_excel(fndatabase);
+            df=_prepareDatabase(df)
+            if(cache):
+                try:
+                    fn=_writeCache(df,fncache)
+                    logger.info('database cached: %s',fn)
+                except OSError as e:
+                    logger.warning('could not write database cache (%s)',e)
+        self.setDatabase(df,fingerprint=self.databaseFingerprint)
+
+    def saveSnapshot(self,fn):
+        """Save the prepared generator (database, category codes, verse 
+        index and content pools) so a later run can start from it (see 
+        fromSnapshot) instead of reading the database."""
+        if(self._contentStale()):
+            self._getContent()
+        state={k:getattr(self,k) for k in SNAPSHOT_ATTRS}
+        with open(fn,'wb') as f:
+            pickle.dump({'version':(SNAPSHOT_VERSION,LOADER_VERSION),'state':state},f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def fromSnapshot(cls,fn):
+        """A generator restored from saveSnapshot"""
+        with open(fn,'rb') as f:
+            snap=pickle.load(f)
+        if(snap.get('version')!=(SNAPSHOT_VERSION,LOADER_VERSION)):
+            raise Exception('snapshot %s is from another version (%s); rebuild it'%(fn,str(snap.get('version'))))
+        state=snap['state']
+        QG=cls(quizType=state['quizType'])
+        for k,v in state.items():
+            setattr(QG,k,v)
+        return QG
+
+    def setDatabase(self,df,fingerprint=None,verseIndex=None):
+        """Use an already prepared database (e.g. one loaded once and 
+        shared by several generators).
+
+        Args:
+            df (DataFrame): prepared database (see loadDatabase)
+            fingerprint (string): databaseFingerprint of df, which enables 
+                the shared content cache (None to disable it)
+            verseIndex (VerseIndex): df's verse index, if already built
+        """
         self.database=df
+        self.databaseFingerprint=fingerprint
+        self._verseIndex=verseIndex if verseIndex is not None else VerseIndex(df)
+        self._qcatSignature=None
+        self.contentPools=None
+        self._categorize()
+
+    def _categorize(self):
+        """(re)compute the database's QCAT category codes for the active 
+        quizDistribution.  This is a no-op unless the distribution's 
+        categories have changed since the last call.
+        """
+        if(self.database is None or self.quizDistribution is None):
+            return
+        sig=self.quizDistribution.compiled().categories
+        if(sig==self._qcatSignature and 'QCAT' in self.database):
+            return
+        # (on a shallow copy: the database frame may be shared with other 
+        # generators, coded against their own distributions)
+        df=self.database.copy(deep=False)
+        df['QCAT']=categorizeTypes(df['TYPE'],self.quizDistribution)
+        self.database=df
+        self._qcatSignature=sig
+        if(self.contentPools is not None):
+            # content was coded against another distribution
+            self.contentPools=None
+
+    def _newVerseMask(self):
+        """an empty boolean mask over verse ids (VID)"""
+        return np.zeros(self._nverse,dtype=bool)
+
+    def _qcode(self,qt):
+        """category code of question type qt"""
+        return self.quizDistribution.compiled().code[qt]
         
     def getQuizData(self):
         
@@ -247,9 +1309,12 @@ class QuizGenerator():
                 'distribution':self.quizDistribution,
                 'quizzes':self.quizzes,
                 'extraQuestions':self.extraQuestions,
-                'stats':self.quizStats}
+                'stats':self.quizStats,
+                'instrumentation':None if self.instrumentation is None else self.instrumentation.asDict(),
+                'solver':self.solverReport}
     
     def __repr__(self):
+        import pprint
         msg="""QuizGenerator instance
 
     Quiz Type: {quizType}
@@ -265,7 +1330,7 @@ class QuizGenerator():
 
     
         """.format(quizType=self.quizType,nquiz=self.nquiz,
-                    qdist=pprint.pformat(self.quizDistribution,width=60),
+                    qdist=pprint.pformat(None if self.quizDistribution is None else self.quizDistribution.asDict(),width=60),
                     qmakeup=pprint.pformat(self.quizMakeup,width=30),
                     verbose=self.verbose,
                     scramblePeriod=self.scramblePeriod)
@@ -287,78 +1352,292 @@ class QuizGenerator():
         books & verses.  If a particular question type (e.g. FT) 
         has a limit assigned (e.g. 150), then the CLUB is used 
         to restrict those questions.
+
+        This builds contentPools, a dict of arrays for each period (the 
+        period's questions are not copied out of the database; see 
+        quizContent):
+            rows  - database row positions of the period's questions
+            pools - dict of positions (into the period's content) of 
+                    each question type
+            vid   - verse id of each of the period's questions
+            used  - "used" bitmask of the period's questions, a MaskView 
+                    of the generator's one used mask over the database 
+                    (so overlapping periods share their questions' flags)
+
+        Selections are kept in a module-level LRU cache (see 
+        CONTENT_CACHE_MAX_ENTRIES/BYTES), so generators over the same 
+        database and content share them; everything but the used masks 
+        is shared and must be treated as read-only.
         """
+        self._categorize()
         df=self.database
-        logger.info('database: %d questions'%len(df))
+        logger.info('database: %d questions',len(df))
+        self._nverse=int(df['VID'].max())+1 if len(df) else 0
         
-        dfq=df.copy();
-        dfq['bcvf']=df['CH']+df['VS']/1000
+        logger.info('quizMakeup: %s',self.quizMakeup)
         
-        logger.info('quizMakeup:'+str(self.quizMakeup))
-        
-        Q={}
+        if(self._verseIndex is None):
+            self._verseIndex=VerseIndex(df)
+        # used/repeat bitmasks over the database, shared by the periods
+        self._used=np.zeros(len(df),dtype=bool)
+        self._repeat=np.zeros(len(df),dtype=bool)
+        P={}
         for period,v in self.quizMakeup.items():
-            frames=[]
-            #for bk,ch,grp in v['content']:
-            
-            #print('period:',period,' content:',v['content'])
+            key=self._contentKey(v['content'])
+            sel=_contentCacheGet(key) if key is not None else None
+            if(sel is None):
+                sel=self._selectContent(period,v['content'])
+                if(key is not None):
+                    _contentCachePut(key,sel)
+            else:
+                logger.info('period %s: content from cache',period)
+            rows,pools,vid=sel
+            # the selection is shared (read-only); the used mask is ours
+            P[period]={'rows':rows,
+                       'pools':pools,
+                       'vid':vid,
+                       'used':MaskView(self._used,rows)}
+
+        self.contentPools=P
+        self._contentSig=(_freeze(self.quizMakeup),self._filterSignature())
+    
+    def _contentKey(self,content):
+        """key of a period's content selection in the shared cache: the 
+        database, its categories, the intervals and the per-type 
+        limit/set filters (None if the database has no fingerprint)"""
+        if(self.databaseFingerprint is None):
+            return None
+        return (self.databaseFingerprint,self._qcatSignature,_freeze(content),self._filterSignature())
+
+    def _filterSignature(self):
+        """the per-type limit/set filters of the distribution"""
+        return self.quizDistribution.compiled().filters
+
+    @property
+    def quizContent(self):
+        """the questions of each period, as dataframes taken from the 
+        database on access (only their row positions are kept, in 
+        contentPools); None until the content is built"""
+        if(self.contentPools is None):
+            return None
+        return {period:self.database.iloc[cp['rows']] for period,cp in self.contentPools.items()}
+
+    def _contentStale(self):
+        """whether the content must be (re)built: not built yet, or the 
+        quizMakeup or filters changed since"""
+        if(self.contentPools is None):
+            return True
+        return self._contentSig!=(_freeze(self.quizMakeup),self._filterSignature())
+
+    def _selectContent(self,period,content):
+        """select a period's content from the database.  content is a 
+        list of intervals ((book,ch,vs),(book,ch,vs)), which may span 
+        books, and/or reference strings (see parseReference)
+
+        Returns:
+            rows (array): database row positions of the period's 
+                questions, grouped by type
+            pools (dict): positions (into rows) of each question type
+            vid (array): their verse ids
+        """
+        df=self.database
+        qcatAll=df['QCAT'].values
+        selected=[]
+        pools={k:[np.zeros(0,dtype=np.int64)] for k in self.quizDistribution.keys()}
+        offset=0
+        if(isinstance(content,str)):
+            content=[content]
+        intervals=[]
+        for c in content:
+            intervals+=parseReference(c) if isinstance(c,str) else [c]
+        for bcvint in intervals:
+            idx=self._verseIndex.select(bcvint[0],bcvint[1])
+            qcat=qcatAll[idx]
+            for ik,(k,dv) in enumerate(self.quizDistribution.items()):
+                #
+                # get type of question
+                #
+                f=idx[qcat==ik]
+                nrows1=len(f)
+                logger.info('period %s: found %d %s questions',period,nrows1,k)
                 
-            #for bk,ch in v['content']:
-            for bcvint in v['content']:
-                bk=bcvint[0][0]
-                bcvstart=bcvint[0][1]+bcvint[0][2]/1000
-                bcvend=bcvint[1][1]+bcvint[1][2]/1000
+                # limit or set
+                if('limit' in dv):
+                    f=f[df['CLUB'].iloc[f].isin(dv['limit']).values]
+                if('set' in dv):
+                    f=f[df['SET'].iloc[f].isin(dv['set']).values]
+                nrows2=len(f)
+                logger.info('... %d left after club,set',nrows2)
                 
-                #print('%s: book %s, ch %s'%(period,bk,str(ch)))
-                #df1=df[(df['BK']==bk) & df['CH'].isin(ch)]
-                df1=dfq[(dfq['BK']==bk) & (dfq['bcvf']>=bcvstart)&(dfq['bcvf']<=bcvend)]
-
-                #if(len(grp)):
-                #    df1=df1[df1['CLUB'].isin(grp)]
-                F=[]
-                for k,dv in self.quizDistribution.items():
-                    #
-                    # get type of question
-                    #
-                    if(k=='sit'):
-                        # situational
-                        #print(dir(df1['TYPE'].str.lower().str))
-                        f=df1[df1['TYPE'].str.lower().str.startswith(k)]
-                    else:
-                        # all other kinds of questions
-                        f=df1[df1['TYPE'].str.lower().isin(dv['types'])]
-                    nrows1=f.shape[0]
-                    logger.info('period %s: found %d %s questions'%(period,nrows1,k))
-                    
-                    # limit or set
-                    if('limit' in dv):
-                        #f=f[f['GROUP'].isin(dv['limit'])]
-                        assert isinstance(dv['limit'][0],str),"limits should be strings (e.g. '150')"
-                        f=f[f['CLUB'].isin(dv['limit'])]
-                    if('set' in dv):
-                        f=f[f['SET'].isin(dv['set'])]
-                    nrows2=f.shape[0]
-                    logger.info('... %d left after club,set'%nrows2)
-                    
-                    if(nrows2==0):
-                        #raise Exception('Ack!  %d/%d %s questions in %s content.'%(nrows2,nrows1,k,period))
-                        msg='Warning: "%s" has %d %s question(s); %d pass limits.  ' \
-                            'This may result in having to regenerate quizzes.'%(period,nrows1,k,nrows2)
-                        logger.warning(msg)
-                        #print(msg)
-                        
-                    
-                    F.append(f)
-                df1=pd.concat(F)
+                if(nrows2==0):
+                    logger.warning('Warning: "%s" has %d %s question(s); %d pass limits.  '
+                                   'This may result in having to regenerate quizzes.',period,nrows1,k,nrows2)
                 
-                frames.append(df1)
-            Q[period]=pd.concat(frames)
+                selected.append(f)
+                pools[k].append(np.arange(offset,offset+nrows2))
+                offset+=nrows2
+        rows=np.concatenate(selected) if selected else np.zeros(0,dtype=np.int64)
+        pools={k:np.concatenate(v) for k,v in pools.items()}
+        return rows,pools,df['VID'].values[rows]
+
+    def _blockSizes(self,nquestion=30):
+        """questions picked from each period per quiz, as genQuiz picks 
+        them: {period:(1-20 block, 16AB-20AB block, expected overtime)}"""
+        custom=(self.quizType=='custom')
+        nq2=10 if not custom else nquestion-20
+        nq3=3 if not custom else 0
+        sizes={}
+        n2tot=0
+        for period,v in self.quizMakeup.items():
+            n2=min(int(nq2*v['frac']+1),nq2-n2tot)
+            n2tot+=n2
+            sizes[period]=(int(20*v['frac']),n2,nq3*v['frac'])
+        return sizes
+
+    def _expectedTypeCounts(self,n):
+        """expected questions of each type in n questions: the minimums, 
+        with the rest spread in proportion to the room left before the 
+        maximums (capped at the maximums)"""
+        mins,maxs=self._compileDistribution()
+        e=mins.astype(float)
+        for it in range(len(e)):
+            left=n-e.sum()
+            room=maxs-e
+            if(left<=0 or room.sum()<=0): break
+            e=np.minimum(maxs,e+left*room/room.sum())
+        return e
+
+    def analyzeFeasibility(self,nquiz=None,nquestion=30):
+        """Fast check of whether the content can fill the requested 
+        quizzes, from the content pools and distribution ranges (no 
+        questions are picked).
+
+        For each period and question type, this reports the questions 
+        available (after limit/set filters), the expected questions drawn 
+        per quiz, and how many quizzes can be filled before repeats.  
+        Combinations that cannot be satisfied are listed in 'problems'; 
+        ones that will likely lead to repeats or regeneration are listed 
+        in 'warnings'.
+
+        Args:
+            nquiz (int): number of quizzes (default: self.nquiz)
+            nquestion (int): number of questions per quiz
+        Returns:
+            dict with keys 'feasible', 'nquiz', 'quizzes' (quizzes 
+            without repeats), 'periods', 'problems' and 'warnings'
+        """
+        if(nquiz is None):
+            nquiz=self.nquiz
+        if(self._contentStale()):
+            self._getContent()
+        keys=list(self.quizDistribution.keys())
+        mins,maxs=self._compileDistribution()
+        custom=(self.quizType=='custom')
+        nq12=nquestion if custom else 30
+        sizes=self._blockSizes(nquestion)
+        problems=[];warnings=[]
+
+        #
+        # distribution vs quiz size
+        #
+        if(mins.sum()>20 and not custom):
+            problems.append('minimums add up to %d, more than the 20 numbered questions'%mins.sum())
+        if(maxs.sum()<nq12):
+            problems.append('maximums add up to %d, fewer than the %d questions in a quiz'%(maxs.sum(),nq12))
+        if(not custom and len(keys)<3):
+            problems.append('overtime needs 3 different question types')
+
+        # expected questions of each type per quiz
+        etype=self._expectedTypeCounts(nq12)
+        if(not custom):
+            etype=etype+3/len(keys)
+
+        avail=np.array([[len(self.contentPools[p]['pools'][k]) for k in keys] for p in sizes.keys()])
+        periods={}
+        for ip,(period,(n1,n2,n3)) in enumerate(sizes.items()):
+            frac=self.quizMakeup[period]['frac']
+            demand=etype*frac
+            per=avail[ip]
+            with np.errstate(divide='ignore'):
+                nfit=np.where(demand>0,np.floor(per/np.maximum(demand,1e-12)),np.inf)
+            ntot=n1+n2+n3
+            periods[period]={'questions':int(per.sum()),
+                             'verses':len(np.unique(self.contentPools[period]['vid'])),
+                             'perQuiz':ntot,
+                             'quizzes':int(min(nfit.min(),per.sum()//max(ntot,1e-12))) if ntot else None,
+                             'types':{k:{'available':int(per[ik]),
+                                         'perQuiz':round(float(demand[ik]),2),
+                                         'quizzes':(int(nfit[ik]) if np.isfinite(nfit[ik]) else None)}
+                                      for ik,k in enumerate(keys)}}
+            # a block must be fillable from the types this period has
+            room=maxs[per>0].sum()
+            if(room<n1):
+                problems.append('"%s": only %s question types, with maximums adding up to %d, '
+                                'for a block of %d questions'%(period,[k for k,n in zip(keys,per) if n],room,n1))
+            for ik,k in enumerate(keys):
+                if(per[ik]==0):
+                    warnings.append('"%s" has no %s questions (after limit/set filters)'%(period,k))
+            if(periods[period]['quizzes'] is not None and periods[period]['quizzes']<nquiz):
+                warnings.append('"%s": about %d quiz(zes) can be filled without repeats, %d requested'
+                                %(period,periods[period]['quizzes'],nquiz))
+
+        # every type with a minimum must exist somewhere
+        for ik,k in enumerate(keys):
+            if(mins[ik]>0 and avail[:,ik].sum()==0):
+                problems.append('no %s questions in any period, but the minimum is %d'%(k,mins[ik]))
+
+        quizzes=[v['quizzes'] for v in periods.values() if v['quizzes'] is not None]
+        report={'feasible':len(problems)==0,
+                'nquiz':nquiz,
+                'quizzes':min(quizzes) if len(quizzes) else 0,
+                'periods':periods,
+                'problems':problems,
+                'warnings':warnings}
+        for msg in problems:
+            logger.error('feasibility: %s',msg)
+        for msg in warnings:
+            logger.warning('feasibility: %s',msg)
+        return report
+
+    def _compileDistribution(self):
+        """min/max vectors of the quiz distribution, indexed by category 
+        code (compiled once per distinct distribution, and shared)
+        """
+        c=self.quizDistribution.compiled()
+        return c.mins,c.maxs
+
+    def _typeCounts(self,dfquiz,otherQuestionCounts=None):
+        """vector of question-type counts of a quiz dataframe, plus any 
+        counts from previous blocks"""
+        counts=np.array(list(countTypes(dfquiz,self.quizDistribution).values()),dtype=np.int64)
+        if(otherQuestionCounts is not None):
+            counts+=np.array([otherQuestionCounts[k] for k in self.quizDistribution.keys()])
+        return counts
+
+    def _typeWeights(self,counts,loosenDistribution=False):
+        """probability of picking each question type given the current 
+        counts (a vector indexed by category code)
+
+        If the minimum of any type is not met, the weights are the 
+        questions remaining to satisfy the minimums; otherwise they are 
+        the questions left before the maximums.  Returns None if no type 
+        has room left.
+        """
+        mins,maxs=self._compileDistribution()
+        # loosening ignores minimums.  May need to do this if the content 
+        # is small enough
+        minmet=loosenDistribution or bool(np.all(counts>=mins))
+        n0=np.maximum(0,(maxs if minmet else mins)-counts)
+        tot=n0.sum()
+        if(tot==0):
+            return None
+        return n0/tot
 
-        self.quizContent=Q
-    
     def pickQuestionType(self,dfquiz,dfremaining,qtype,
                          otherQuestionCounts=None,
-                         loosenDistribution=False):
+                         loosenDistribution=False,
+                         counts=None,
+                         rng=None):
         """determine question type (if not specified)
         param:
             dfquiz - current quiz dataframe
@@ -369,65 +1648,32 @@ class QuizGenerator():
             loosenDistribution  - whether we allow distribution to drop
                                   (e.g. practice where we'd rather have 
                                    diversity than repeats)
+            counts      - running vector of type counts (including 
+                          otherQuestionCounts), indexed by category code.
+                          If None, this is counted from dfquiz.
+            rng         - numpy Generator to draw from (default: a 
+                          freshly seeded one)
         returns:
-            qtpick  - picked question type
+            qtpick  - picked question type (None if no type has room)
             nq      - questions in quiz
         """
+        if(rng is None):
+            rng=np.random.default_rng()
         if(qtype==None):
             nq=dfquiz.shape[0]
+            if(counts is None):
+                counts=self._typeCounts(dfquiz,otherQuestionCounts)
 
-            # assume minimum distribution has been met
-            minmet=True
-            # get type counts
-            tcount=countTypes(dfquiz,self.quizDistribution)
-            for qt,qdata in self.quizDistribution.items():
-                # if questionCounts provided, add these to the current counts
-                if(otherQuestionCounts!=None):
-                    tcount[qt]+=otherQuestionCounts[qt]
-                # if the count is less than the minimum, then the minmet flag is False
-                if(tcount[qt]<qdata['range'][0]): minmet=False
-            
-            logger.debug('minimum met: %r'%minmet)
-            
-            if(loosenDistribution):
-                # ignore minimums.  May need to do this if the content is
-                # small enough
-                minmet=True
-            
-            # calc prob of picking each type
-            keys=list(self.quizDistribution.keys())
-            n2satisfy=[]
-            #typeRemaining={}
-            for qt in keys:
-                qdata=self.quizDistribution[qt]
-                if(minmet):
-                    # if minimum has been met, then prob proportional to num left before max
-                    v=qdata['range'][1]-tcount[qt]
-                else:
-                    # if minimum is not met, then weights determined from questions remaining
-                    # yet to be filled to satisfy the minimum
-                    v=qdata['range'][0]-tcount[qt]
-                n2satisfy.append(v)
-                
-            if(minmet):
-                logger.debug('maxs: %s'%str([self.quizDistribution[k]['range'][1] for k in keys]))
-            else:
-                logger.debug('mins: %s'%str([self.quizDistribution[k]['range'][0] for k in keys]))
-            typeRequirements=dict(zip(keys,n2satisfy))
-            logger.debug('requirements: %s'%str(typeRequirements))
-            logger.debug('current count: %s'%str(tcount))
-            
             # calc weights
-            n0=np.maximum(0,n2satisfy)
-            weight=[x/sum(n0) for x in n0]
-            msg='weight: %s'%str(dict(zip(keys,[round(x,2) for x in weight])))
-            logger.debug(msg)
-            
-            if(np.any(np.isnan(weight))):
-                print('wait!')
+            weight=self._typeWeights(counts,loosenDistribution)
+            logger.debug('current count: %s, weight: %s',counts,weight)
+            if(weight is None):
+                logger.debug('no question type has room left in the distribution')
+                return None,nq
             
             # get the question type
-            qtpick=np.random.choice(keys,p=weight)
+            keys=list(self.quizDistribution.keys())
+            qtpick=keys[rng.choice(len(keys),p=weight)]
         elif(qtype=='any'):
             # pick any (e.g. 16AB-20AB)
             df=dfremaining[dfremaining['used']==0]
@@ -435,10 +1681,10 @@ class QuizGenerator():
             n=list(tcount.values())
             weight=[x/sum(n) for x in n]
             keys=list(tcount.keys())
-            qtpick=np.random.choice(keys,p=weight)
+            qtpick=rng.choice(keys,p=weight)
             
             #a=df['TYPE'].value_counts()
-            logger.info('qtype:any, count: %s'%str(tcount))
+            logger.info('qtype:any, count: %s',tcount)
             #1/0
             nq=0
         else:
@@ -448,37 +1694,56 @@ class QuizGenerator():
     def pickQuestion(self,dfquiz,dfremaining,qtype=None,
                      otherBCV=None,
                      otherQuestionCounts=None,
-                     loosenDistribution=False):
+                     loosenDistribution=False,
+                     period=None,
+                     counts=None,
+                     verseMask=None,
+                     rng=None):
         """Pick a question given the current distribution and remaining 
         questions.
 
         Args:
             dfquiz (dataframe): the current quiz's dataframe
-            dfremaining (dataframe): the remaining unpicked questions
+            dfremaining (dataframe): the remaining unpicked questions 
+                (not used if period is given)
             qtype (string): a specified question-draw type (e.g. for extra 
                 questions); default: None
             otherBCV (list): a list of BCVs to exclude
             otherQuestionCounts (dict): a dict of counts of each question type
             loosenDistribution (bool): flag whether to remove minimums
+            period (string): the period to draw from.  If given, the 
+                question is drawn from that period's type pool in 
+                contentPools rather than by filtering dfremaining.
+            counts (array): running vector of type counts (see 
+                pickQuestionType); updated in place when a question is 
+                picked.
+            verseMask (array): boolean mask, indexed by verse id (VID), of 
+                the verses already in the quiz.  If given, this replaces 
+                the BCV lookups of dfquiz/otherBCV, and the picked verse 
+                is added to it.
+            rng (Generator): numpy random generator to draw from (default: 
+                a freshly seeded one)
         Returns:
             dfquiz
             dfremaining
         """
-        # initialize question counts
-        if(otherQuestionCounts==None):
-            #tcount=self._countTypes(dfquiz)
-            tcount=countTypes(dfquiz,self.quizDistribution)
-        else:
-            tcount=otherQuestionCounts
-
+        M=self._metrics
+        M.count('pickAttempts')
+        if(rng is None):
+            rng=np.random.default_rng()
         # 
         # determine question type (if not specified)
         #
         if((qtype is None) or (qtype=='any')):
             qtpick,nq=self.pickQuestionType(dfquiz,dfremaining,qtype,
                                             otherQuestionCounts=otherQuestionCounts,
-                                            loosenDistribution=loosenDistribution)
-            logger.debug('Picked %s'%qtpick)
+                                            loosenDistribution=loosenDistribution,
+                                            counts=counts,
+                                            rng=rng)
+            if(qtpick is None):
+                M.count('noRoom')
+                return dfquiz,dfremaining
+            logger.debug('Picked %s',qtpick)
         else:
             nq=0
             qtpick=qtype
@@ -486,129 +1751,267 @@ class QuizGenerator():
         #
         # get all the questions of this type
         #
-        qdata=self.quizDistribution[qtpick]
-        dftype=dfremaining[dfremaining['TYPE'].str.lower().isin(qdata['types'])]
-        kqt=np.where(dftype.index)[0]
+        if(period is not None):
+            # pool of this type, narrowed at content time; the exclusions 
+            # work on its index arrays, and only the picked row is taken 
+            # from the database
+            cp=self.contentPools[period]
+            pool=cp['pools'][qtpick]
+            rows=cp['rows'][pool]
+            used=cp['used'][pool]
+            vid=cp['vid'][pool]
+        else:
+            pool=None
+            dftype=dfremaining[dfremaining['QCAT'].values==self._qcode(qtpick)]
+            used=dftype['used'].values!=0
+            vid=dftype['VID'].values
+        kqt=np.arange(len(vid))
         repeat=False
         # if there is a question in the quiz, exclude book-chapter-verses that are already in the quiz
-        if(nq):
-            uv=dfquiz['BCV'].unique().tolist()
-            if(otherBCV!=None):
-                uv.extend(otherBCV)
+        # (with a verse mask this includes overtime picks, which used to 
+        # be drawn from every question of the type)
+        if(nq or (verseMask is not None)):
+            if(verseMask is not None):
+                inQuizVerse=verseMask[vid]
+            else:
+                uv=dfquiz['BCV'].unique().tolist()
+                if(otherBCV!=None):
+                    uv.extend(otherBCV)
+                bcv=dftype['BCV'] if pool is None else self.database['BCV'].iloc[rows]
+                inQuizVerse=bcv.isin(uv).values
                 
             # find unused questions of this type and NOT same book-chapter verse
-            kqt=np.where(~dftype['BCV'].isin(uv) & (dftype['used']==0))[0]
+            kqt=np.where(~inQuizVerse & ~used)[0]
             if(len(kqt)==0):
-                logger.warning('No unused %s questions left whose book-chapter-verse not already in quiz.'%qtpick)
+                logger.warning('No unused %s questions left whose book-chapter-verse not already in quiz.',qtpick)
                 # if(loosenDistribution==False):
-                #     logger.debug('%s: loosenCount==False.  Returning.'%qtpick)
+                #     logger.debug('%s: loosenCount==False.  Returning.',qtpick)
                 #     return dfquiz,dfremaining
                 
                 # if none, allow repeats but not same book-chapter-verses
                 repeat=True
-                kqt=np.where(~dftype['BCV'].isin(uv))[0]
-                dft=dftype.iloc[kqt]
                 # drop questions that have already been used THIS quiz
-                uv=dfquiz.index.unique()
-                kqt=np.where(~dft.index.isin(uv))[0]
+                if(not len(dfquiz)):
+                    inQuiz=np.zeros(len(vid),dtype=bool)
+                elif(pool is None):
+                    inQuiz=dftype.index.isin(dfquiz.index)
+                else:
+                    inQuiz=np.isin(rows,self.database.index.get_indexer(dfquiz.index))
+                kqt=np.where(~inQuizVerse & ~inQuiz)[0]
         
                 if(len(kqt)):
-                    logger.info('%s questions w/repeats, but not in the same book-chapter-verse as another question: %d'%(qtpick,len(kqt)))
+                    M.count('tierRepeat')
+                    logger.info('%s questions w/repeats, but not in the same book-chapter-verse as another question: %d',qtpick,len(kqt))
                 else:
                     # if STILL no questions, then relax the B-C-V
                     # pick among all remaining questions of this type
-                    kqt=np.where(dftype.index)[0]
-                    logger.warning('%s questions w/repeats, including existing book-chapter-verse s: %d'%(qtpick,len(kqt)))
+                    M.count('tierVerse')
+                    kqt=np.arange(len(vid))
+                    logger.warning('%s questions w/repeats, including existing book-chapter-verse s: %d',qtpick,len(kqt))
             else:
-                logger.debug('found %d unused %s question whose book-chapter-verse not already in quiz'%(len(kqt),qtpick))
+                logger.debug('found %d unused %s question whose book-chapter-verse not already in quiz',len(kqt),qtpick)
         
-        dtype=dftype.iloc[kqt]
         # grab one question
-        if(len(dtype)==0):
-            msg='No %s questions survived this pick because of exclusions.'%qtpick
-            logger.debug(msg)
+        if(len(kqt)==0):
+            logger.debug('No %s questions survived this pick because of exclusions.',qtpick)
+            M.count('excluded')
             return dfquiz,dfremaining
-        q=dtype.sample(n=1)
+        k=kqt[rng.integers(len(kqt))]
+        if(pool is None):
+            q=dftype.iloc[[k]].copy()
+        else:
+            q=self.database.iloc[[rows[k]]].copy()
 
-        
-        
         q['used']=1
         if(repeat):
-            try:
-                q['FLAGS']+='R'
-            except:
-                print('acj?')
+            q['FLAGS']=q['FLAGS']+'R'
         row=q.iloc[0]
-        logger.info('Picked %s from %s'%(qtpick,row['BCV']))
+        logger.info('Picked %s from %s',qtpick,row['BCV'])
 
         # add to current quiz
         dfquiz=pd.concat([dfquiz,q])
 
         # set this question to 'used'
         #dfremaining.drop(q.index,inplace=True)
-        dfremaining.at[q.index,'used']=1
+        if(pool is not None):
+            # (in the shared used mask over the database)
+            cp['used'][pool[k]]=True
+            if(repeat):
+                self._repeat[rows[k]]=True
+        else:
+            dfremaining.loc[q.index,'used']=1
+        if(verseMask is not None):
+            verseMask[vid[k]]=True
+        if(counts is not None):
+            counts[self._qcode(qtpick)]+=1
+        M.count('picks')
 
         return dfquiz,dfremaining
     
     
     def pickQuestionBlock(self,dfremaining,nq,Q1,
                           usedVerses,
-                          otherQuestionCounts=None):
-        """pick a block of questions from a period"""
-        logger.info('pick %d questions for this block'%nq)
+                          otherQuestionCounts=None,
+                          period=None,
+                          verseMask=None,
+                          rng=None):
+        """pick a block of questions from a period (dfremaining is not 
+        used if period is given), drawing from the numpy Generator rng 
+        (see pickQuestion)"""
+        logger.info('pick %d questions for this block',nq)
         loosened=False
         initNum=len(Q1)
+        # running type counts, updated by each pick
+        counts=self._typeCounts(Q1,otherQuestionCounts)
         iter=0
+        backtracks=0
         while((len(Q1)-initNum)<nq):
             iter+=1
             if(iter>(3*nq)):
-                msg='Cannot seem to generate enough 1-20 questions to meet distribution.  ' \
-                    'This may be because too few chapters in one of the periods.  Consider ' \
-                    'rerunning to get a different set or changing chapter ranges.'
-                raise Exception(msg)
+                if(self.autoRecover and backtracks<self.backtrackAttempts and len(Q1)>initNum):
+                    backtracks+=1
+                    Q1=self._backtrackBlock(Q1,dfremaining,initNum,counts,
+                                            period=period,verseMask=verseMask)
+                    iter=0
+                    continue
+                raise QuizGenerationError(BLOCK_FAIL_MSG)
             nq_old=len(Q1)
             
-            logger.info('current num questions: %d (remaining: %d)'%(nq_old,len(dfremaining)))
+            logger.info('current num questions: %d',nq_old)
             #usedVerses=[]
             Q1,dfremaining=self.pickQuestion(Q1,dfremaining,
                                              otherBCV=usedVerses,
-                                             otherQuestionCounts=otherQuestionCounts)
+                                             period=period,
+                                             counts=counts,
+                                             verseMask=verseMask,
+                                             rng=rng)
             if(len(Q1)==nq_old):
                 if((iter>(2*nq)) and (self.loose==True)):
                     
                     if(loosened==False):
                         loosened=True
-                        logger.warning('***: Q%d, ALLOWING LOOSENING OF DISTRIBUTION COUNTS'%nq_old)
+                        self._metrics.count('loosened')
+                        logger.warning('***: Q%d, ALLOWING LOOSENING OF DISTRIBUTION COUNTS',nq_old)
+                    self._metrics.count('loosePicks')
                     Q1,dfremaining=self.pickQuestion(Q1,dfremaining,
                                                      otherBCV=usedVerses,
                                                      loosenDistribution=True,
-                                                     otherQuestionCounts=otherQuestionCounts)
+                                                     period=period,
+                                                     counts=counts,
+                                                     verseMask=verseMask,
+                                                     rng=rng)
             
             #usedVerses=Q1['BCV'].unique().tolist()
-            logger.info('Questions block: %d questions (iter: %d)'%(len(Q1),iter))
+            logger.info('Questions block: %d questions (iter: %d)',len(Q1),iter)
             
-            #logger.debug('Questions 16AB-20AB: %d questions (iter: %d)'%(len(Q2),iter))
+            #logger.debug('Questions 16AB-20AB: %d questions (iter: %d)',len(Q2),iter)
             if((len(Q1)-initNum)>=nq): break
 
         if(self.verbose):
             # show the distribution for each question type
             #for qt,cnt in self._countTypes(Q1).items():
             for qt,cnt in countTypes(Q1,self.quizDistribution).items():
-                rng=self.quizDistribution[qt]['range']
-                #print('%s: %d (min: %d, max: %d)'%(qt,cnt,rng[0],rng[1]))
-                print('question %s: %d questions (%d remaining)'%(qt,Q1.shape[0],dfremaining.shape[0]))
+                qrange=self.quizDistribution[qt]['range']
+                #print('%s: %d (min: %d, max: %d)'%(qt,cnt,qrange[0],qrange[1]))
+                print('question %s: %d questions'%(qt,Q1.shape[0]))
         return Q1,loosened
 
-    def genQuiz(self,C,nquestion=30):
+    def _backtrackBlock(self,Q1,dfremaining,initNum,counts,period=None,verseMask=None):
+        """undo the last few picks (at most maxBacktrack) of the block 
+        started at initNum.  Questions that were not repeats are 
+        returned to the unused pool.
+
+        Returns:
+            Q1
+        """
+        k=min(self.maxBacktrack,len(Q1)-initNum)
+        self._backtracks+=1
+        self._metrics.count('backtracks')
+        logger.warning('backtracking %d pick(s)',k)
+        drop=Q1.iloc[len(Q1)-k:]
+        Q1=Q1.iloc[:len(Q1)-k]
+        for qcat in drop['QCAT'].values:
+            counts[qcat]-=1
+        release=drop.index[~drop['FLAGS'].str.contains('R').values]
+        if(period is not None):
+            cp=self.contentPools[period]
+            cp['used'][np.isin(cp['rows'],self.database.index.get_indexer(release))]=False
+        else:
+            dfremaining.loc[dfremaining.index.isin(release),'used']=0
+        if(verseMask is not None):
+            verseMask[drop['VID'].values]=False
+            verseMask[Q1['VID'].values]=True
+        return Q1
+
+    def _snapshotPacket(self,C):
+        """compact (bit-packed) copy of the packet's used state, for 
+        restarting or regenerating a quiz"""
+        return {'used':np.packbits(self._used),'repeat':np.packbits(self._repeat)}
+
+    def _restorePacket(self,C,snap):
+        """restore the packet's used state from _snapshotPacket"""
+        n=len(self._used)
+        self._used[:]=np.unpackbits(snap['used'],count=n).astype(bool)
+        self._repeat[:]=np.unpackbits(snap['repeat'],count=n).astype(bool)
+
+    def _markUsed(self,C,dfq):
+        """mark the questions of quiz dfq as used in the packet"""
+        self._used[self.database.index.get_indexer(dfq.index)]=True
+
+    def _quizRng(self,qi,attempt=0):
+        """random generator of quiz qi: seeded from the packet seed, the 
+        quiz, the restart attempt and the number of times the quiz has 
+        been regenerated"""
+        ss=np.random.SeedSequence([self.packetSeed,qi,attempt,self._quizVersions[qi]])
+        return np.random.default_rng(ss)
+
+    def _genQuizRecover(self,C,qi,nquestion=30,snap=None):
+        """genQuiz of quiz qi, from its own random generator (see 
+        _quizRng), with automatic restarts (see autoRecover).  Each 
+        restart restores the packet's used state from before the quiz 
+        (snap, if already taken) and draws from the generator of the 
+        attempt.
+        """
+        if(not self.autoRecover):
+            return self.genQuiz(C,nquestion=nquestion,rng=self._quizRng(qi))
+        if(snap is None):
+            snap=self._snapshotPacket(C)
+        t0=time.time()
+        restarts=0
+        while(True):
+            try:
+                dfq,C,stats=self.genQuiz(C,nquestion=nquestion,rng=self._quizRng(qi,restarts))
+                break
+            except QuizGenerationError as e:
+                elapsed=time.time()-t0
+                if(restarts>=self.maxRestarts or 
+                   (self.restartTimeout is not None and elapsed>self.restartTimeout)):
+                    raise QuizGenerationError('quiz %d: %s (gave up after %d restart(s), %.1fs)'%(qi+1,e,restarts,elapsed))
+                restarts+=1
+                self._metrics.count('restarts')
+                logger.warning('quiz %d: restart %d',qi+1,restarts)
+                self._restorePacket(C,snap)
+        stats['restarts']=restarts
+        return dfq,C,stats
+
+    def genQuiz(self,C,nquestion=30,rng=None):
         """generate quiz based on content
 
         Args:
-            C (dict): content dict
+            C (dict): the period content pools (see _getContent)
             nquestion (int): number of questions to be generated
                 (default: 30)
+            rng (Generator): numpy random generator every pick and 
+                shuffle of the quiz draws from (default: a freshly seeded 
+                one)
         """
-        if(self.quizContent is None):
+        if(self.contentPools is None):
             self._getContent()
+        self._backtracks=0
+        if(rng is None):
+            rng=np.random.default_rng()
+        if(self.engine=='array'):
+            return self._genQuizArray(C,rng,nquestion=nquestion)
         
         Q1=pd.DataFrame()
         Q2=pd.DataFrame()
@@ -622,29 +2025,33 @@ class QuizGenerator():
         #    for example
         #        for an "A" quiz, the 50% of the questions are picked from the "past" period,
         #                         then 50% of the questions from the "current" period
-        usedVerses=[]
-        q1counts=countTypes(pd.DataFrame(),self.quizDistribution)
-        for ii,(period,dfremaining) in enumerate(C.items()):
-            nq=int(20*self.quizMakeup[period]['frac'])
-            logger.info('picking %d questions from "%s"'%(nq,period))
-            Q1,tmp_loosened=self.pickQuestionBlock(dfremaining,nq,Q1,usedVerses)
-            loosened=loosened or tmp_loosened
-            periodCounts[period]=[nq]
+        # verses already in this quiz
+        verseMask=self._newVerseMask()
+        M=self._metrics
+        with M.phase('block1'):
+            for ii,period in enumerate(C.keys()):
+                nq=int(20*self.quizMakeup[period]['frac'])
+                logger.info('picking %d questions from "%s"',nq,period)
+                Q1,tmp_loosened=self.pickQuestionBlock(None,nq,Q1,None,
+                                                       period=period,
+                                                       verseMask=verseMask,
+                                                       rng=rng)
+                loosened=loosened or tmp_loosened
+                periodCounts[period]=[nq]
         
         # scramble first questions
         if(self.scramblePeriod):
-            Q1=Q1.sample(frac=1.0)
+            Q1=Q1.take(rng.permutation(len(Q1)))
         # label first questions
         nq1=Q1.shape[0]
         lbl=[str(x+1) for x in range(nq1)]
         Q1['qn']=lbl
 
 
-        usedVerses=Q1['BCV'].unique().tolist()
         #q1counts=self._countTypes(Q1)
         q1counts=countTypes(Q1,self.quizDistribution)
         #pprint.pprint(q1counts)
-        logger.debug('Question 1-20 counts: %s'%str(q1counts))
+        logger.debug('Question 1-20 counts: %s',q1counts)
         logger.debug('=================================')
 
         #
@@ -656,30 +2063,39 @@ class QuizGenerator():
             # a "normal" CMA quiz will have 30 questions (16+AB, through 20+AB)
             nq2=nquestion-20
         
-        usedVerses=Q1['BCV'].unique().tolist()
         #q2counts=countTypes(Q1,self.quizDistribution)
-        for ii,(period,dfremaining) in enumerate(C.items()):
-            nq=int(nq2*self.quizMakeup[period]['frac']+1)
-            logger.info('picking %d A,B questions (16AB-20AB) from "%s"'%(nq,period))
-            Q2,tmp_loosened=self.pickQuestionBlock(dfremaining,nq,Q2,
-                                                   usedVerses,
-                                                   otherQuestionCounts=q1counts)
-            loosened=loosened or tmp_loosened
-            #q2counts=countTypes(pd.concat([Q1,Q2]),self.quizDistribution)
-            periodCounts[period].append(nq)
+        with M.phase('block2'):
+            for ii,period in enumerate(C.keys()):
+                # (only the first nq2 are kept, so don't pick past them; extra
+                # picks may not fit in the distribution maximums)
+                nq=min(int(nq2*self.quizMakeup[period]['frac']+1),nq2-len(Q2))
+                logger.info('picking %d A,B questions (16AB-20AB) from "%s"',nq,period)
+                Q2,tmp_loosened=self.pickQuestionBlock(None,nq,Q2,
+                                                       None,
+                                                       otherQuestionCounts=q1counts,
+                                                       period=period,
+                                                       verseMask=verseMask,
+                                                       rng=rng)
+                loosened=loosened or tmp_loosened
+                #q2counts=countTypes(pd.concat([Q1,Q2]),self.quizDistribution)
+                periodCounts[period].append(nq)
         Q2=Q2.iloc[:nq2]
+        # verses of the questions kept
+        verseMask[:]=False
+        verseMask[Q1['VID'].values]=True
+        verseMask[Q2['VID'].values]=True
 
         if(self.verbose):
             # show the distribution for each question type
             #for qt,cnt in self._countTypes(Q2).items():
             for qt,cnt in countTypes(Q2,self.quizDistribution).items():
-                rng=self.quizDistribution[qt]['range']
+                qrange=self.quizDistribution[qt]['range']
                 q12cnt=q1counts[qt]+cnt
-                #print('%s: %d (Q1: %d, Q2: %d, min: %d, max: %d)'%(qt,q12cnt,q1counts[qt],cnt,rng[0],rng[1]))
+                #print('%s: %d (Q1: %d, Q2: %d, min: %d, max: %d)'%(qt,q12cnt,q1counts[qt],cnt,qrange[0],qrange[1]))
 
         # scramble second part
         if(self.scramblePeriod):
-            Q2=Q2.sample(frac=1.0)
+            Q2=Q2.take(rng.permutation(len(Q2)))
         # label second questions
         if(self.quizType!='custom'):
             lbl=['16A','16B','17A','17B','18A','18B','19A','19B','20A','20B']
@@ -692,7 +2108,7 @@ class QuizGenerator():
         #display(Q2)
         q2counts=countTypes(Q2,self.quizDistribution)
         #pprint.pprint(q1counts)
-        logger.debug('Question 16AB-20AB counts: %s'%str(q2counts))
+        logger.debug('Question 16AB-20AB counts: %s',q2counts)
         logger.debug('=================================')
         
         
@@ -704,17 +2120,13 @@ class QuizGenerator():
             nq3=3
         else:
             nq3=0
-        usedVerses=Q1['BCV'].unique().tolist()
-        usedVerses2=Q2['BCV'].unique().tolist()
-        usedVerses.extend(usedVerses2)
-        #print(usedVerses)
         #q12counts=self._countTypes(Q1)
         q12counts=countTypes(Q1,self.quizDistribution)
         #for qt,cnt in self._countTypes(Q2).items():
         for qt,cnt in countTypes(Q2,self.quizDistribution).items():
             q12counts[qt]+=cnt
         
-        logger.debug('Question 1-20AB counts: %s'%str(q12counts))
+        logger.debug('Question 1-20AB counts: %s',q12counts)
         logger.debug('=================================')
         
         #
@@ -723,44 +2135,46 @@ class QuizGenerator():
         numPeriods=len(self.quizMakeup)
         p=[v['frac'] for v in self.quizMakeup.values()]
         choices=list(self.quizMakeup.keys())
-        choosePeriods=np.random.choice(choices,size=3,p=p)
+        choosePeriods=rng.choice(choices,size=3,p=p)
         # all question types need to be different
         qtypes=list(self.quizDistribution.keys())
-        overtimeTypes=np.random.choice(qtypes,3,replace=False)
+        overtimeTypes=rng.choice(qtypes,3,replace=False)
         
-        #for period,dfremaining in C.items():
-        for ii,period in enumerate(choosePeriods):
-            dfremaining=C[period]
+        with M.phase('overtime'):
+            #for period,dfremaining in C.items():
+            for ii,period in enumerate(choosePeriods):
+                dfremaining=None
             
-            nq=1
-            #nq=int(nq3*self.quizMakeup[period]['frac']+1)
-            if(self.quizType=='custom'): nq=0
-
-            if(self.verbose):
-                msg='picking %d overtime questions from "%s"'%(nq,period)
-                logger.debug(msg)
-                #print('picking third %d questions from %s'%(nq,period))
-            for qi in range(nq):
-                #print(list(self.quizDistribution.keys()))
-                #
-                # for overtime, randomly pick a question type
-                #
-                #qt=np.random.permutation(list(self.quizDistribution.keys()))[0]
-                #print(qt)
-                #print(qt[0])
-                qt=overtimeTypes[ii]
-                Q3,dfremaining=self.pickQuestion(Q3,dfremaining,
-                                                 otherBCV=usedVerses,
-                                                 qtype=qt)
-                logger.debug('Overtime: %d questions'%(len(Q3)))
-                if(Q3.shape[0]>=nq3): break
+                nq=1
+                #nq=int(nq3*self.quizMakeup[period]['frac']+1)
+                if(self.quizType=='custom'): nq=0
+
+                if(self.verbose):
+                    logger.debug('picking %d overtime questions from "%s"',nq,period)
+                    #print('picking third %d questions from %s'%(nq,period))
+                for qi in range(nq):
+                    #print(list(self.quizDistribution.keys()))
+                    #
+                    # for overtime, randomly pick a question type
+                    #
+                    #qt=np.random.permutation(list(self.quizDistribution.keys()))[0]
+                    #print(qt)
+                    #print(qt[0])
+                    qt=overtimeTypes[ii]
+                    Q3,dfremaining=self.pickQuestion(Q3,dfremaining,
+                                                     qtype=qt,
+                                                     period=period,
+                                                     verseMask=verseMask,
+                                                     rng=rng)
+                    logger.debug('Overtime: %d questions',len(Q3))
+                    if(Q3.shape[0]>=nq3): break
 
         # scramble third part
         #Q2.sample(frac=1.0)
         # label overtime questions
         if(self.quizType!='custom'):
             #lbl=['21','21A','21B','22','22A','22B','23','23A','23B']
-            lbl=['21','22','23']
+            lbl=OVERTIME_LABELS[:Q3.shape[0]]
         else:
             nq3=Q3.shape[0]
             lbl=[str(x+1+nq1+nq2) for x in range(nq3)]
@@ -773,24 +2187,25 @@ class QuizGenerator():
         #
         # reorder questions
         #
-        rng=['1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16',
-                '16A','16B','17','17A','17B','18','18A','18B','19','19A','19B','20','20A','20B',
-                '21','22','23']
-        frames=[]
-        if(self.quizType!='custom'):
-            for r in rng:
-                df=Q1[Q1['qn']==r]
-                frames.append(df)
-                df=Q2[Q2['qn']==r]
-                frames.append(df)
-                df=Q3[Q3['qn']==r]
-                frames.append(df)
-        else:
-            frames.append(Q1)
-            frames.append(Q2)
-            #frames.append(Q3)
+        qnOrder=['1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16',
+                 '16A','16B','17','17A','17B','18','18A','18B','19','19A','19B','20','20A','20B',
+                 '21','22','23']
+        with M.phase('frame'):
+            frames=[]
+            if(self.quizType!='custom'):
+                for r in qnOrder:
+                    df=Q1[Q1['qn']==r]
+                    frames.append(df)
+                    df=Q2[Q2['qn']==r]
+                    frames.append(df)
+                    df=Q3[Q3['qn']==r]
+                    frames.append(df)
+            else:
+                frames.append(Q1)
+                frames.append(Q2)
+                #frames.append(Q3)
         
-        dfq=pd.concat(frames,sort=False)
+            dfq=pd.concat(frames,sort=False)
 
         #display(dfq)
         #1/0
@@ -801,83 +2216,672 @@ class QuizGenerator():
         idxRepeat=dfq[dfq['FLAGS'].str.contains('R')].index
         #if(len(idxRepeat)):
         #    print('wait!')
-        for ii,(period,dfremaining) in enumerate(C.items()):
-            ir=idxRepeat[idxRepeat.isin(C[period].index)]
-            C[period].loc[ir,'FLAGS']='R'
+        self._repeat[self.database.index.get_indexer(idxRepeat)]=True
         
         stats={#'min':self._countTypes(Q1),
                'min':countTypes(Q1,self.quizDistribution),
                'max':q12counts,
                'period':periodCounts,
-               'loose':loosened}
+               'loose':loosened,
+               'backtracks':self._backtracks,
+               'restarts':0}
 
         return dfq,C,stats
 
-    def genExtraQuestions(self,C,qtype,xtra):
-        """pick extra questions
+    #
+    # array engine
+    #
+    def _pickArray(self,C,period,quiz,rng,qtype=None,loosenDistribution=False):
+        """Array-engine version of pickQuestion: pick one question from 
+        a period's pools and add it to quiz.
+
+        Args:
+            C (dict): the period content pools
+            period (string): period to pick from
+            quiz (QuizArrays): the quiz under construction
+            rng (Generator): numpy random generator to draw from
+            qtype (string): question type (None to pick by distribution)
+            loosenDistribution (bool): flag whether to remove minimums
+        Returns:
+            picked (bool)
         """
-        #logger.debug('picking extra questions')
-        Q1=pd.DataFrame()
-        for period,dfremaining in C.items():
-            nq=int(xtra*self.quizMakeup[period]['frac'])+1
-            for qi in range(nq):
-                Q1,dfremaining=self.pickQuestion(Q1,dfremaining,qtype=qtype)
-                if(Q1.shape[0]>=xtra): break
-        
-        # scramble first questions
-        Q1.sample(frac=1.0)
-        Q1=Q1.iloc[:xtra]
-        
-        nq1=Q1.shape[0]
-        lbl=[str(x+1) for x in range(nq1)]
-        Q1['qn']=lbl
-        return (Q1,C)
+        M=self._metrics
+        M.count('pickAttempts')
+        keys=list(self.quizDistribution.keys())
+        if(qtype is None):
+            weight=self._typeWeights(quiz.counts,loosenDistribution)
+            if(weight is None):
+                logger.debug('no question type has room left in the distribution')
+                M.count('noRoom')
+                return False
+            qcat=rng.choice(len(keys),p=weight)
+            qtpick=keys[qcat]
+        else:
+            qtpick=qtype
+            qcat=keys.index(qtype)
 
-    def generateQuizTables(self,nquiz=None,xtra=5,nquestion=30):
+        cp=C[period]
+        pool=cp['pools'][qtpick]
+        n=quiz.n
+        repeat=False
+        # exclude book-chapter-verses already in the quiz, and used questions
+        inQuizVerse=quiz.verseUsed[cp['vid'][pool]]
+        cand=pool[~inQuizVerse & ~cp['used'][pool]]
+        if(len(cand)==0):
+            logger.warning('No unused %s questions left whose book-chapter-verse not already in quiz.',qtpick)
+            # allow repeats, but not same book-chapter-verses or questions
+            # already in this quiz
+            repeat=True
+            inQuiz=np.isin(cp['rows'][pool],quiz.row[:n])
+            cand=pool[~inQuizVerse & ~inQuiz]
+            if(len(cand)):
+                M.count('tierRepeat')
+                logger.info('%s questions w/repeats, but not in the same book-chapter-verse as another question: %d',qtpick,len(cand))
+            else:
+                # if STILL no questions, then relax the B-C-V
+                M.count('tierVerse')
+                cand=pool
+                logger.warning('%s questions w/repeats, including existing book-chapter-verse s: %d',qtpick,len(cand))
+        if(len(cand)==0):
+            logger.debug('No %s questions survived this pick because of exclusions.',qtpick)
+            M.count('excluded')
+            return False
+
+        pos=cand[rng.integers(len(cand))]
+        cp['used'][pos]=True
+        if(repeat):
+            self._repeat[cp['rows'][pos]]=True
+        quiz.add(self._periodIndex[period],pos,cp['rows'][pos],cp['vid'][pos],qcat,repeat)
+        M.count('picks')
+        logger.debug('Picked %s',qtpick)
+        return True
+
+    def _backtrackArray(self,C,quiz,initNum):
+        """Array-engine version of _backtrackBlock"""
+        k=min(self.maxBacktrack,quiz.n-initNum)
+        self._backtracks+=1
+        self._metrics.count('backtracks')
+        logger.warning('backtracking %d pick(s)',k)
+        periods=list(C.keys())
+        for ii in range(quiz.n-k,quiz.n):
+            if(not quiz.repeat[ii]):
+                C[periods[quiz.period[ii]]]['used'][quiz.pos[ii]]=False
+        quiz.truncate(quiz.n-k)
+
+    def _pickBlockArray(self,C,period,quiz,nq,rng):
+        """Array-engine version of pickQuestionBlock"""
+        logger.info('pick %d questions for this block',nq)
+        loosened=False
+        initNum=quiz.n
+        iter=0
+        backtracks=0
+        while((quiz.n-initNum)<nq):
+            iter+=1
+            if(iter>(3*nq)):
+                if(self.autoRecover and backtracks<self.backtrackAttempts and quiz.n>initNum):
+                    backtracks+=1
+                    self._backtrackArray(C,quiz,initNum)
+                    iter=0
+                    continue
+                raise QuizGenerationError(BLOCK_FAIL_MSG)
+            if(not self._pickArray(C,period,quiz,rng)):
+                if((iter>(2*nq)) and (self.loose==True)):
+                    if(loosened==False):
+                        loosened=True
+                        self._metrics.count('loosened')
+                        logger.warning('***: Q%d, ALLOWING LOOSENING OF DISTRIBUTION COUNTS',quiz.n)
+                    self._metrics.count('loosePicks')
+                    self._pickArray(C,period,quiz,rng,loosenDistribution=True)
+        return loosened
+
+    def _quizFrame(self,quiz,order,labels):
+        """build the output dataframe of a quiz, once
+
+        Args:
+            quiz (QuizArrays): the picked questions
+            order (array): pick indices in output order
+            labels (list): question number of each output row
+        """
+        df=self.database.iloc[quiz.row[order]].copy()
+        df['used']=1
+        rep=quiz.repeat[order]
+        if(rep.any()):
+            flags=df['FLAGS'].values.copy()
+            flags[rep]=flags[rep]+'R'
+            df['FLAGS']=flags
+        df['qn']=labels
+        return df
+
+    def _orderQuiz(self,nq1,nq2,nq3,rng):
+        """order and label the picks of a quiz whose 1-20, 16AB-20AB and 
+        overtime blocks are picks [0,nq1), [nq1,nq1+nq2) and the nq3 after 
+        (the blocks are scrambled with the numpy Generator rng)
+
+        Returns:
+            order (array): pick indices in output order
+            labels (list): question number of each output row
+        """
+        o1=np.arange(nq1)
+        o2=np.arange(nq1,nq1+nq2)
+        if(self.scramblePeriod):
+            o1=rng.permutation(o1)
+            o2=rng.permutation(o2)
+        o3=np.arange(nq1+nq2,nq1+nq2+nq3)
+        if(self.quizType!='custom'):
+            lbl=dict(zip([str(x+1) for x in range(nq1)],o1))
+            lbl.update(zip(AB_LABELS,o2))
+            lbl.update(zip(OVERTIME_LABELS,o3))
+            labels=[r for r in QUESTION_ORDER if r in lbl]
+            order=np.array([lbl[r] for r in labels],dtype=np.int64)
+        else:
+            order=np.concatenate([o1,o2])
+            labels=[str(x+1) for x in range(len(order))]
+        return order,labels
+
+    def _genQuizArray(self,C,rng,nquestion=30):
+        """Array-engine version of genQuiz.  C is the dict of period 
+        content pools (see _getContent), and rng the quiz's numpy 
+        Generator."""
+        keys=list(self.quizDistribution.keys())
+        custom=(self.quizType=='custom')
+        nq2=10 if not custom else nquestion-20
+        nq3=3 if not custom else 0
+        quiz=QuizArrays(20+nq2+nq3+2*len(C),len(keys),self._nverse)
+        periodCounts={}
+        loosened=False
+
+        #
+        # pick first 20 questions
+        #
+        M=self._metrics
+        with M.phase('block1'):
+            for period in C.keys():
+                nq=int(20*self.quizMakeup[period]['frac'])
+                logger.info('picking %d questions from "%s"',nq,period)
+                loosened=self._pickBlockArray(C,period,quiz,nq,rng) or loosened
+                periodCounts[period]=[nq]
+        nq1=quiz.n
+        q1counts=dict(zip(keys,quiz.counts.tolist()))
+
+        #
+        # pick for rest of quiz (16AB-20AB)
+        #
+        with M.phase('block2'):
+            for period in C.keys():
+                # (only the first nq2 are kept, so don't pick past them)
+                nq=min(int(nq2*self.quizMakeup[period]['frac']+1),nq1+nq2-quiz.n)
+                logger.info('picking %d A,B questions (16AB-20AB) from "%s"',nq,period)
+                loosened=self._pickBlockArray(C,period,quiz,nq,rng) or loosened
+                periodCounts[period].append(nq)
+        quiz.truncate(nq1+nq2)
+        nq2=quiz.n-nq1
+        q12counts=dict(zip(keys,quiz.counts.tolist()))
+
+        #
+        # pick a few overtime questions
+        #
+        with M.phase('overtime'):
+            if(nq3):
+                p=[v['frac'] for v in self.quizMakeup.values()]
+                choosePeriods=rng.choice(list(self.quizMakeup.keys()),size=3,p=p)
+                # all question types need to be different
+                overtimeTypes=rng.choice(keys,3,replace=False)
+                for period,qt in zip(choosePeriods,overtimeTypes):
+                    self._pickArray(C,period,quiz,rng,qtype=qt)
+        nq3=quiz.n-nq1-nq2
+
+        with M.phase('frame'):
+            order,labels=self._orderQuiz(nq1,nq2,nq3,rng)
+            dfq=self._quizFrame(quiz,order,labels)
+
+        stats={'min':q1counts,
+               'max':q12counts,
+               'period':periodCounts,
+               'loose':loosened,
+               'backtracks':self._backtracks,
+               'restarts':0}
+        return dfq,C,stats
+
+    def generateQuizTables(self,nquiz=None,xtra=5,nquestion=30,seed=None):
         """Generate quiz tables
 
+        Each quiz draws from its own random stream, derived from the 
+        packet seed, and the packet's used state is checkpointed before 
+        each quiz so a single quiz can be regenerated later (see 
+        regenerateQuiz).
+
         Args:
             xtra (int): number of extra questions to generated
             nquestion (int): number of questions to generate per quiz
+            seed (int): packet seed (default: drawn from numpy's global 
+                random state)
+        """
+        for qi,dfq,stats in self.iterQuizTables(nquiz=nquiz,xtra=xtra,nquestion=nquestion,seed=seed):
+            pass
+        return self.getQuizData()
+
+    def _startPacket(self,nquiz,xtra,nquestion,seed,keep):
+        """reset the generator's packet state for a new packet (see 
+        iterQuizTables)
+
+        Returns:
+            C (dict): the content of each period
         """
         if(nquiz is not None):
             self.nquiz=nquiz
-        if(self.quizContent is None):
-            self._getContent()
-        
-        logger.debug('nquiz: %d'%self.nquiz)
-        logger.debug('quizMakeup: %s'%str(self.quizMakeup))
-
-        # get copy of content from each period
-        #    typically, C={'past':dataFrame,'current':dataFrame}
-        C={}
-        for period,df in self.quizContent.items():
-            df['used']=0
-            C[period]=df.copy()
-        
-        # loop through requested quizzes
-        QQ=[];QQstats=[]
-        for qi in range(self.nquiz):
-            logger.info('GENERATE QUIZ %d'%(qi+1))
-            dfq,C,stats=self.genQuiz(C,nquestion=nquestion)
-            QQ.append(dfq)
-            QQstats.append(stats)
+        if(self.instrument):
+            self.instrumentation=Instrumentation()
+            self._metrics=self.instrumentation
+        else:
+            self.instrumentation=None
+            self._metrics=NO_INSTRUMENTATION
+        M=self._metrics
+        if(self._contentStale()):
+            with M.phase('content'):
+                self._getContent()
         
+        logger.debug('nquiz: %d',self.nquiz)
+        logger.debug('quizMakeup: %s',self.quizMakeup)
+
+        # the content pools of each period, typically C={'past':...,
+        # 'current':...} (the used state is in the generator's shared 
+        # used/repeat masks)
+        self._used[:]=False
+        self._repeat[:]=False
+        C=dict(self.contentPools)
+        self._periodIndex={period:ii for ii,period in enumerate(C.keys())}
+        # seed from which each quiz's random stream is derived
+        self.packetSeed=int(np.random.randint(2**31) if seed is None else seed)
+        self._quizVersions=[0]*self.nquiz
+        self._packetContent=C
+        self._packetArgs={'xtra':xtra,'nquestion':nquestion}
+        self.solverReport=None
+        self.quizzes=[] if keep else None
+        self.quizStats=[]
+        self.extraQuestions=None
+        self._checkpoints=None
+        self._swapper=None
+        return C
+
+    def iterQuizTables(self,nquiz=None,xtra=5,nquestion=30,seed=None,keep=True):
+        """Generate quiz tables one at a time (see generateQuizTables), 
+        e.g. to write each quiz while the next is generated (see 
+        QuizWriter.saveStream).  The packet is the same as 
+        generateQuizTables' for the same seed; the extra questions are 
+        ready once the iteration is done.
+
+        With the packet solver, the quizzes are only yielded once the 
+        whole packet is solved.
+
+        Args:
+            keep (bool): keep the quizzes (and the checkpoints of 
+                regenerateQuiz) on the generator; with False only the 
+                stats are kept, so the quizzes are freed once the caller 
+                is done with them
+        Yields:
+            qi (int), quiz (dataframe), stats (dict)
+        """
+        C=self._startPacket(nquiz,xtra,nquestion,seed,keep)
+        M=self._metrics
         
-        qxtra={}
-        for qt,qdata in self.quizDistribution.items():
-            logger.debug('Pick extra %s questions'%qt)
-            Q1,C=self.genExtraQuestions(C,qt,xtra)
-            qxtra[qt]=Q1
-
-        self.quizzes=QQ
-        self.quizStats=QQstats
-        self.extraQuestions=qxtra
+        if(self.solver=='packet'):
+            # solve all quizzes at once
+            from packetSolver import solvePacket
+            rng=np.random.default_rng(np.random.SeedSequence([self.packetSeed,0,0,0]))
+            with M.phase('solver'):
+                QQ,QQstats,self.solverReport=solvePacket(self,self.nquiz,nquestion=nquestion,rng=rng)
+            for qi,n in enumerate(self.solverReport['perQuiz']):
+                M.startQuiz(qi)
+                M.count('repeats',n)
+            M.endQuiz()
+            self.quizStats=QQstats
+            if(keep):
+                self.quizzes=QQ
+            for qi,(dfq,stats) in enumerate(zip(QQ,QQstats)):
+                yield qi,dfq,stats
+        elif(self.solver=='sequential'):
+            # loop through requested quizzes
+            checkpoints=[]
+            for qi in range(self.nquiz):
+                logger.info('GENERATE QUIZ %d',qi+1)
+                snap=self._snapshotPacket(C)
+                if(keep):
+                    checkpoints.append(snap)
+                M.startQuiz(qi)
+                with M.phase('quiz'):
+                    dfq,C,stats=self._genQuizRecover(C,qi,nquestion=nquestion,snap=snap)
+                if(self.instrument):
+                    M.count('repeats',int(dfq['FLAGS'].str.contains('R').sum()))
+                M.endQuiz()
+                if(keep):
+                    self.quizzes.append(dfq)
+                self.quizStats.append(stats)
+                # (each quiz has its own random generator, so the caller 
+                # may use numpy's random state meanwhile)
+                yield qi,dfq,stats
+            if(keep):
+                checkpoints.append(self._snapshotPacket(C))
+                self._checkpoints=checkpoints
+        else:
+            raise Exception('solver is sequential/packet, not "%s"'%self.solver)
+
+        # extra questions are drawn when they are first used
+        self.extraQuestions=ExtraQuestions(self,xtra)
         
         logger.info('done generating quizzes, stats, extra questions!')
+
+    def _adoptPacket(self,packet,xtra,nquestion,seed):
+        """take over a packet generated from the same content by another 
+        generator (see _candidateWorker), as if generateQuizTables had 
+        made it: the quizzes and stats are kept, and the used state, the 
+        checkpoints of regenerateQuiz and the extra questions are rebuilt 
+        from the quizzes"""
+        C=self._startPacket(len(packet['quizzes']),xtra,nquestion,seed,True)
+        if(packet['instrumentation'] is not None):
+            self.instrumentation=packet['instrumentation']
+            self._metrics=self.instrumentation
+        checkpoints=[]
+        for dfq in packet['quizzes']:
+            checkpoints.append(self._snapshotPacket(C))
+            self._markUsed(C,dfq)
+            idxRepeat=dfq.index[dfq['FLAGS'].str.contains('R').values]
+            self._repeat[self.database.index.get_indexer(idxRepeat)]=True
+        checkpoints.append(self._snapshotPacket(C))
+        if(self.solver=='sequential'):
+            self._checkpoints=checkpoints
+        self.quizzes=packet['quizzes']
+        self.quizStats=packet['stats']
+        self.solverReport=packet['solver']
+        self.extraQuestions=ExtraQuestions(self,xtra)
+
+    def regenerateQuiz(self,qi,following=False):
+        """Regenerate quiz qi (0-based) of the packet, from the used 
+        state checkpointed before it, with a new random stream.
+
+        Args:
+            qi (int): quiz to regenerate
+            following (bool): also regenerate the quizzes after it 
+                (replaying their own streams); otherwise they are kept, 
+                and the new quiz avoids their questions
+        Returns:
+            dict: getQuizData()
+        """
+        if(self._checkpoints is None):
+            raise Exception('regenerateQuiz needs a packet from generateQuizTables with solver="sequential" (or iterQuizTables with keep=True)')
+        if(qi<0 or qi>=len(self.quizzes)):
+            raise IndexError('quiz %d is not in the packet (%d quizzes)'%(qi,len(self.quizzes)))
+        C=self._packetContent
+        nquestion=self._packetArgs['nquestion']
+        # (the packet counters add up; the quizzes' start over)
+        M=self._metrics
+        self._quizVersions[qi]+=1
+        self._restorePacket(C,self._checkpoints[qi])
+        if(not following):
+            for dfq in self.quizzes[qi+1:]:
+                self._markUsed(C,dfq)
+        last=len(self.quizzes) if following else qi+1
+        for qj in range(qi,last):
+            logger.info('REGENERATE QUIZ %d',qj+1)
+            snap=self._snapshotPacket(C)
+            if(qj>qi):
+                self._checkpoints[qj]=snap
+            M.startQuiz(qj)
+            with M.phase('quiz'):
+                dfq,C,stats=self._genQuizRecover(C,qj,nquestion=nquestion,snap=snap)
+            if(self.instrument):
+                M.count('repeats',int(dfq['FLAGS'].str.contains('R').sum()))
+            M.endQuiz()
+            self.quizzes[qj]=dfq
+            self.quizStats[qj]=stats
+        if(following):
+            self._checkpoints[-1]=self._snapshotPacket(C)
+        else:
+            # rebuild the checkpoints after qi with the new quiz qi
+            for qj in range(qi+1,len(self.quizzes)+1):
+                self._restorePacket(C,self._checkpoints[qi])
+                for dfq in self.quizzes[qi:qj]:
+                    self._markUsed(C,dfq)
+                self._checkpoints[qj]=self._snapshotPacket(C)
+        self.extraQuestions=ExtraQuestions(self,self._packetArgs['xtra'])
+        self._swapper=None
         return self.getQuizData()
 
+    def replace(self,qi,qn):
+        """Quiz-day replacement: a fresh question of the same type for 
+        question qn (e.g. '7' or '16A') of quiz qi (0-based), respecting 
+        the verse exclusion and repeat rules (see QuestionSwapper).  Call 
+        applyReplacements to put the replacements in the quiz tables.
+
+        Returns:
+            dict: the new question's database columns, plus 'qn' and 
+                'repeat'
+        """
+        if(self.quizzes is None):
+            raise Exception('generate the quiz tables before replacing questions')
+        if(self._swapper is None):
+            self._swapper=QuestionSwapper(self)
+        return self._swapper.replace(qi,qn)
+
+    def applyReplacements(self):
+        """write the replacements from replace into the quiz tables"""
+        if(self._swapper is not None):
+            self._swapper.apply()
+        return self.getQuizData()
+
+    def packetMetrics(self,quizzes,stats):
+        """metrics of a packet, in SCORE_WEIGHTS order: repeats, loose 
+        quizzes, chapter spread (coefficient of variation of the fraction 
+        of each chapter's questions used) and mean L1 distance of the 
+        quizzes' type counts from the expected counts"""
+        if(self.contentPools is None):
+            self._getContent()
+        Q=pd.concat(quizzes)
+        repeats=Q['FLAGS'].str.contains('R').sum()
+        loose=sum(bool(st['loose']) for st in stats)
+
+        content=self.database.iloc[np.unique(np.concatenate([cp['rows'] for cp in self.contentPools.values()]))]
+        avail=content.groupby(['BK','CH']).size()
+        picked=Q.groupby(['BK','CH']).size().reindex(avail.index,fill_value=0)
+        rate=picked.values/avail.values
+        spread=rate.std()/rate.mean() if rate.mean()>0 else 0.
+
+        keys=list(self.quizDistribution.keys())
+        counts=np.array([[st['max'][k] for k in keys] for st in stats],dtype=float)
+        expected=np.array([self._expectedTypeCounts(n) for n in counts.sum(axis=1)])
+        distance=np.abs(counts-expected).sum(axis=1).mean()
+        return np.array([repeats,loose,spread,distance],dtype=float)
+
+    def generateBestOf(self,k=4,nquiz=None,xtra=5,nquestion=30,seed=None,
+                       processes=None,weights=None):
+        """Generate k candidate packets (in parallel) and keep the best.
+
+        Each candidate is generated from its own packet seed, spawned 
+        from a SeedSequence (so each quiz of each candidate has its own 
+        random generator), and scored with packetMetrics and 
+        SCORE_WEIGHTS.  The workers return their packets, and the best 
+        one is taken over by this generator (its used state, checkpoints 
+        and extra questions are rebuilt, not regenerated); its seed 
+        reproduces it:
+            QG.generateQuizTables(...,seed=result['seed'])
 
+        Args:
+            k (int): number of candidate packets
+            seed (int): root seed (default: fresh entropy)
+            processes (int): worker processes (default: one per CPU, up 
+                to k); 1 generates the candidates in this process
+            weights (dict): metric weights (default: SCORE_WEIGHTS)
+        Returns:
+            dict: getQuizData() of the best packet, plus 'seed', 'score' 
+                and 'candidates' (seed, metrics and score of each)
+        """
+        if(nquiz is not None):
+            self.nquiz=nquiz
+        if(self._contentStale()):
+            self._getContent()
+        w=dict(SCORE_WEIGHTS)
+        w.update(weights or {})
+        w=np.array([w[m] for m in SCORE_WEIGHTS])
+
+        root=np.random.SeedSequence(seed)
+        seeds=[int(c.generate_state(1)[0]) for c in root.spawn(k)]
+        if(processes is None):
+            processes=min(k,os.cpu_count() or 1)
+
+        results=[]
+        if(processes<=1):
+            _initCandidateWorker(self)
+            for sd in seeds:
+                results.append(_candidateWorker(sd,self.nquiz,xtra,nquestion))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                                                        initializer=_initCandidateWorker,
+                                                        initargs=(self,)) as pool:
+                futures=[pool.submit(_candidateWorker,sd,self.nquiz,xtra,nquestion) for sd in seeds]
+                results=[f.result() for f in futures]
+
+        ok=[r for r in results if r[1] is not None]
+        for sd,m,err,packet in results:
+            if(err is not None):
+                logger.warning('candidate %d failed: %s',sd,err)
+        if(len(ok)==0):
+            raise QuizGenerationError('all %d candidate packets failed'%k)
+        metrics=np.vstack([m for sd,m,err,packet in ok])
+        scores=metrics@w
+        best=int(np.argmin(scores))
+        candidates=[{'seed':sd,'metrics':dict(zip(SCORE_WEIGHTS,m.tolist())),'score':float(sc)}
+                    for (sd,m,err,packet),sc in zip(ok,scores)]
+        logger.info('best of %d candidates: seed %d, score %.2f (scores: %s)',
+                    k,ok[best][0],scores[best],', '.join('%.2f'%x for x in scores))
+
+        self._adoptPacket(ok[best][3],xtra,nquestion,ok[best][0])
+        qd=self.getQuizData()
+        qd['seed']=ok[best][0]
+        qd['score']=float(scores[best])
+        qd['candidates']=candidates
+        return qd
+
+
+
+def _parseAssignments(items,name):
+    """NAME=a,b,c command-line values -> {NAME:[a,b,c]}"""
+    out={}
+    for item in items or []:
+        if('=' not in item):
+            raise SystemExit('--%s expects NAME=VALUE, not "%s"'%(name,item))
+        k,v=item.split('=',1)
+        out[k.strip()]=[x.strip() for x in v.split(',') if x.strip()]
+    return out
+
+def main(argv=None,importTime=None):
+    """command-line entry point (python -m quizGenerator ...)"""
+    import argparse
+    import json
+    parser=argparse.ArgumentParser(prog='python -m quizGenerator',
+                                   description='CM&A quiz generator')
+    sub=parser.add_subparsers(dest='command')
+    p=sub.add_parser('generate',help='generate a quiz packet')
+    src=p.add_mutually_exclusive_group(required=True)
+    src.add_argument('--database',help='question database (Excel)')
+    src.add_argument('--snapshot',help='start from a generator snapshot (see --save-snapshot)')
+    p.add_argument('--save-snapshot',help='save the prepared generator here')
+    p.add_argument('--quiz-type',default='epistle',help='epistle/gospel/custom (default: epistle)')
+    p.add_argument('--content',action='append',metavar='PERIOD=REF',
+                   help='content of a period as a reference string, e.g. "current=2P 1-3" '
+                        '(repeatable; the periods share the quiz evenly)')
+    p.add_argument('--makeup',help='quizMakeup as a JSON file')
+    p.add_argument('--limit',action='append',metavar='TYPE=CLUBS',help='club limit of a question type, e.g. q=150,300')
+    p.add_argument('--set',action='append',metavar='TYPE=SETS',help='sets of a question type ("*" for all), e.g. "*=Local"')
+    p.add_argument('--nquiz',type=int,default=1)
+    p.add_argument('--xtra',type=int,default=5,help='extra questions per type')
+    p.add_argument('--seed',type=int,default=None,help='packet seed')
+    p.add_argument('--engine',choices=('pandas','array'),default=None)
+    p.add_argument('--solver',choices=('sequential','packet'),default=None)
+    p.add_argument('--auto-recover',action='store_true')
+    p.add_argument('--out',help='write the packet to this .docx')
+    p.add_argument('--stream',action='store_true',
+                   help='write each quiz as it is generated (needs --out; see QuizWriter.saveStream)')
+    p.add_argument('--title',default='CMA Bible Quizzes')
+    p.add_argument('--profile',action='store_true',help='print phase timings')
+    p.add_argument('--log',help='also log to this file')
+    p.add_argument('--instrument',metavar='FILE',help='write phase timings and pick counters (JSON) here')
+    p.add_argument('--quiet',action='store_true',help='only log warnings and errors')
+    args=parser.parse_args(argv)
+    if(args.command is None):
+        parser.print_help()
+        return 2
+    if(args.stream and not args.out):
+        parser.error('--stream needs --out')
+    configureLogging(level=logging.WARNING if args.quiet else logging.INFO,logfile=args.log)
+
+    T=[('import',_importTime if importTime is None else importTime)]
+    t=time.perf_counter()
+    if(args.snapshot):
+        QG=QuizGenerator.fromSnapshot(args.snapshot)
+        T.append(('snapshot load',time.perf_counter()-t))
+    else:
+        QG=QuizGenerator(quizType=args.quiz_type)
+        QG.loadDatabase(args.database)
+        T.append(('database load',time.perf_counter()-t))
+
+    if(args.makeup):
+        with open(args.makeup) as f:
+            QG.quizMakeup=json.load(f)
+    elif(args.content):
+        content=_parseAssignments(args.content,'content')
+        QG.quizMakeup={period:{'frac':1./len(content),'content':[','.join(v)]}
+                       for period,v in content.items()}
+    for key,items in (('limit',args.limit),('set',args.set)):
+        for qt,values in _parseAssignments(items,key).items():
+            QG.quizDistribution=QG.quizDistribution.override(qt,**{key:values})
+    if(args.engine):
+        QG.engine=args.engine
+    if(args.solver):
+        QG.solver=args.solver
+    QG.autoRecover=QG.autoRecover or args.auto_recover
+    QG.instrument=bool(args.instrument)
+
+    t=time.perf_counter()
+    if(QG._contentStale()):
+        QG._getContent()
+    T.append(('content',time.perf_counter()-t))
+    if(args.save_snapshot):
+        t=time.perf_counter()
+        QG.saveSnapshot(args.save_snapshot)
+        T.append(('snapshot save',time.perf_counter()-t))
+
+    t=time.perf_counter()
+    if(args.stream):
+        import quizWriter
+        qdat=quizWriter.QuizWriter().saveStream(args.out,QG,nquiz=args.nquiz,xtra=args.xtra,
+                                                 seed=args.seed,title=args.title)
+        T.append(('generate+write',time.perf_counter()-t))
+        print('%d quizzes generated and written (seed %d, first quiz written in %.2fs)'%(
+            len(qdat['stats']),QG.packetSeed,qdat['stream']['firstQuiz']))
+    else:
+        qdat=QG.generateQuizTables(nquiz=args.nquiz,xtra=args.xtra,seed=args.seed)
+        T.append(('generate',time.perf_counter()-t))
+        repeats=sum(int(q['FLAGS'].str.contains('R').sum()) for q in qdat['quizzes'])
+        print('%d quizzes generated (seed %d, %d repeats)'%(len(qdat['quizzes']),QG.packetSeed,repeats))
+
+    if(args.out and not args.stream):
+        t=time.perf_counter()
+        import quizWriter
+        quizWriter.QuizWriter().save(args.out,qdat,title=args.title)
+        T.append(('write',time.perf_counter()-t))
+    if(args.instrument):
+        # (after writing, so the extras drawn for the packet are counted)
+        QG.instrumentation.toJSON(args.instrument)
+
+    if(args.profile):
+        for phase,dt in T:
+            print('%-14s %8.3fs'%(phase,dt),file=sys.stderr)
+        print('%-14s %8.3fs'%('total',sum(dt for phase,dt in T)),file=sys.stderr)
+    return 0
+
+_importTime=time.perf_counter()-_importStart
 
 if(__name__=='__main__'):
-    print('quiz gen is not meant to be called directly')
\ No newline at end of file
+    # run from the imported module, so its classes are the ones the 
+    # other modules (e.g. packetSolver) import
+    import quizGenerator
+    sys.exit(quizGenerator.main(importTime=_importTime))
\ No newline at end of file
@@ -0,0 +1,526 @@
+"""Quiz generation service for the CM&A Quiz Generator
+
+A small local HTTP service (asyncio and the standard library only) that
+keeps the question databases loaded, so a practice packet is a request
+instead of a notebook session.  The databases are loaded once, at
+start-up, and shipped once to each worker process; the content pools
+and compiled distributions stay cached in the workers between requests.
+
+Usage:
+    python quizServer.py --database acts=2022_Acts/acts_db.xlsx --port 8765
+    python quizServer.py --database acts=acts_db.xlsx --unix /tmp/quizgen.sock
+
+Endpoints:
+    POST /generate   generate a packet; the body is a JSON request, the
+                     response the .docx (or the packet as JSON)
+    GET  /health     databases and workers
+    GET  /metrics    request counts, queue depth and latencies (JSON)
+
+A request is a packet of a quizBatch config, plus the database:
+    {"database": "acts", "quizType": "gospel",
+     "content": {"current": ["Acts 1:1-1:19"], "past": ["Acts 1-2"]},
+     "nquiz": 4, "xtra": 10, "limits": {"q": ["150", "300"]},
+     "seed": 1234, "title": "Practice", "format": "docx", "timeout": 60}
+
+(or a "quizMakeup" in place of "content").  For example:
+    curl -X POST localhost:8765/generate -d @request.json -o practice.docx
+
+Requests wait in a bounded queue (a full queue answers 503) and are
+generated by a pool of worker processes.  A request that isn't done
+within its timeout answers 504; one that times out in the queue is never
+started, and one already running in a worker stops at the next quiz (or
+before the packet is written), so its worker is free for the next
+request.  The packet's seed and timings are returned in the X-Quiz-*
+headers.
+"""
+import io
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+
+import numpy as np
+
+import quizGenerator
+import quizBatch
+
+logger=quizGenerator.logger
+
+MAX_BODY=1<<20          # largest request body (bytes)
+READ_TIMEOUT=10.        # seconds to read a request
+CHUNK=1<<16             # response chunk size (bytes)
+LATENCY_WINDOW=1000     # requests kept for the latency percentiles
+
+CONTENT_TYPES={'docx':'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+               'json':'application/json'}
+REASONS={200:'OK',400:'Bad Request',404:'Not Found',405:'Method Not Allowed',
+         413:'Payload Too Large',422:'Unprocessable Entity',500:'Internal Server Error',
+         503:'Service Unavailable',504:'Gateway Timeout'}
+
+class RequestError(Exception):
+    """a request that can't be served, with its HTTP status"""
+    def __init__(self,status,msg):
+        super().__init__(msg)
+        self.status=status
+
+#
+# worker side
+#
+# databases resident in each worker process (set once per worker)
+_resident={}
+
+def _initWorker(databases,msg):
+    _resident['databases']={name:(df,fingerprint,quizGenerator.VerseIndex(df))
+                            for name,(df,fingerprint) in databases.items()}
+    _resident['msg']=msg
+
+def _initProcess(databases,msg):
+    # Ctrl-C is for the server, which stops the workers
+    signal.signal(signal.SIGINT,signal.SIG_IGN)
+    _initWorker(databases,msg)
+
+def _workerReady():
+    return os.getpid()
+
+def _jsonDefault(x):
+    if(isinstance(x,np.generic)):
+        return x.item()
+    if(isinstance(x,np.ndarray)):
+        return x.tolist()
+    if(isinstance(x,quizGenerator.Distribution)):
+        return x.asDict()
+    raise TypeError('%s is not JSON serializable'%type(x).__name__)
+
+# columns of the questions in a JSON packet
+PACKET_COLUMNS=['qn','TYPE','QUESTION','ANSWER','QKEYWORDS','AKEYWORDS',
+                'BK','CH','VS','CLUB','SET','FLAGS']
+
+def packetJSON(quizData):
+    """a packet (getQuizData) as a JSON-serializable dict"""
+    def records(df):
+        return df[[c for c in PACKET_COLUMNS if c in df]].to_dict('records')
+    return {'type':quizData['type'],
+            'distribution':quizData['distribution'],
+            'quizzes':[records(q) for q in quizData['quizzes']],
+            'stats':quizData['stats'],
+            'extraQuestions':{qt:records(df) for qt,df in quizData['extraQuestions'].items()},
+            'instrumentation':quizData['instrumentation']}
+
+def _generateJob(job):
+    """generate (and render) one packet in a worker, giving up (504) 
+    between quizzes once the job's deadline has passed
+
+    Returns:
+        dict: status, body and content type of the response, with the
+            packet's seed, repeats and timings (seconds)
+    """
+    if(time.time()>job['deadline']):
+        return {'status':504,'error':'timed out before it started'}
+    t0=time.perf_counter()
+    df,fingerprint,verseIndex=_resident['databases'][job['database']]
+    opts=job['options']
+    try:
+        QG=quizBatch.setupGenerator(job,df,fingerprint,verseIndex)
+        t1=time.perf_counter()
+        for qi,dfq,stats in QG.iterQuizTables(nquiz=opts['nquiz'],xtra=opts['xtra'],seed=opts['seed']):
+            if(time.time()>job['deadline']):
+                return {'status':504,'error':'timed out after %d of %d quizzes'%(qi+1,opts['nquiz'])}
+        qdat=QG.getQuizData()
+    except (quizGenerator.QuizGenerationError,AssertionError,KeyError,ValueError) as e:
+        return {'status':422,'error':str(e)}
+    t2=time.perf_counter()
+    if(time.time()>job['deadline']):
+        return {'status':504,'error':'timed out before the packet was written'}
+    if(job['format']=='docx'):
+        import quizWriter
+        buf=io.BytesIO()
+        quizWriter.QuizWriter().save(buf,qdat,title=job['title'],msg=job.get('msg') or _resident['msg'])
+        body=buf.getvalue()
+    else:
+        body=json.dumps(packetJSON(qdat),default=_jsonDefault).encode()
+    t3=time.perf_counter()
+    return {'status':200,
+            'body':body,
+            'contentType':CONTENT_TYPES[job['format']],
+            'seed':opts['seed'],
+            'repeats':sum(int(q['FLAGS'].str.contains('R').sum()) for q in qdat['quizzes']),
+            'setup':t1-t0,
+            'generate':t2-t1,
+            'write':t3-t2,
+            'pid':os.getpid()}
+
+#
+# server side
+#
+class ServerMetrics():
+    """request counters and latencies (seconds) of the last
+    LATENCY_WINDOW requests of each kind"""
+    def __init__(self,window=LATENCY_WINDOW):
+        self.started=time.time()
+        self.counts=collections.Counter()
+        self.latency=collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def count(self,key,n=1):
+        self.counts[key]+=n
+
+    def record(self,key,seconds):
+        self.latency[key].append(seconds)
+
+    def asDict(self):
+        lat={}
+        for key,v in self.latency.items():
+            x=np.array(v)
+            p50,p90,p99=np.percentile(x,[50,90,99])
+            lat[key]={'count':len(x),'mean':float(x.mean()),'p50':float(p50),
+                      'p90':float(p90),'p99':float(p99),'max':float(x.max())}
+        return {'uptime':time.time()-self.started,
+                'counts':dict(self.counts),
+                'latency':lat}
+
+class QuizServer():
+    """Quiz generation service (see the module docstring).
+
+    Args:
+        databases (dict): name -> question database (Excel) file
+        workers (int): worker processes (default: one per core); 0
+            generates in one thread of the server's process
+        maxQueue (int): requests waiting for a worker before new ones
+            are turned away (503)
+        timeout (float): default request timeout (seconds)
+        msg (list): default packet message (see QuizWriter.save)
+    """
+    def __init__(self,databases,workers=None,maxQueue=16,timeout=120.,msg=None):
+        self.databaseFiles=dict(databases)
+        self.workers=(os.cpu_count() or 1) if workers is None else workers
+        self.maxQueue=maxQueue
+        self.timeout=timeout
+        self.msg=msg
+        self.databases={}
+        self.metrics=ServerMetrics()
+        self._pool=None
+        self._queue=None
+        self._runners=[]
+        self._running=0
+        self._server=None
+
+    def loadDatabases(self):
+        """load (and prepare) every database once"""
+        for name,fn in self.databaseFiles.items():
+            t=time.perf_counter()
+            QG=quizGenerator.QuizGenerator()
+            QG.loadDatabase(fn)
+            self.databases[name]=(QG.database,QG.databaseFingerprint)
+            logger.info('server: database %s loaded in %.2fs (%d questions)',name,time.perf_counter()-t,len(QG.database))
+
+    def _newPool(self):
+        initargs=(self.databases,self.msg)
+        if(self.workers<=0):
+            # one thread in this process (e.g. for tests)
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1,initializer=_initWorker,initargs=initargs)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,initializer=_initProcess,initargs=initargs)
+
+    async def start(self,host='127.0.0.1',port=8765,path=None):
+        """load the databases, start the workers and listen on host:port
+        (or the Unix socket path); port 0 picks a free port (see
+        address)"""
+        loop=asyncio.get_running_loop()
+        if(not self.databases):
+            await loop.run_in_executor(None,self.loadDatabases)
+        self._pool=self._newPool()
+        # start the workers now, so the first requests don't wait for
+        # the databases to be shipped
+        await asyncio.gather(*[loop.run_in_executor(self._pool,_workerReady) for ii in range(max(self.workers,1))])
+        self._queue=asyncio.Queue(maxsize=self.maxQueue)
+        self._runners=[asyncio.create_task(self._runJobs()) for ii in range(max(self.workers,1))]
+        if(path):
+            self._server=await asyncio.start_unix_server(self._handle,path=path)
+        else:
+            self._server=await asyncio.start_server(self._handle,host=host,port=port)
+        logger.info('server: listening on %s (%d workers)',self.address,self.workers)
+        return self
+
+    @property
+    def address(self):
+        """(host, port) or Unix socket path of the server"""
+        sock=self._server.sockets[0].getsockname()
+        return sock if isinstance(sock,str) else tuple(sock[:2])
+
+    async def serveForever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """stop listening, drop the queued requests and stop the workers"""
+        if(self._server is not None):
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners,return_exceptions=True)
+        if(self._pool is not None):
+            self._pool.shutdown(wait=True,cancel_futures=True)
+        logger.info('server: stopped')
+
+    async def _runJobs(self):
+        """take queued jobs and run them in the worker pool, one at a time"""
+        loop=asyncio.get_running_loop()
+        while(True):
+            job,fut=await self._queue.get()
+            try:
+                if(fut.done() or time.time()>job['deadline']):
+                    # timed out while queued
+                    continue
+                self.metrics.record('queue',time.perf_counter()-job['submitted'])
+                self._running+=1
+                try:
+                    res=await loop.run_in_executor(self._pool,_generateJob,job)
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    logger.error('server: worker pool broken (%s); restarting it',e)
+                    self._pool=self._newPool()
+                    res={'status':500,'error':'worker failed'}
+                except Exception as e:
+                    logger.exception('server: generation failed')
+                    res={'status':500,'error':str(e)}
+                finally:
+                    self._running-=1
+                if(res['status']==504):
+                    # the worker gave up at the deadline
+                    self.metrics.count('abandoned')
+                if(not fut.done()):
+                    fut.set_result(res)
+            finally:
+                self._queue.task_done()
+
+    def _job(self,req):
+        """the worker job of a /generate request (see quizBatch.packetJobs)"""
+        if(not isinstance(req,dict)):
+            raise RequestError(400,'the request must be a JSON object')
+        name=req.get('database')
+        if(name is None and len(self.databases)==1):
+            name=next(iter(self.databases))
+        if(name not in self.databases):
+            raise RequestError(404,'unknown database "%s" (have: %s)'%(name,', '.join(self.databases)))
+        fmt=req.get('format','docx')
+        if(fmt not in CONTENT_TYPES):
+            raise RequestError(400,'format is docx/json, not "%s"'%fmt)
+        if('quizMakeup' in req):
+            makeup=req['quizMakeup']
+        elif('content' in req):
+            makeup=quizBatch._quizMakeup(req['content'])
+        else:
+            raise RequestError(400,'the request needs a "content" or "quizMakeup"')
+        opts=quizBatch._merge(req)
+        if(opts.get('seed') is None):
+            opts['seed']=int(np.random.SeedSequence().generate_state(1)[0])
+        timeout=float(req.get('timeout',self.timeout))
+        return {'database':name,
+                'quizType':req.get('quizType','epistle'),
+                'quizMakeup':makeup,
+                'options':opts,
+                'title':req.get('title','CMA Bible Quizzes'),
+                'msg':req.get('msg'),
+                'format':fmt,
+                'timeout':timeout,
+                'deadline':time.time()+timeout}
+
+    async def generate(self,req):
+        """queue a /generate request and wait for its result
+
+        Returns:
+            dict: see _generateJob
+        """
+        job=self._job(req)
+        job['submitted']=time.perf_counter()
+        fut=asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job,fut))
+        except asyncio.QueueFull:
+            self.metrics.count('rejected')
+            raise RequestError(503,'the queue is full (%d requests); try again later'%self.maxQueue)
+        try:
+            res=await asyncio.wait_for(fut,job['timeout'])
+        except asyncio.TimeoutError:
+            res={'status':504,'error':'not done within %.1fs'%job['timeout']}
+        if(res['status']==200):
+            for key in ('setup','generate','write'):
+                self.metrics.record(key,res[key])
+        return res
+
+    def health(self):
+        return {'status':'ok',
+                'databases':{name:len(df) for name,(df,fp) in self.databases.items()},
+                'workers':self.workers}
+
+    def metricsDict(self):
+        out=self.metrics.asDict()
+        out['queued']=self._queue.qsize()
+        out['running']=self._running
+        out['maxQueue']=self.maxQueue
+        return out
+
+    async def _handle(self,reader,writer):
+        """serve one HTTP request (the connection is closed after it)"""
+        t=time.perf_counter()
+        method=path='-'
+        try:
+            try:
+                method,path,body=await asyncio.wait_for(_readRequest(reader),READ_TIMEOUT)
+                if(path=='/generate'):
+                    if(method!='POST'):
+                        raise RequestError(405,'POST a JSON request to /generate')
+                    try:
+                        req=json.loads(body or b'{}')
+                    except ValueError as e:
+                        raise RequestError(400,'bad JSON: %s'%e)
+                    res=await self.generate(req)
+                elif(path in ('/health','/metrics') and method=='GET'):
+                    out=self.health() if path=='/health' else self.metricsDict()
+                    res={'status':200,'body':json.dumps(out).encode(),'contentType':CONTENT_TYPES['json']}
+                else:
+                    raise RequestError(404,'no such endpoint: %s %s'%(method,path))
+            except RequestError as e:
+                res={'status':e.status,'error':str(e)}
+            except (asyncio.TimeoutError,asyncio.IncompleteReadError,ValueError) as e:
+                res={'status':400,'error':'bad request (%s)'%(str(e) or type(e).__name__)}
+            await _writeResponse(writer,res)
+        except ConnectionError:
+            res={'status':0}
+        finally:
+            writer.close()
+        dt=time.perf_counter()-t
+        self.metrics.count(str(res['status']))
+        if(path=='/generate'):
+            self.metrics.count('requests')
+            self.metrics.record('total',dt)
+            if(res['status']==504):
+                self.metrics.count('timeouts')
+        logger.info('server: %s %s %d %.3fs%s',method,path,res['status'],dt,
+                    (' (%s)'%res['error']) if 'error' in res else '')
+
+async def _readRequest(reader):
+    """method, path and body of an HTTP request"""
+    line=(await reader.readline()).decode('latin-1').split()
+    if(len(line)!=3):
+        raise ValueError('bad request line')
+    method,path,version=line
+    headers={}
+    while(True):
+        h=(await reader.readline()).decode('latin-1')
+        if(h in ('\r\n','\n','')):
+            break
+        k,_,v=h.partition(':')
+        headers[k.strip().lower()]=v.strip()
+    n=int(headers.get('content-length',0))
+    if(n>MAX_BODY):
+        raise RequestError(413,'requests are at most %d bytes'%MAX_BODY)
+    body=await reader.readexactly(n) if n else b''
+    return method,path.split('?')[0],body
+
+async def _writeResponse(writer,res):
+    """write a response (res from _generateJob), in chunks"""
+    status=res['status']
+    if('error' in res):
+        body=json.dumps({'error':res['error']}).encode()
+        ctype=CONTENT_TYPES['json']
+    else:
+        body=res['body']
+        ctype=res['contentType']
+    head=['HTTP/1.1 %d %s'%(status,REASONS.get(status,'')),
+          'Content-Type: %s'%ctype,
+          'Content-Length: %d'%len(body),
+          'Connection: close']
+    if('seed' in res):
+        head+=['X-Quiz-Seed: %d'%res['seed'],
+               'X-Quiz-Repeats: %d'%res['repeats'],
+               'X-Quiz-Timing: setup=%.3f;generate=%.3f;write=%.3f'%(res['setup'],res['generate'],res['write'])]
+    if(status==503):
+        head.append('Retry-After: 1')
+    writer.write(('\r\n'.join(head)+'\r\n\r\n').encode('latin-1'))
+    for ii in range(0,len(body),CHUNK):
+        writer.write(body[ii:ii+CHUNK])
+        await writer.drain()
+    await writer.drain()
+
+async def request(method,path,payload=None,host='127.0.0.1',port=8765,unix=None):
+    """a request to a quiz server (e.g. from a test on localhost)
+
+    Returns:
+        status (int), headers (dict, lower-case names), body (bytes)
+    """
+    if(unix):
+        reader,writer=await asyncio.open_unix_connection(unix)
+    else:
+        reader,writer=await asyncio.open_connection(host,port)
+    body=b'' if payload is None else json.dumps(payload).encode()
+    writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\n'
+                  'Content-Length: %d\r\nConnection: close\r\n\r\n'%(method,path,host,len(body))).encode('latin-1')+body)
+    await writer.drain()
+    status=int((await reader.readline()).split()[1])
+    headers={}
+    while(True):
+        h=(await reader.readline()).decode('latin-1')
+        if(h in ('\r\n','\n','')):
+            break
+        k,_,v=h.partition(':')
+        headers[k.strip().lower()]=v.strip()
+    data=await reader.read()
+    writer.close()
+    return status,headers,data
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Serve quiz packets over HTTP, with the databases kept loaded.')
+    parser.add_argument('--database',action='append',required=True,metavar='NAME=FILE',
+                        help='question database (Excel) to serve, e.g. acts=acts_db.xlsx (repeatable)')
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--unix',help='listen on this Unix socket instead')
+    parser.add_argument('--workers',type=int,default=None,help='worker processes (default: one per core)')
+    parser.add_argument('--max-queue',type=int,default=16,help='requests waiting for a worker (default: 16)')
+    parser.add_argument('--timeout',type=float,default=120.,help='default request timeout (seconds)')
+    parser.add_argument('--msg',help='default packet message (JSON file; see QuizWriter.save)')
+    parser.add_argument('--log',help='also log to this file')
+    args=parser.parse_args(argv)
+    quizGenerator.configureLogging(logfile=args.log)
+    databases={}
+    for item in args.database:
+        if('=' not in item):
+            raise SystemExit('--database expects NAME=FILE, not "%s"'%item)
+        name,fn=item.split('=',1)
+        databases[name.strip()]=fn.strip()
+    msg=None
+    if(args.msg):
+        with open(args.msg) as f:
+            msg=json.load(f)
+    server=QuizServer(databases,workers=args.workers,maxQueue=args.max_queue,timeout=args.timeout,msg=msg)
+
+    async def serve():
+        await server.start(args.host,args.port,path=args.unix)
+        # SIGTERM (and Ctrl-C) stop the server, and with it the workers
+        loop=asyncio.get_running_loop()
+        task=asyncio.create_task(server.serveForever())
+        for sig in (signal.SIGTERM,signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig,task.cancel)
+            except NotImplementedError:
+                # (no signal handlers in the loop on Windows; Ctrl-C still 
+                # raises KeyboardInterrupt)
+                pass
+        try:
+            await task
+        except asyncio.CancelledError:
+            logger.info('server: stopping')
+        finally:
+            await server.close()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if(__name__=='__main__'):
+    sys.exit(main())
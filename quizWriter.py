@@ -1,29 +1,13 @@
 
 import re
-
-# imports from python-docx to create the Word document
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
-from docx.enum.text import WD_LINE_SPACING
+import time
+import queue
+import threading
 
 import logging
-#logging.basicConfig(filename='quiz_generator.log',level=logging.DEBUG)
-# create logger
+# create logger (handlers are set up by quizGenerator.configureLogging)
 logger = logging.getLogger('quiz_writer')
 logger.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s|%(name)s|%(levelname)s|%(funcName)s|%(message)s')
-logger.handlers=[]
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-ch.setFormatter(formatter)
-logger.addHandler(ch)
-# file handler
-fh = logging.FileHandler('quiz_writer.log')
-fh.setFormatter(formatter)
-logger.addHandler(fh)
 
 def countTypes(df,quizDistribution):
     """get counts of different question types
@@ -101,7 +85,7 @@ class QuizWriter():
 
 
 
-    def save(self,fn,quizData,title='CMA Bible Quizzes',msg=None):
+    def save(self,fn,quizData,title='CMA Bible Quizzes',msg=None,extras=True):
         """This method creates the quiz packet Word document.
         
          Args:
@@ -109,14 +93,116 @@ class QuizWriter():
            quizData (dict): quizData object
            title (string): title in the document
            msg (string): optional message to write
+           extras (bool): whether to add the extra questions (they are 
+             drawn from the packet as they are written)
         """
+        #if(self.loose):
+        loose=False
+        for qd in quizData['stats']:
+            loose=loose or qd['loose']
+        if(loose):
+            title='%s (loose)'%title
+        document,width,heading=self._newDocument(quizData['type'],title,msg)
+
+        #
+        # loop through quizzes
+        #
+        for qi,QZ in enumerate(quizData['quizzes']):
+            self._writeQuiz(document,width,qi,QZ,quizData['stats'][qi],
+                            quizData['type'],quizData['distribution'])
         
+        #
+        # extra question
+        #
+        if(quizData['type']!='custom' and extras):
+            self._writeExtras(document,width,quizData['distribution'],quizData['extraQuestions'].items())
+
+        document.save(fn)
+        print('Done writing quiz packet (%s)'%fn)
+
+    def saveStream(self,fn,QG,nquiz=None,xtra=5,nquestion=30,seed=None,
+                   title='CMA Bible Quizzes',msg=None,extras=True,window=2):
+        """Generate a packet and write it as it is generated.
+
+        The quizzes are generated on this thread (QG.iterQuizTables, 
+        without keeping them on the generator) and written on a writer 
+        thread as they arrive, so the first quizzes are in the document 
+        while the later ones are still being generated.  At most window 
+        quizzes wait for the writer (beyond that the generator waits), so 
+        only a few quizzes are in memory at once.  The extra questions 
+        are written once the quizzes are done.
+
+        Args:
+            fn (string): output filename of quiz
+            QG (QuizGenerator): generator of the packet
+            nquiz, xtra, nquestion, seed: see QG.generateQuizTables
+            title, msg, extras: see save
+            window (int): quizzes waiting for the writer, at most
+        Returns:
+            dict: QG.getQuizData() (without the quizzes), plus 'stream': 
+                seconds until the first quiz was written, and in total
+        """
+        t0=time.perf_counter()
+        document,width,heading=self._newDocument(QG.quizType,title,msg)
+        pending=queue.Queue(maxsize=max(window,1))
+        state={'first':None,'error':None}
+
+        def write():
+            while(True):
+                item=pending.get()
+                if(item is None):
+                    return
+                if(state['error'] is not None):
+                    # (keep taking quizzes, so the generator isn't blocked)
+                    continue
+                qi,QZ,stats=item
+                try:
+                    self._writeQuiz(document,width,qi,QZ,stats,QG.quizType,QG.quizDistribution)
+                except Exception as e:
+                    state['error']=e
+                if(state['first'] is None):
+                    state['first']=time.perf_counter()-t0
+
+        writer=threading.Thread(target=write,name='quizWriter',daemon=True)
+        writer.start()
+        try:
+            for item in QG.iterQuizTables(nquiz=nquiz,xtra=xtra,nquestion=nquestion,seed=seed,keep=False):
+                pending.put(item)
+                del item
+                if(state['error'] is not None):
+                    break
+        finally:
+            pending.put(None)
+            writer.join()
+        if(state['error'] is not None):
+            raise state['error']
+
+        # (the title is written first; the quizzes tell if it's loose)
+        if(any(st['loose'] for st in QG.quizStats)):
+            heading.text='%s (loose)'%title
+        if(QG.quizType!='custom' and extras):
+            self._writeExtras(document,width,QG.quizDistribution,QG.extraQuestions.items())
+        document.save(fn)
+        print('Done writing quiz packet (%s)'%fn)
+        quizData=QG.getQuizData()
+        quizData['stream']={'firstQuiz':state['first'],'total':time.perf_counter()-t0}
+        return quizData
+
+    def _newDocument(self,quizType,title,msg=None):
+        """a new packet document with its title and message
 
+        Returns:
+            document, column widths, title heading (paragraph)
+        """
+        # python-docx is only needed for writing, so it is imported here
+        from docx import Document
+        from docx.shared import Inches, Pt
+        
         #
         # document, paragraph, section, font settings
         #
         # -- width for columns: question number, type, Q/A, reference
-        if(quizData['type']=='epistle'):
+        if(quizType=='epistle'):
             width=[Inches(0.375),Inches(0.375),Inches(5.25),Inches(1.)]
         else:
             width=[Inches(0.375),Inches(1),Inches(4.625),Inches(1.)]
@@ -140,13 +226,7 @@ class QuizWriter():
         #
         # add the title
         #
-        #if(self.loose):
-        loose=False
-        for qd in quizData['stats']:
-            loose=loose or qd['loose']
-        if(loose):
-            title='%s (loose)'%title
-        document.add_heading(title, 0)
+        heading=document.add_heading(title, 0)
 
         #
         # add the message
@@ -189,26 +269,156 @@ class QuizWriter():
                 # bulleted list
                 for mitem in m['text']:
                     document.add_paragraph(mitem, style='List Bullet')
+        return document,width,heading
+
+    def _writeQuiz(self,document,width,qi,QZ,stats,quizType,qdist):
+        """write quiz qi (its table and stats) to the document"""
+        from docx.oxml.ns import nsdecls
+        from docx.oxml import parse_xml
+
+        chapList=sorted(QZ['CH'].unique())
+        logger.debug('chapters: %s',chapList)
+
+        if(qi>0):
+            document.add_page_break()
+        heading='Quiz %d'%(qi+1)
+        if(stats['loose']):
+            heading+=' (loose)'
+        document.add_heading(heading, 1)
+
+        table = document.add_table(rows=1, cols=4)
+        #table.style = 'LightShading-Accent1'
+        table.style = 'LightGrid-Accent1'
+        hdr_cells = table.rows[0].cells
+        hdr_cells[0].text = '#'
+        hdr_cells[1].text = 'Type'
+        hdr_cells[2].text = 'Question'
+        hdr_cells[3].text = 'Verse'
+        for k,cell in enumerate(hdr_cells):
+            cell.width=width[k]
 
         #
-        # loop through quizzes
+        # loop through questions
         #
-        for qi,QZ in enumerate(quizData['quizzes']):
+        ii=0
+        for idx,row in QZ.iterrows():
+            ii+=1
+            row_cells = table.add_row().cells
+
+            # Question Number
+            row_cells[0].text = row.qn
+            # Question Type
+            row_cells[1].text = row.TYPE
+
+            # https://stackoverflow.com/questions/36894424/creating-a-table-in-python-docx-and-bolding-text#36897305
+
+            #
+            # Question/Answer cell
+            #
+            c=row_cells[2]
+            q='Q: %s'%row.QUESTION
+            if('QKEYWORDS' in row):
+                keywords=row.QKEYWORDS.split(',')
+            else:
+                keywords=[]
+            self.boldText(cell=c, text=q, keywords=keywords)
+            c.add_paragraph()
 
-            chapList=sorted(QZ['CH'].unique())
-            logger.debug('chapters: %s'%str(chapList))
+            #
+            # ANSWER
+            #
+            a='A: %s'%row.ANSWER
+            if('AKEYWORDS' in row):
+                keywords=row.AKEYWORDS.split(',')
+            else:
+                keywords=[]
+            self.boldText(cell=c, text=a, keywords=keywords)
+
+            # book, chapter, verse, and club (e.g. 150,300)
+            txt='%s %s:%s'%(row.BK,row.CH,row.VS)
+            # if('VE' in row):
+            #     if(isinstance(row.VE,float)):
+            #         txt+='-%s'%str(int(row.VE))
+            if('2' in row.TYPE):
+                txt+='-%s'%str(int(row.VS)+1)
+            
+            txt+='\n('
+            #if(isinstance(row.CLUB,float)):
+            if(len(row.CLUB)):
+                #txt+='\n(%d)'%row.CLUB
+                txt+='%s,'%row.CLUB
+            if(row.SET is not None):
+                txt+='%s'%row.SET
+            txt+=')'
             
-            stats=quizData['stats'][qi]
+            # additional flags (repeats)
+            c=row_cells[3]
+            if('R' in row['FLAGS']):
+                txt+='\nrepeat'
+                c._tc.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="FFFF00"/>'.format(nsdecls('w'))))
+            c.text=txt
+
+            # adjust width
+            for k,cell in enumerate(row_cells):
+                cell.width=width[k]
 
-            if(qi>0):
-                document.add_page_break()
-            heading='Quiz %d'%(qi+1)
-            if(stats['loose']):
-                heading+=' (loose)'
-            document.add_heading(heading, 1)
+        #
+        # quiz stats
+        #
+        
+        if(quizType!='custom'):
+            #
+            # normal quiz
+            #
+            # -- min distribution
+            msg='Quiz distribution (<1-20 only>-<total w/AB>; not including overtime); ';first=1
+            # loop through all the types to show minimums
+            for qt,cnt in stats['min'].items():
+                msg+='%s:%d-%d ('%(qt.upper(),cnt,stats['max'][qt])
+                if(first):
+                    first=0;
+                    msg+='required: '
+                msg+='%d-%d), '%(qdist[qt]['range'][0],qdist[qt]['range'][1])
+            msg=msg[:-2]   # get rid of trailing space and comma at end
+            #
+            # -- period stats
+            #
+            msg+='; Question counts by period (numbered): '
+            for period,cnts in stats['period'].items():
+                msg+='%s=%d; '%(period,cnts[0])
+            msg=msg[:-2]
+        else:
+            # custom quiz
+            msg='Custom quiz distribution; '
+            #for qt,cnt in self._countTypes(QZ).items():
+            for qt,cnt in countTypes(QZ,qdist).items():
+                msg+=' %s(%d),'%(qt,cnt)
+            msg=msg[:-1]
+            print(msg)
+        #
+        # add stats to document
+        #
+        document.add_paragraph(msg)
 
+    def _writeExtras(self,document,width,qdist,extraQuestions):
+        """write the extra questions (question type, dataframe pairs) to 
+        the document"""
+        from docx.oxml.ns import nsdecls
+        from docx.oxml import parse_xml
+
+        document.add_page_break()
+        document.add_heading('Extra Questions', level=1)
+
+        msg="""This section contains extra questions of each type for use during the quiz day.
+            Make sure to mark the questions used as you use them.
+            """
+        p = document.add_paragraph(msg)
+
+        for qt,v in extraQuestions:
+            tlist=', '.join([x.upper() for x in qdist[qt]['types']])
+            document.add_heading('%s Extra Questions (%s)'%(qdist[qt]['label'],tlist), level=2)
+            
             table = document.add_table(rows=1, cols=4)
-            #table.style = 'LightShading-Accent1'
             table.style = 'LightGrid-Accent1'
             hdr_cells = table.rows[0].cells
             hdr_cells[0].text = '#'
@@ -217,24 +427,18 @@ class QuizWriter():
             hdr_cells[3].text = 'Verse'
             for k,cell in enumerate(hdr_cells):
                 cell.width=width[k]
-
-            #
-            # loop through questions
-            #
+                
             ii=0
-            for idx,row in QZ.iterrows():
+            for idx,row in v.iterrows():
                 ii+=1
                 row_cells = table.add_row().cells
-
-                # Question Number
-                row_cells[0].text = row.qn
-                # Question Type
+                row_cells[0].text = str(ii)
+                row_cells[0].width=width[0]
                 row_cells[1].text = row.TYPE
-
-                # https://stackoverflow.com/questions/36894424/creating-a-table-in-python-docx-and-bolding-text#36897305
+                #row_cells[2].text = 'Q: %s\n\nA: %s'%(row.QUESTION,row.ANSWER)
 
                 #
-                # Question/Answer cell
+                # QUESTION
                 #
                 c=row_cells[2]
                 q='Q: %s'%row.QUESTION
@@ -243,7 +447,9 @@ class QuizWriter():
                 else:
                     keywords=[]
                 self.boldText(cell=c, text=q, keywords=keywords)
+
                 c.add_paragraph()
+                #c.add_paragraph()
 
                 #
                 # ANSWER
@@ -255,160 +461,32 @@ class QuizWriter():
                     keywords=[]
                 self.boldText(cell=c, text=a, keywords=keywords)
 
-                # book, chapter, verse, and club (e.g. 150,300)
+                #
+                # VERSES
+                #
                 txt='%s %s:%s'%(row.BK,row.CH,row.VS)
-                # if('VE' in row):
-                #     if(isinstance(row.VE,float)):
-                #         txt+='-%s'%str(int(row.VE))
+                #if('VE' in row):
+                #    if(isinstance(row.VE,float)):
+                #        txt+='-%s'%str(int(row.VE))
                 if('2' in row.TYPE):
                     txt+='-%s'%str(int(row.VS)+1)
                 
-                txt+='\n('
                 #if(isinstance(row.CLUB,float)):
+                #    txt+='\n(%d)'%row.CLUB
                 if(len(row.CLUB)):
-                    #txt+='\n(%d)'%row.CLUB
-                    txt+='%s,'%row.CLUB
-                if(row.SET is not None):
-                    txt+='%s'%row.SET
-                txt+=')'
+                    txt+='\n(%s)'%row.CLUB
                 
-                # additional flags (repeats)
+                #if(not np.isnan(row.VE)):
+                #    txt+='-%s'%row.VE
+                #row_cells[3].text = txt
                 c=row_cells[3]
                 if('R' in row['FLAGS']):
                     txt+='\nrepeat'
                     c._tc.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="FFFF00"/>'.format(nsdecls('w'))))
-                c.text=txt
+                c.text = txt
 
-                # adjust width
                 for k,cell in enumerate(row_cells):
                     cell.width=width[k]
 
-            #
-            # quiz stats
-            #
-            
-            qdist=quizData['distribution']
-            if(quizData['type']!='custom'):
-                #
-                # normal quiz
-                #
-                # -- min distribution
-                msg='Quiz distribution (<1-20 only>-<total w/AB>; not including overtime); ';first=1
-                # loop through all the types to show minimums
-                for qt,cnt in stats['min'].items():
-                    msg+='%s:%d-%d ('%(qt.upper(),cnt,stats['max'][qt])
-                    if(first):
-                        first=0;
-                        msg+='required: '
-                    msg+='%d-%d), '%(qdist[qt]['range'][0],qdist[qt]['range'][1])
-                msg=msg[:-2]   # get rid of trailing space and comma at end
-                #
-                # -- period stats
-                #
-                msg+='; Question counts by period (numbered): '
-                for period,cnts in stats['period'].items():
-                    msg+='%s=%d; '%(period,cnts[0])
-                msg=msg[:-2]
-            else:
-                # custom quiz
-                msg='Custom quiz distribution; '
-                #for qt,cnt in self._countTypes(QZ).items():
-                for qt,cnt in countTypes(QZ,qdist).items():
-                    msg+=' %s(%d),'%(qt,cnt)
-                msg=msg[:-1]
-                print(msg)
-            #
-            # add stats to document
-            #
-            document.add_paragraph(msg)
-        
-        #
-        # extra question
-        #
-        if(quizData['type']!='custom'):
-            document.add_page_break()
-            document.add_heading('Extra Questions', level=1)
-
-            msg="""This section contains extra questions of each type for use during the quiz day.
-            Make sure to mark the questions used as you use them.
-            """
-            p = document.add_paragraph(msg)
-
-            for qt,v in quizData['extraQuestions'].items():
-                tlist=', '.join([x.upper() for x in quizData['distribution'][qt]['types']])
-                document.add_heading('%s Extra Questions (%s)'%(quizData['distribution'][qt]['label'],tlist), level=2)
-                
-                table = document.add_table(rows=1, cols=4)
-                table.style = 'LightGrid-Accent1'
-                hdr_cells = table.rows[0].cells
-                hdr_cells[0].text = '#'
-                hdr_cells[1].text = 'Type'
-                hdr_cells[2].text = 'Question'
-                hdr_cells[3].text = 'Verse'
-                for k,cell in enumerate(hdr_cells):
-                    cell.width=width[k]
-                    
-                ii=0
-                for idx,row in quizData['extraQuestions'][qt].iterrows():
-                    ii+=1
-                    row_cells = table.add_row().cells
-                    row_cells[0].text = str(ii)
-                    row_cells[0].width=width[0]
-                    row_cells[1].text = row.TYPE
-                    #row_cells[2].text = 'Q: %s\n\nA: %s'%(row.QUESTION,row.ANSWER)
-
-                    #
-                    # QUESTION
-                    #
-                    c=row_cells[2]
-                    q='Q: %s'%row.QUESTION
-                    if('QKEYWORDS' in row):
-                        keywords=row.QKEYWORDS.split(',')
-                    else:
-                        keywords=[]
-                    self.boldText(cell=c, text=q, keywords=keywords)
-
-                    c.add_paragraph()
-                    #c.add_paragraph()
-
-                    #
-                    # ANSWER
-                    #
-                    a='A: %s'%row.ANSWER
-                    if('AKEYWORDS' in row):
-                        keywords=row.AKEYWORDS.split(',')
-                    else:
-                        keywords=[]
-                    self.boldText(cell=c, text=a, keywords=keywords)
-
-                    #
-                    # VERSES
-                    #
-                    txt='%s %s:%s'%(row.BK,row.CH,row.VS)
-                    #if('VE' in row):
-                    #    if(isinstance(row.VE,float)):
-                    #        txt+='-%s'%str(int(row.VE))
-                    if('2' in row.TYPE):
-                        txt+='-%s'%str(int(row.VS)+1)
-                    
-                    #if(isinstance(row.CLUB,float)):
-                    #    txt+='\n(%d)'%row.CLUB
-                    if(len(row.CLUB)):
-                        txt+='\n(%s)'%row.CLUB
-                    
-                    #if(not np.isnan(row.VE)):
-                    #    txt+='-%s'%row.VE
-                    #row_cells[3].text = txt
-                    c=row_cells[3]
-                    if('R' in row['FLAGS']):
-                        txt+='\nrepeat'
-                        c._tc.get_or_add_tcPr().append(parse_xml(r'<w:shd {} w:fill="FFFF00"/>'.format(nsdecls('w'))))
-                    c.text = txt
-
-                    for k,cell in enumerate(row_cells):
-                        cell.width=width[k]
-
-        document.save(fn)
-        print('Done writing quiz packet (%s)'%fn)
 
         
\ No newline at end of file
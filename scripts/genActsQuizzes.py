@@ -7,6 +7,7 @@ import numpy as np
 np.random.seed(1)
 np.random.seed(2132021)
 importlib.reload(quizGenerator)
+quizGenerator.configureLogging(logfile='quiz_generator.log')
 
 QDAT={'AAC':{'date':'2022xxxx','datestr':'x/x/2022',
              'prefix':r'quizzes/2022/AAC/AAC',
@@ -88,10 +89,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,300)
-QG.quizDistribution['ft']['limit']=(150,300)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=4,xtra=10)   
 
@@ -107,14 +106,7 @@ QW.save(fn,qdat,title=ttl,msg=msg)
 bk='Acts'
 vs='1:1-3:15,4:6-10:10'
 #vs='1:1-3:15'
-ivs=vs.split(',')
-c=[]
-for iv in ivs:
-    cv1,cv2=iv.split('-')
-    c1,v1=cv1.split(':')
-    c2,v2=cv2.split(':')
-    ci=((bk,c1,v1),(bk,c2,v2))
-    c.append(ci)
+c=quizGenerator.parseReference(vs,book=bk)
     
 
 
@@ -130,10 +122,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,)
-QG.quizDistribution['ft']['limit']=(150,)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=4,xtra=10)   
 
@@ -156,10 +146,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-#QG.quizDistribution['q']['limit']=(150,300)
-#QG.quizDistribution['ft']['limit']=(150,300)
-for k in ['q','ft','int','cr','ma','sit']:
-    QG.quizDistribution[k]['set']=('Local','District')
+#QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override(['q','ft','int','cr','ma','sit'],set=('Local','District'))
     
 qdat=QG.generateQuizTables(nquiz=20,xtra=100)   
 
@@ -183,10 +171,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,300)
-QG.quizDistribution['ft']['limit']=(150,300)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local','District')
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local','District'))
     
 qdat=QG.generateQuizTables(nquiz=7,xtra=20)   
 
@@ -210,10 +196,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,)
-QG.quizDistribution['ft']['limit']=(150,)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local','District')
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local','District'))
     
 qdat=QG.generateQuizTables(nquiz=6,xtra=20)   
 #qdat=QG.generateQuizTables(nquiz=2,xtra=2)
@@ -239,10 +223,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,300)
-QG.quizDistribution['ft']['limit']=(150,300)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=4,xtra=10)   
 
@@ -269,10 +251,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,300)
-QG.quizDistribution['ft']['limit']=(150,300)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=1,xtra=10)   
 
@@ -294,10 +274,8 @@ QG.quizMakeup={'past':{'frac':0.5,'content':past},
             }
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,)
-QG.quizDistribution['ft']['limit']=(150,)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=4,xtra=10)   
 
@@ -326,10 +304,8 @@ QG.quizDistribution={'int':{'range':(8,16),'types':('int',),'label':'Interrogati
             'ma':{'range':(2,3),'types':('ma',),'label':'Multiple Answer'}}
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,300)
-QG.quizDistribution['ft']['limit']=(150,300)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=10,xtra=25)   
 
@@ -375,10 +351,8 @@ QG.quizDistribution={'int':{'range':(8,16),'types':('int',),'label':'Interrogati
             'ma':{'range':(2,3),'types':('ma',),'label':'Multiple Answer'}}
 
 # add custom limits for certain question types
-QG.quizDistribution['q']['limit']=(150,)
-QG.quizDistribution['ft']['limit']=(150,)
-for k in QG.quizDistribution.keys():
-    QG.quizDistribution[k]['set']=('Local',)
+QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,))
+QG.quizDistribution=QG.quizDistribution.override('*',set=('Local',))
     
 qdat=QG.generateQuizTables(nquiz=10,xtra=25)   
 
@@ -0,0 +1,80 @@
+"""Behaviour checks of the packet solver on a synthetic database.
+
+    python -m pytest tests
+"""
+import unittest
+
+import quizGenerator
+import packetSolver
+from benchmarks.synthDatabase import makeDatabase, contentRange
+from test_quizGenerator import newGenerator
+
+class PacketSolverTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df=makeDatabase(3000,seed=1)
+
+    def solve(self,makeup,nquiz,seed,limit=False):
+        QG=newGenerator(self.df,'B1 1')
+        QG.quizMakeup={period:{'frac':frac,'content':[content]} for period,(frac,content) in makeup.items()}
+        if(limit):
+            QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+        QG.solver='packet'
+        qd=QG.generateQuizTables(nquiz=nquiz,xtra=0,seed=seed)
+        return QG,qd
+
+    def checkPacket(self,QG,qd):
+        """the packet meets the distribution, keeps verses distinct within
+        each quiz and reports its repeats against the lower bound"""
+        dist=QG.quizDistribution
+        for dfq,st in zip(qd['quizzes'],qd['stats']):
+            self.assertEqual(len(dfq),33)
+            self.assertFalse(dfq['VID'].duplicated().any())
+            for k,rule in dist.items():
+                lo,hi=rule['range']
+                self.assertGreaterEqual(st['min'][k],lo)
+                self.assertLessEqual(st['max'][k],hi)
+        r=QG.solverReport
+        flagged=sum(int(dfq['FLAGS'].str.contains('R').sum()) for dfq in qd['quizzes'])
+        self.assertEqual(r['repeats'],flagged)
+        self.assertEqual(sum(r['perQuiz']),r['repeats'])
+        self.assertGreaterEqual(r['repeats'],r['lowerBound'])
+        self.assertEqual(r['optimal'],r['repeats']==r['lowerBound'])
+        return r
+
+    def testEnoughContent(self):
+        QG,qd=self.solve({'current':(1,contentRange(self.df))},10,seed=0)
+        r=self.checkPacket(QG,qd)
+        self.assertEqual(r['repeats'],0)
+        self.assertTrue(r['optimal'])
+
+    def testRepeats(self):
+        # one small period: repeats are forced, and the solver meets the
+        # bound
+        for seed in range(3):
+            QG,qd=self.solve({'current':(1,'B1 1-B1 6')},20,seed=seed)
+            r=self.checkPacket(QG,qd)
+            self.assertGreater(r['lowerBound'],0)
+            self.assertTrue(r['optimal'])
+
+    def testTwoPeriods(self):
+        for limit in (False,True):
+            QG,qd=self.solve({'current':(0.5,'B2 1-B2 3'),'past':(0.5,'B1 1-B1 10')},20,seed=0,limit=limit)
+            self.checkPacket(QG,qd)
+
+    def testLowerBound(self):
+        # the bound of a packet doesn't depend on how it was assigned
+        QG,qd=self.solve({'current':(1,'B1 1-B1 4')},30,seed=0)
+        r=self.checkPacket(QG,qd)
+        sizes=QG._blockSizes()['current']
+        units=[[(0,0,0)]*sizes[0]+[(1,0,0)]*sizes[1]+[(2,0,0)]*3]*30
+        self.assertEqual(packetSolver.lowerBound(QG,30,units),r['lowerBound'])
+
+    def testVerseConflict(self):
+        # too few verses for the q and ft limits: no slot takes a question
+        # sharing a verse with its quiz
+        with self.assertRaises(quizGenerator.QuizGenerationError):
+            self.solve({'current':(0.5,'B2 1-B2 2'),'past':(0.5,'B1 1-B1 3')},30,seed=0,limit=True)
+
+if(__name__=='__main__'):
+    unittest.main()
@@ -0,0 +1,237 @@
+"""Behaviour checks of the quiz generator on a synthetic database.
+
+    python -m pytest tests
+"""
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+
+import pandas as pd
+
+import quizGenerator
+from benchmarks.synthDatabase import makeDatabase, contentRange
+
+def newGenerator(df,content,engine='pandas'):
+    """generator over a prepared synthetic database, with content as
+    its one period"""
+    QG=quizGenerator.QuizGenerator(quizType='epistle')
+    QG.setDatabase(quizGenerator._prepareDatabase(df.copy()))
+    QG.quizMakeup={'current':{'frac':1,'content':[content]}}
+    QG.engine=engine
+    return QG
+
+class QuizGeneratorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df=makeDatabase(3000,seed=1)
+        cls.content=contentRange(cls.df)
+
+    def testVerbose(self):
+        for engine in ('pandas','array'):
+            QG=newGenerator(self.df,self.content,engine=engine)
+            QG.verbose=True
+            with contextlib.redirect_stdout(io.StringIO()):
+                qd=QG.generateQuizTables(nquiz=2,xtra=2,seed=1)
+            self.assertEqual(len(qd['quizzes']),2)
+            self.assertEqual(len(qd['quizzes'][0]),33)
+
+    def testOvertimeExclusion(self):
+        # overtime questions avoid the quiz's verses and the packet's
+        # used questions, like the rest of the quiz
+        for engine in ('pandas','array'):
+            QG=newGenerator(self.df,self.content,engine=engine)
+            qd=QG.generateQuizTables(nquiz=10,xtra=0,seed=2)
+            seen=set()
+            for dfq in qd['quizzes']:
+                self.assertFalse(dfq['VID'].duplicated().any())
+                overtime=dfq[dfq['qn'].isin(quizGenerator.OVERTIME_LABELS)]
+                self.assertEqual(len(overtime),3)
+                for idx,flags in zip(overtime.index,overtime['FLAGS']):
+                    if('R' not in flags):
+                        self.assertNotIn(idx,seen)
+                seen.update(dfq.index)
+
+class DistributionTest(unittest.TestCase):
+    def testOverride(self):
+        base=quizGenerator.DIST_EPISTLE
+        dist=base.override(['q','ft'],limit=(150,300))
+        self.assertEqual(dist['q']['limit'],('150','300'))
+        self.assertEqual(dist['ft']['limit'],('150','300'))
+        self.assertNotIn('limit',dist['int'])
+        # the shared default is untouched
+        self.assertNotIn('limit',base['q'])
+        # a field given as None is removed; '*' is every category
+        self.assertNotIn('limit',dist.override('q',limit=None)['q'])
+        self.assertEqual(dist['ft']['limit'],('150','300'))
+        every=base.override('*',set=('Local',))
+        self.assertTrue(all(rule['set']==('Local',) for rule in every.values()))
+        with self.assertRaises(KeyError):
+            base.override('xyz',limit=(150,))
+
+    def testImmutable(self):
+        dist=quizGenerator.DIST_EPISTLE
+        with self.assertRaises(TypeError):
+            dist['q']=dist['ft']
+        with self.assertRaises(TypeError):
+            dist['q']['range']=(1,2)
+        with self.assertRaises(TypeError):
+            del dist['q']
+
+    def testShared(self):
+        # equal distributions hash alike and share their compiled arrays
+        a=quizGenerator.DIST_EPISTLE.override('q',limit=(150,))
+        b=quizGenerator.Distribution(quizGenerator.DIST_EPISTLE.asDict()).override('q',limit=(150,))
+        self.assertEqual(a,b)
+        self.assertEqual(hash(a),hash(b))
+        self.assertIs(a.compiled(),b.compiled())
+        self.assertNotEqual(a,quizGenerator.DIST_EPISTLE)
+        QG=quizGenerator.QuizGenerator()
+        QG.quizDistribution=a.asDict()
+        self.assertIsInstance(QG.quizDistribution,quizGenerator.Distribution)
+        self.assertEqual(QG.quizDistribution,a)
+
+    def testContentLimit(self):
+        # an override rebuilds the content with its limits
+        df=makeDatabase(3000,seed=1)
+        QG=newGenerator(df,contentRange(df))
+        QG.generateQuizTables(nquiz=1,xtra=0,seed=0)
+        n=len(QG.contentPools['current']['pools']['q'])
+        QG.quizDistribution=QG.quizDistribution.override(['q','ft'],limit=(150,300))
+        qd=QG.generateQuizTables(nquiz=2,xtra=0,seed=0)
+        cp=QG.contentPools['current']
+        for k in ('q','ft'):
+            club=QG.database['CLUB'].values[cp['rows'][cp['pools'][k]]]
+            self.assertTrue(set(club)<={'150','300'})
+        self.assertLess(len(cp['pools']['q']),n)
+        for dfq in qd['quizzes']:
+            limited=dfq[dfq['QCAT'].isin([QG._qcode('q'),QG._qcode('ft')])]
+            self.assertTrue(set(limited['CLUB'])<={'150','300'})
+
+class ReferenceTest(unittest.TestCase):
+    def testParse(self):
+        parse=quizGenerator.parseReference
+        last=quizGenerator.LAST_VERSE
+        self.assertEqual(parse('1:1-3:15,4:6-10:10',book='Acts'),
+                         [(('Acts',1,1),('Acts',3,15)),(('Acts',4,6),('Acts',10,10))])
+        self.assertEqual(parse('1P 5:1-2P 1:10'),[(('1P',5,1),('2P',1,10))])
+        # chapters, verses of one chapter, and the book carried over
+        self.assertEqual(parse('B1 3-4, 5:2-9, 7'),
+                         [(('B1',3,1),('B1',4,last)),(('B1',5,2),('B1',5,9)),(('B1',7,1),('B1',7,last))])
+        self.assertEqual(parse('B1 2:30-B2 1'),[(('B1',2,30),('B2',1,last))])
+        with self.assertRaises(ValueError):
+            parse('1:1-2:2')
+        with self.assertRaises(ValueError):
+            parse('B1 1-2-3')
+
+    def testSelect(self):
+        df=quizGenerator._prepareDatabase(makeDatabase(3000,seed=1))
+        index=quizGenerator.VerseIndex(df)
+        key=list(zip(df['BK'].map({'B1':1,'B2':2}),df['CH'],df['VS']))
+        for start,end in [(('B1',2,5),('B1',4,3)),
+                          (('B1',19,3),('B2',2,4)),
+                          (('B2',3,1),('B2',3,quizGenerator.LAST_VERSE))]:
+            lo=({'B1':1,'B2':2}[start[0]],)+start[1:]
+            hi=({'B1':1,'B2':2}[end[0]],)+end[1:]
+            expected=[i for i,k in enumerate(key) if lo<=k<=hi]
+            self.assertGreater(len(expected),0)
+            self.assertEqual(index.select(start,end).tolist(),expected)
+        self.assertEqual(len(index.select(('B3',1,1),('B3',2,1))),0)
+
+    def testContent(self):
+        # reference strings select the same content as intervals
+        df=makeDatabase(3000,seed=1)
+        QG1=newGenerator(df,'B1 19:3-B2 2:4, 5')
+        QG2=newGenerator(df,(('B1',19,3),('B2',2,4)))
+        QG2.quizMakeup['current']['content'].append((('B2',5,1),('B2',5,quizGenerator.LAST_VERSE)))
+        QG1._getContent();QG2._getContent()
+        cp1=QG1.contentPools['current'];cp2=QG2.contentPools['current']
+        self.assertEqual(cp1['rows'].tolist(),cp2['rows'].tolist())
+        for k in QG1.quizDistribution:
+            self.assertEqual(cp1['pools'][k].tolist(),cp2['pools'][k].tolist())
+        chapters=set(zip(QG1.database['BK'].values[cp1['rows']],QG1.database['CH'].values[cp1['rows']]))
+        self.assertEqual(chapters,{('B1',19),('B1',20),('B2',1),('B2',2),('B2',5)})
+
+class ReplaceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df=makeDatabase(3000,seed=1)
+
+    def replaceAll(self,QG,qi):
+        """replace every question of quiz qi; returns the old quiz and the
+        replacements"""
+        old=QG.quizzes[qi]
+        new=[QG.replace(qi,qn) for qn in old['qn']]
+        QG.applyReplacements()
+        dfq=QG.quizzes[qi]
+        self.assertEqual(list(dfq['qn']),list(old['qn']))
+        self.assertEqual(list(dfq['INDEX']),[q['INDEX'] for q in new])
+        self.assertEqual(list(dfq['QCAT']),list(old['QCAT']))
+        # no two questions of the quiz share a verse
+        self.assertFalse(dfq['VID'].duplicated().any())
+        return old,new
+
+    def testFresh(self):
+        QG=newGenerator(self.df,contentRange(self.df))
+        qd=QG.generateQuizTables(nquiz=3,xtra=0,seed=0)
+        packet=set(pd.concat(qd['quizzes'])['INDEX'])
+        old,new=self.replaceAll(QG,1)
+        for q in new:
+            self.assertFalse(q['repeat'])
+            self.assertNotIn('R',q['FLAGS'])
+            # unused anywhere in the packet (or by an earlier replacement)
+            self.assertNotIn(q['INDEX'],packet)
+            packet.add(q['INDEX'])
+        self.assertTrue(QG._used[QG.database.index.get_indexer(QG.quizzes[1].index)].all())
+
+    def testRepeats(self):
+        # every question of the content is in the packet, so replacements
+        # are flagged repeats from outside the quiz
+        QG=newGenerator(self.df,'B1 1-B1 4')
+        QG.generateQuizTables(nquiz=30,xtra=0,seed=0)
+        self.assertTrue(QG._used[QG.contentPools['current']['rows']].all())
+        old,new=self.replaceAll(QG,0)
+        for q in new:
+            self.assertTrue(q['repeat'])
+            self.assertIn('R',q['FLAGS'])
+        self.assertFalse(set(old['INDEX'])&set(q['INDEX'] for q in new))
+        self.assertTrue(QG.quizzes[0]['FLAGS'].str.contains('R').all())
+
+class DatabaseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.TemporaryDirectory()
+        self.fn=os.path.join(self.tmp.name,'synth.xlsx')
+        makeDatabase(2000,seed=1).to_excel(self.fn,index=False)
+        self.cachedir=os.path.join(self.tmp.name,'cache')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self,**kwargs):
+        QG=quizGenerator.QuizGenerator()
+        QG.loadDatabase(self.fn,cachedir=self.cachedir,**kwargs)
+        return QG
+
+    def testCacheHit(self):
+        cold=self.load(cache=False)
+        self.assertFalse(os.path.exists(self.cachedir))
+        first=self.load()
+        self.assertEqual(len(os.listdir(self.cachedir)),1)
+        # a warm load doesn't read the spreadsheet
+        with mock.patch.object(quizGenerator.pd,'read_excel',side_effect=AssertionError('cache miss')):
+            warm=self.load()
+        for QG in (first,warm):
+            pd.testing.assert_frame_equal(QG.database,cold.database)
+            self.assertEqual(QG.databaseFingerprint,cold.databaseFingerprint)
+
+    def testCacheRebuilt(self):
+        self.load()
+        makeDatabase(1000,seed=2).to_excel(self.fn,index=False)
+        QG=self.load()
+        self.assertEqual(len(QG.database),1000)
+        self.assertEqual(len(os.listdir(self.cachedir)),1)
+
+if(__name__=='__main__'):
+    unittest.main()
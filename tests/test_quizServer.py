@@ -0,0 +1,107 @@
+"""Localhost tests of the quiz generation service: a full queue (503),
+timeouts (504) that free the worker, and /metrics.
+
+    python -m pytest tests
+"""
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+
+import quizServer
+from benchmarks.synthDatabase import makeDatabase, contentRange
+
+class QuizServerTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp=tempfile.TemporaryDirectory()
+        df=makeDatabase(3000,seed=1)
+        cls.fn=os.path.join(cls.tmp.name,'synth.xlsx')
+        df.to_excel(cls.fn,index=False)
+        cls.content=contentRange(df)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    async def asyncSetUp(self):
+        self.server=quizServer.QuizServer({'synth':self.fn},workers=0,maxQueue=2,timeout=60.)
+        await self.server.start(port=0)
+        self.host,self.port=self.server.address
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def packet(self,**kwargs):
+        req={'database':'synth','content':{'current':[self.content]},'format':'json','seed':1}
+        req.update(kwargs)
+        return req
+
+    async def request(self,method,path,payload=None):
+        return await quizServer.request(method,path,payload,host=self.host,port=self.port)
+
+    async def metrics(self):
+        status,headers,body=await self.request('GET','/metrics')
+        self.assertEqual(status,200)
+        return json.loads(body)
+
+    async def waitIdle(self,timeout=10.):
+        """metrics once nothing is queued or running"""
+        for ii in range(int(timeout/0.05)):
+            m=await self.metrics()
+            if(m['queued']==0 and m['running']==0):
+                return m
+            await asyncio.sleep(0.05)
+        self.fail('the server is still busy after %.0fs: %s'%(timeout,m))
+
+    async def testMetrics(self):
+        status,headers,body=await self.request('POST','/generate',self.packet(nquiz=2))
+        self.assertEqual(status,200)
+        self.assertEqual(len(json.loads(body)['quizzes']),2)
+        m=await self.metrics()
+        self.assertEqual(m['counts']['200'],1)
+        self.assertEqual(m['counts']['requests'],1)
+        self.assertEqual(m['maxQueue'],2)
+        for key in ('queue','setup','generate','write','total'):
+            self.assertEqual(m['latency'][key]['count'],1)
+            self.assertGreaterEqual(m['latency'][key]['p99'],m['latency'][key]['p50'])
+
+    async def testQueueFull(self):
+        # one request running and two queued; the rest are turned away
+        reqs=[self.request('POST','/generate',self.packet(nquiz=4,seed=ii)) for ii in range(6)]
+        results=await asyncio.gather(*reqs)
+        statuses=sorted(status for status,headers,body in results)
+        self.assertIn(503,statuses)
+        self.assertEqual(set(statuses),{200,503})
+        for status,headers,body in results:
+            if(status==503):
+                self.assertEqual(headers['retry-after'],'1')
+                self.assertIn('queue is full',json.loads(body)['error'])
+        m=await self.waitIdle()
+        self.assertEqual(m['counts']['rejected'],statuses.count(503))
+
+    async def testTimeoutFreesWorker(self):
+        t=time.perf_counter()
+        status,headers,body=await self.request('POST','/generate',self.packet(nquiz=20))
+        self.assertEqual(status,200)
+        full=time.perf_counter()-t
+        # a burst of requests that can't finish in time
+        t=time.perf_counter()
+        reqs=[self.request('POST','/generate',self.packet(nquiz=20,timeout=0.05,seed=ii)) for ii in range(5)]
+        results=await asyncio.gather(*reqs)
+        statuses=[status for status,headers,body in results]
+        self.assertIn(504,statuses)
+        self.assertTrue(set(statuses)<={503,504})
+        # the running job stops at its deadline, so the queue drains
+        # long before a packet could have been generated
+        m=await self.waitIdle()
+        self.assertLess(time.perf_counter()-t,full/2)
+        self.assertEqual(m['counts']['timeouts'],statuses.count(504))
+        self.assertGreaterEqual(m['counts'].get('abandoned',0),1)
+        status,headers,body=await self.request('POST','/generate',self.packet(nquiz=1))
+        self.assertEqual(status,200)
+
+if(__name__=='__main__'):
+    unittest.main()